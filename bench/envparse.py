@@ -0,0 +1,106 @@
+"""Throughput and memory benchmark for the dotenv tokenizer.
+
+Generates env files of increasing size (a mix of unquoted, single-quoted,
+escaped double-quoted and multiline values, comments and ``export``
+prefixes), streams each through ``kkcli.envparse.iter_env_file`` and reports
+MB/s and peak traced memory. Time per MB should stay flat as files grow
+(linear-time) and, without ``--interpolate``, peak memory should not grow
+with file size (the tokenizer holds one entry at a time). ``--max-ratio``
+fails when the slowest size's time per MB exceeds the fastest's by more
+than the given factor.
+
+    python bench/envparse.py
+    python bench/envparse.py --sizes 1 4 16 --interpolate --json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from kkcli.envparse import iter_env_file  # noqa: E402
+
+_ENTRIES = [
+    "export API_KEY_{i}=k{i}abcdefghijklmnopqrstuvwxyz0123456789\n",
+    "PLAIN_{i}=value-{i} # trailing comment\n",
+    "SINGLE_{i}='literal ${{NOT_EXPANDED}} \\n {i}'\n",
+    'DOUBLE_{i}="line1\\nline2\\t\\"quoted\\" ${{API_KEY_{i}}} {i}"\n',
+    '# comment line {i}\n',
+    'PEM_{i}="-----BEGIN KEY-----\nMIIB{i}AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA\n-----END KEY-----"\n',
+    "\n",
+]
+
+
+def generate(path: Path, megabytes: float) -> int:
+    """Write roughly ``megabytes`` MB of env entries; returns the byte size."""
+    target = int(megabytes * 1024 * 1024)
+    size = 0
+    i = 0
+    with path.open("w") as f:
+        while size < target:
+            for tmpl in _ENTRIES:
+                line = tmpl.format(i=i)
+                f.write(line)
+                size += len(line)
+            i += 1
+    return path.stat().st_size
+
+
+def measure(path: Path, interpolate: bool, runs: int) -> Dict[str, float]:
+    best = float("inf")
+    entries = 0
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        entries = sum(1 for _ in iter_env_file(path, interpolate))
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    for _ in iter_env_file(path, interpolate):
+        pass
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mb = path.stat().st_size / (1024 * 1024)
+    return {"mb": round(mb, 2), "entries": entries, "seconds": round(best, 4),
+            "mb_per_s": round(mb / best, 1), "s_per_mb": best / mb, "peak_kb": round(peak / 1024, 1)}
+
+
+def main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", nargs="+", type=float, default=[1, 2, 4, 8], help="File sizes in MB")
+    ap.add_argument("--runs", type=int, default=3, help="Timed runs per size (best is reported)")
+    ap.add_argument("--interpolate", action="store_true", help="Enable ${VAR} expansion")
+    ap.add_argument("--json", action="store_true", help="Print results as JSON")
+    ap.add_argument("--max-ratio", type=float, default=None, help="Fail if s/MB varies by more than this factor")
+    args = ap.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="kk-envbench-") as tmp:
+        for mb in args.sizes:
+            path = Path(tmp) / f".bench{mb:g}.env"
+            generate(path, mb)
+            results.append(measure(path, args.interpolate, max(1, args.runs)))
+            os.unlink(path)
+
+    per_mb = [r["s_per_mb"] for r in results]
+    ratio = max(per_mb) / min(per_mb)
+    if args.json:
+        print(json.dumps({"results": results, "ratio": round(ratio, 2)}, indent=2))
+    else:
+        print(f"{'MB':>6} {'entries':>9} {'seconds':>9} {'MB/s':>7} {'peak KB':>9}")
+        for r in results:
+            print(f"{r['mb']:>6} {r['entries']:>9} {r['seconds']:>9} {r['mb_per_s']:>7} {r['peak_kb']:>9}")
+        print(f"time/MB ratio (slowest/fastest): {ratio:.2f}")
+    if args.max_ratio is not None and ratio > args.max_ratio:
+        print(f"FAIL: ratio {ratio:.2f} > {args.max_ratio}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,469 @@
+"""In-memory fake of the org.freedesktop.secrets service.
+
+Speaks enough of the Secret Service API for kk (and secretstorage) to run
+against a private session bus: collections, aliases, items, SearchItems,
+GetSecrets, Lock/Unlock with auto-accepted prompts, plain and DH sessions,
+and the ItemCreated/ItemChanged/ItemDeleted signals.
+
+Replies can be delayed by a fixed per-call latency (``--latency``) to model
+a slow keyring. Delays are scheduled, not slept, so pipelined calls overlap
+the way they would against a real daemon. Call counts per method are
+exposed on ``io.github.kktool.FakeSecretService`` (``Stats``/``ResetStats``).
+
+Normally started by ``bench/fakebus.py``, which also runs the private bus.
+"""
+import argparse
+import heapq
+import hmac
+import itertools
+import os
+import sys
+import time
+from hashlib import sha256
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from jeepney import DBusAddress, HeaderFields, MessageType, new_error, new_method_return, new_signal
+from jeepney.bus_messages import message_bus
+from jeepney.io.blocking import open_dbus_connection
+
+BUS_NAME = "org.freedesktop.secrets"
+SS_PATH = "/org/freedesktop/secrets"
+PREFIX = "org.freedesktop.Secret."
+PROPS_IFACE = "org.freedesktop.DBus.Properties"
+FAKE_IFACE = "io.github.kktool.FakeSecretService"
+ALIAS_PREFIX = SS_PATH + "/aliases/"
+COLL_PREFIX = SS_PATH + "/collection/"
+
+DH_PRIME_1024 = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA63B139B22514A"
+    "08798E3404DDEF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245E485B576625E7EC6F44C42E9"
+    "A637ED6B0BFF5CB6F406B7EDEE386BFB5A899FA5AE9F24117C4B1FE649286651ECE65381FFFFFFFFFFFFFFFF",
+    16,
+)
+
+
+class DBusError(Exception):
+    def __init__(self, name: str, text: str = ""):
+        super().__init__(text)
+        self.name = name
+        self.text = text
+
+
+def _no_such_object(path: str) -> DBusError:
+    return DBusError(PREFIX + "Error.NoSuchObject", f"No such object: {path}")
+
+
+class Session:
+    def __init__(self, path: str, aes_key: Optional[bytes]):
+        self.path = path
+        self.aes_key = aes_key
+
+    def encode(self, secret: bytes, content_type: str) -> tuple:
+        if self.aes_key is None:
+            return (self.path, b"", secret, content_type)
+        padder = padding.PKCS7(128).padder()
+        data = padder.update(secret) + padder.finalize()
+        iv = os.urandom(16)
+        enc = Cipher(algorithms.AES(self.aes_key), modes.CBC(iv)).encryptor()
+        return (self.path, iv, enc.update(data) + enc.finalize(), content_type)
+
+    def decode(self, params: bytes, value: bytes) -> bytes:
+        if self.aes_key is None:
+            return bytes(value)
+        dec = Cipher(algorithms.AES(self.aes_key), modes.CBC(bytes(params))).decryptor()
+        data = dec.update(bytes(value)) + dec.finalize()
+        unpadder = padding.PKCS7(128).unpadder()
+        return unpadder.update(data) + unpadder.finalize()
+
+
+class Item:
+    def __init__(self, path: str, collection: "Collection", label: str, attrs: Dict[str, str], secret: bytes, content_type: str):
+        self.path = path
+        self.collection = collection
+        self.label = label
+        self.attrs = dict(attrs)
+        self.secret = secret
+        self.content_type = content_type
+        self.created = self.modified = int(time.time())
+
+    @property
+    def locked(self) -> bool:
+        return self.collection.locked
+
+
+class Collection:
+    def __init__(self, path: str, label: str):
+        self.path = path
+        self.label = label
+        self.locked = False
+        self.items: Dict[str, Item] = {}
+        self.created = self.modified = int(time.time())
+        self._ids = itertools.count(1)
+
+    def next_item_path(self) -> str:
+        return f"{self.path}/{next(self._ids)}"
+
+
+class FakeSecretService:
+    def __init__(self, conn, latency: float = 0.0):
+        self.conn = conn
+        self.latency = latency
+        self.collections: Dict[str, Collection] = {}
+        self.aliases: Dict[str, str] = {}
+        self.sessions: Dict[str, Session] = {}
+        self.prompts: Dict[str, tuple] = {}
+        self.calls: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._pending: List[Tuple[float, int, object]] = []
+        default = self.create_collection("Login", "default")
+        self.aliases["login"] = default.path
+
+    # -- object model -----------------------------------------------------
+    def create_collection(self, label: str, alias: str = "") -> Collection:
+        path = f"{COLL_PREFIX}c{next(self._ids)}"
+        coll = Collection(path, label)
+        self.collections[path] = coll
+        if alias:
+            self.aliases[alias] = path
+        return coll
+
+    def resolve_collection(self, path: str) -> Collection:
+        if path.startswith(ALIAS_PREFIX):
+            path = self.aliases.get(path[len(ALIAS_PREFIX):], "")
+        coll = self.collections.get(path)
+        if coll is None:
+            raise _no_such_object(path)
+        return coll
+
+    def resolve_item(self, path: str) -> Item:
+        coll_path = path.rsplit("/", 1)[0]
+        if coll_path.startswith(ALIAS_PREFIX):
+            coll = self.resolve_collection(coll_path)
+            path = coll.path + "/" + path.rsplit("/", 1)[1]
+        else:
+            coll = self.collections.get(coll_path)
+        if coll is None or path not in coll.items:
+            raise _no_such_object(path)
+        return coll.items[path]
+
+    def add_item(self, coll: Collection, label: str, attrs: Dict[str, str], secret: bytes,
+                 content_type: str = "text/plain", replace: bool = False, emit: bool = True) -> Item:
+        if replace:
+            for it in coll.items.values():
+                if it.attrs == attrs:
+                    it.label, it.secret, it.content_type = label, secret, content_type
+                    it.modified = int(time.time())
+                    if emit:
+                        self.emit(coll.path, "ItemChanged", it.path)
+                    return it
+        it = Item(coll.next_item_path(), coll, label, attrs, secret, content_type)
+        coll.items[it.path] = it
+        if emit:
+            self.emit(coll.path, "ItemCreated", it.path)
+        return it
+
+    def seed(self, namespace: str, count: int, services: int = 20, envs: Tuple[str, ...] = ("dev", "prod")) -> None:
+        coll = self.resolve_collection(ALIAS_PREFIX + "default")
+        stamp = "2024-01-01T00:00:00+00:00"
+        for i in range(count):
+            svc = f"svc{i % services:03d}"
+            usr = f"KEY_{i:06d}"
+            attrs = {
+                "kk_ns": namespace,
+                "service": svc,
+                "username": usr,
+                "kk_v": "1",
+                "env": envs[i % len(envs)],
+                "source": "seed",
+                "created_at": stamp,
+                "updated_at": stamp,
+            }
+            self.add_item(coll, f"{svc}/{usr}", attrs, f"secret-{i:06d}".encode(), emit=False)
+
+    @staticmethod
+    def _matches(item: Item, attrs: Dict[str, str]) -> bool:
+        return all(item.attrs.get(k) == v for k, v in attrs.items())
+
+    def _search(self, colls, attrs: Dict[str, str]) -> List[Item]:
+        return [it for c in colls for it in c.items.values() if self._matches(it, attrs)]
+
+    # -- signals and prompts ----------------------------------------------
+    def emit(self, path: str, member: str, *args, iface: str = PREFIX + "Collection", sig: str = "o", dest: Optional[str] = None) -> None:
+        msg = new_signal(DBusAddress(path, interface=iface), member, sig, tuple(args))
+        if dest:
+            msg.header.fields[HeaderFields.destination] = dest
+        self.conn.send(msg)
+
+    def new_prompt(self, result: tuple) -> str:
+        path = f"{SS_PATH}/prompt/p{next(self._ids)}"
+        self.prompts[path] = result
+        return path
+
+    # -- dispatch ---------------------------------------------------------
+    def handle(self, msg) -> None:
+        fields = msg.header.fields
+        path = fields.get(HeaderFields.path, "")
+        iface = fields.get(HeaderFields.interface, "")
+        member = fields.get(HeaderFields.member, "")
+        key = f"{iface.rsplit('.', 1)[-1]}.{member}"
+        self.calls[key] = self.calls.get(key, 0) + 1
+        try:
+            if iface == FAKE_IFACE:
+                sig, body = self.fake_call(member)
+            elif iface == PROPS_IFACE:
+                sig, body = self.properties(path, member, msg.body)
+            elif path == SS_PATH:
+                sig, body = self.service_call(member, msg.body, fields.get(HeaderFields.sender))
+            elif path.startswith(SS_PATH + "/session/"):
+                self.sessions.pop(path, None)
+                sig, body = "", ()
+            elif path.startswith(SS_PATH + "/prompt/"):
+                sig, body = "", ()
+                result = self.prompts.pop(path, None)
+                if result is None:
+                    raise _no_such_object(path)
+                self.reply(new_method_return(msg, sig, body))
+                self.emit(path, "Completed", False, result, iface=PREFIX + "Prompt", sig="bv",
+                          dest=fields.get(HeaderFields.sender))
+                return
+            elif iface == PREFIX + "Item" or (iface == "" and path.count("/") > 5):
+                sig, body = self.item_call(path, member, msg.body)
+            else:
+                sig, body = self.collection_call(path, member, msg.body)
+            self.reply(new_method_return(msg, sig, body))
+        except DBusError as e:
+            self.reply(new_error(msg, e.name, "s", (e.text,)))
+
+    def reply(self, msg) -> None:
+        if self.latency:
+            heapq.heappush(self._pending, (time.monotonic() + self.latency, id(msg), msg))
+        else:
+            self.conn.send(msg)
+
+    def flush_due(self) -> Optional[float]:
+        now = time.monotonic()
+        while self._pending and self._pending[0][0] <= now:
+            _, _, msg = heapq.heappop(self._pending)
+            self.conn.send(msg)
+        if self._pending:
+            return max(0.0, self._pending[0][0] - now)
+        return None
+
+    # -- io.github.kktool.FakeSecretService ------------------------------
+    def fake_call(self, member: str):
+        if member == "Stats":
+            return "a{su}", ({k: v for k, v in self.calls.items() if not k.startswith("FakeSecretService.")},)
+        if member == "ResetStats":
+            self.calls.clear()
+            return "", ()
+        raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+
+    # -- org.freedesktop.DBus.Properties ----------------------------------
+    def _props_of(self, path: str) -> Dict[str, tuple]:
+        if path == SS_PATH:
+            return {"Collections": ("ao", list(self.collections))}
+        if path.startswith(ALIAS_PREFIX) and path.count("/") == 5:
+            coll = self.resolve_collection(path)
+        elif path in self.collections:
+            coll = self.collections[path]
+        else:
+            it = self.resolve_item(path)
+            return {
+                "Label": ("s", it.label),
+                "Attributes": ("a{ss}", dict(it.attrs)),
+                "Locked": ("b", it.locked),
+                "Created": ("t", it.created),
+                "Modified": ("t", it.modified),
+            }
+        return {
+            "Label": ("s", coll.label),
+            "Items": ("ao", list(coll.items)),
+            "Locked": ("b", coll.locked),
+            "Created": ("t", coll.created),
+            "Modified": ("t", coll.modified),
+        }
+
+    def properties(self, path: str, member: str, body: tuple):
+        props = self._props_of(path)
+        if member == "Get":
+            name = body[1]
+            if name not in props:
+                raise DBusError("org.freedesktop.DBus.Error.UnknownProperty", name)
+            return "v", (props[name],)
+        if member == "GetAll":
+            return "a{sv}", (props,)
+        if member == "Set":
+            _iface, name, (_sig, value) = body
+            if path.startswith(COLL_PREFIX) and path.count("/") == 5 or path.startswith(ALIAS_PREFIX) and path.count("/") == 5:
+                coll = self.resolve_collection(path)
+                if name == "Label":
+                    coll.label = value
+                return "", ()
+            it = self.resolve_item(path)
+            if it.locked:
+                raise DBusError(PREFIX + "Error.IsLocked", "Item is locked")
+            if name == "Label":
+                it.label = value
+            elif name == "Attributes":
+                it.attrs = dict(value)
+            it.modified = int(time.time())
+            self.emit(it.collection.path, "ItemChanged", it.path)
+            return "", ()
+        raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+
+    # -- org.freedesktop.Secret.Service -----------------------------------
+    def service_call(self, member: str, body: tuple, sender: Optional[str]):
+        if member == "OpenSession":
+            algorithm, (_sig, value) = body
+            path = f"{SS_PATH}/session/s{next(self._ids)}"
+            if algorithm == "plain":
+                self.sessions[path] = Session(path, None)
+                return "vo", (("s", ""), path)
+            if algorithm != "dh-ietf1024-sha256-aes128-cbc-pkcs7":
+                raise DBusError("org.freedesktop.DBus.Error.NotSupported", algorithm)
+            priv = int.from_bytes(os.urandom(0x80), "big")
+            pub = pow(2, priv, DH_PRIME_1024)
+            shared = pow(int.from_bytes(bytes(value), "big"), priv, DH_PRIME_1024).to_bytes(128, "big")
+            prk = hmac.new(b"\x00" * 0x20, shared, sha256).digest()
+            key = hmac.new(prk, b"\x01", sha256).digest()[:16]
+            self.sessions[path] = Session(path, key)
+            return "vo", (("ay", pub.to_bytes(128, "big")), path)
+        if member == "SearchItems":
+            (attrs,) = body
+            found = self._search(self.collections.values(), attrs)
+            return "aoao", ([i.path for i in found if not i.locked], [i.path for i in found if i.locked])
+        if member == "Unlock":
+            (paths,) = body
+            targets = [self._lockable(p) for p in paths]
+            already = [p for p, t in zip(paths, targets) if not t.locked]
+            pending = [p for p, t in zip(paths, targets) if t.locked]
+            if not pending:
+                return "aoo", (already, "/")
+            for t in targets:
+                (t if isinstance(t, Collection) else t.collection).locked = False
+            return "aoo", (already, self.new_prompt(("ao", pending)))
+        if member == "Lock":
+            (paths,) = body
+            for p in paths:
+                t = self._lockable(p)
+                (t if isinstance(t, Collection) else t.collection).locked = True
+            return "aoo", (list(paths), "/")
+        if member == "GetSecrets":
+            paths, session_path = body
+            session = self._session(session_path)
+            out = {}
+            for p in paths:
+                it = self.resolve_item(p)
+                if not it.locked:
+                    out[p] = session.encode(it.secret, it.content_type)
+            return "a{o(oayays)}", (out,)
+        if member == "CreateCollection":
+            props, alias = body
+            label = props.get(PREFIX + "Collection.Label", ("s", ""))[1]
+            if alias and alias in self.aliases:
+                return "oo", (self.aliases[alias], "/")
+            return "oo", (self.create_collection(label, alias).path, "/")
+        if member == "ReadAlias":
+            (alias,) = body
+            return "o", (self.aliases.get(alias, "/"),)
+        if member == "SetAlias":
+            alias, path = body
+            self.aliases[alias] = path
+            return "", ()
+        raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+
+    def _lockable(self, path: str):
+        if path in self.collections or (path.startswith(ALIAS_PREFIX) and path.count("/") == 5):
+            return self.resolve_collection(path)
+        return self.resolve_item(path)
+
+    def _session(self, path: str) -> Session:
+        session = self.sessions.get(path)
+        if session is None:
+            raise DBusError(PREFIX + "Error.NoSession", path)
+        return session
+
+    # -- org.freedesktop.Secret.Collection --------------------------------
+    def collection_call(self, path: str, member: str, body: tuple):
+        coll = self.resolve_collection(path)
+        if member == "SearchItems":
+            (attrs,) = body
+            return "ao", ([i.path for i in self._search([coll], attrs)],)
+        if member == "CreateItem":
+            props, (session_path, params, value, content_type), replace = body
+            if coll.locked:
+                raise DBusError(PREFIX + "Error.IsLocked", "Collection is locked")
+            secret = self._session(session_path).decode(params, value)
+            label = props.get(PREFIX + "Item.Label", ("s", ""))[1]
+            attrs = props.get(PREFIX + "Item.Attributes", ("a{ss}", {}))[1]
+            return "oo", (self.add_item(coll, label, attrs, secret, content_type, replace).path, "/")
+        if member == "Delete":
+            del self.collections[coll.path]
+            self.aliases = {a: p for a, p in self.aliases.items() if p != coll.path}
+            return "o", ("/",)
+        raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+
+    # -- org.freedesktop.Secret.Item --------------------------------------
+    def item_call(self, path: str, member: str, body: tuple):
+        it = self.resolve_item(path)
+        if member == "Delete":
+            del it.collection.items[it.path]
+            self.emit(it.collection.path, "ItemDeleted", it.path)
+            return "o", ("/",)
+        if it.locked:
+            raise DBusError(PREFIX + "Error.IsLocked", "Item is locked")
+        if member == "GetSecret":
+            (session_path,) = body
+            return "(oayays)", (self._session(session_path).encode(it.secret, it.content_type),)
+        if member == "SetSecret":
+            ((session_path, params, value, content_type),) = body
+            it.secret = self._session(session_path).decode(params, value)
+            it.content_type = content_type
+            it.modified = int(time.time())
+            self.emit(it.collection.path, "ItemChanged", it.path)
+            return "", ()
+        raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+
+    # -- main loop --------------------------------------------------------
+    def serve(self, ready_fd: Optional[int] = None) -> None:
+        reply = self.conn.send_and_get_reply(message_bus.RequestName(BUS_NAME))
+        if reply.body[0] != 1:
+            raise SystemExit(f"could not own {BUS_NAME}")
+        if ready_fd is not None:
+            os.write(ready_fd, b"ready\n")
+            os.close(ready_fd)
+        while True:
+            timeout = self.flush_due()
+            try:
+                msg = self.conn.receive(timeout=timeout)
+            except TimeoutError:
+                continue
+            if msg.header.message_type == MessageType.method_call:
+                self.handle(msg)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Fake org.freedesktop.secrets for tests and benchmarks")
+    p.add_argument("--latency", type=float, default=0.0, help="Per-call reply delay in seconds")
+    p.add_argument("--seed", type=int, default=0, help="Pre-populate N items in the default collection")
+    p.add_argument("--seed-ns", default="bench", help="Namespace for seeded items")
+    p.add_argument("--locked", action="store_true", help="Start with the default collection locked")
+    p.add_argument("--ready-fd", type=int, default=None, help="Write 'ready' to this fd once the name is owned")
+    args = p.parse_args(argv)
+    conn = open_dbus_connection(bus="SESSION")
+    svc = FakeSecretService(conn, latency=args.latency)
+    if args.seed:
+        svc.seed(args.seed_ns, args.seed)
+    if args.locked:
+        svc.resolve_collection(ALIAS_PREFIX + "default").locked = True
+    try:
+        svc.serve(args.ready_fd)
+    except (KeyboardInterrupt, ConnectionError):
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
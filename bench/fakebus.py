@@ -0,0 +1,131 @@
+"""Private session bus with the fake Secret Service, for benchmarks and CI.
+
+Starts ``dbus-daemon --session`` on a temporary address, launches
+``fake_secret_service.py`` on it, waits until it owns
+``org.freedesktop.secrets`` and hands back an environment whose
+``DBUS_SESSION_BUS_ADDRESS`` points at that bus. Nothing touches the
+user's real keyring.
+
+    python bench/fakebus.py --seed 1000 -- ./kk list --all-envs
+    python bench/fakebus.py --latency 0.002 --locked -- ./kk --profile get svc000/KEY_000000
+
+As a library: ``with private_bus(seed=1000) as bus: subprocess.run(cmd, env=bus.env)``.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+HERE = Path(__file__).resolve().parent
+FAKE = HERE / "fake_secret_service.py"
+_FAKE_IFACE = "io.github.kktool.FakeSecretService"
+
+
+class PrivateBus:
+    def __init__(self, address: str, env: Dict[str, str]):
+        self.address = address
+        self.env = env
+        self._conn = None
+
+    def _call(self, member: str):
+        from jeepney import DBusAddress, new_method_call
+        from jeepney.io.blocking import open_dbus_connection
+        if self._conn is None:
+            self._conn = open_dbus_connection(self.address)
+        addr = DBusAddress("/org/freedesktop/secrets", "org.freedesktop.secrets", _FAKE_IFACE)
+        return self._conn.send_and_get_reply(new_method_call(addr, member)).body
+
+    def stats(self) -> Dict[str, int]:
+        """DBus calls served by the fake since the last reset, per method."""
+        return dict(self._call("Stats")[0])
+
+    def reset_stats(self) -> None:
+        self._call("ResetStats")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+@contextmanager
+def private_bus(
+    seed: int = 0,
+    seed_ns: str = "bench",
+    latency: float = 0.0,
+    locked: bool = False,
+    env: Optional[Dict[str, str]] = None,
+) -> Iterator[PrivateBus]:
+    if shutil.which("dbus-daemon") is None:
+        raise RuntimeError("dbus-daemon not found (install dbus)")
+    tmp = tempfile.mkdtemp(prefix="kk-bus-")
+    address = f"unix:path={tmp}/bus"
+    daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--nopidfile", f"--address={address}", "--print-address"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,  # e.g. "Failed to set fd limit" when unprivileged
+        text=True,
+    )
+    fake = None
+    bus = None
+    try:
+        address = daemon.stdout.readline().strip() or address
+        bus_env = dict(os.environ if env is None else env, DBUS_SESSION_BUS_ADDRESS=address)
+        read_fd, write_fd = os.pipe()
+        cmd = [sys.executable, str(FAKE), "--ready-fd", str(write_fd), "--latency", str(latency)]
+        if seed:
+            cmd += ["--seed", str(seed), "--seed-ns", seed_ns]
+        if locked:
+            cmd.append("--locked")
+        fake = subprocess.Popen(cmd, env=bus_env, pass_fds=(write_fd,))
+        os.close(write_fd)
+        with os.fdopen(read_fd) as ready:
+            if ready.readline().strip() != "ready":
+                raise RuntimeError("fake Secret Service failed to start")
+        bus = PrivateBus(address, bus_env)
+        yield bus
+    finally:
+        if bus is not None:
+            bus.close()
+        for proc in (fake, daemon):
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        if daemon.stdout is not None:
+            daemon.stdout.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main(argv: List[str]) -> int:
+    if "--" in argv:
+        split = argv.index("--")
+        argv, cmd = argv[:split], argv[split + 1:]
+    else:
+        cmd = []
+    ap = argparse.ArgumentParser(description="Run a command against a private bus with a fake Secret Service")
+    ap.add_argument("--seed", type=int, default=0, help="Pre-populate N items")
+    ap.add_argument("--seed-ns", default="bench", help="Namespace of seeded items")
+    ap.add_argument("--latency", type=float, default=0.0, help="Per-call reply delay in seconds")
+    ap.add_argument("--locked", action="store_true", help="Start with the default collection locked")
+    ap.add_argument("--stats", action="store_true", help="Print DBus call counts after the command")
+    args = ap.parse_args(argv)
+    if not cmd:
+        ap.error("missing command after --")
+    with private_bus(args.seed, args.seed_ns, args.latency, args.locked) as bus:
+        rc = subprocess.call(cmd, env=bus.env)
+        if args.stats:
+            stats = bus.stats()
+            print(f"calls={sum(stats.values())} {dict(sorted(stats.items()))}", file=sys.stderr)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
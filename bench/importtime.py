@@ -0,0 +1,89 @@
+"""Cold-start import benchmark for the kk CLI.
+
+Runs ``python -X importtime`` on the parser setup for a given command line
+(without executing the command) and reports the slowest modules by
+cumulative import time, plus the total. Use ``--max-ms`` in CI to fail
+when cold start regresses past a budget.
+
+    python bench/importtime.py get a/b
+    python bench/importtime.py --runs 5 --json list
+    python bench/importtime.py --max-ms 40 get a/b
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPO = Path(__file__).resolve().parent.parent
+
+# Import kk's entry module and build the parser for argv, stopping before dispatch
+_PROBE = "import sys; sys.argv = ['kk'] + sys.argv[1:]; from kkcli.__main__ import build_parser; build_parser()"
+
+
+def measure(kk_argv: List[str]) -> Tuple[Dict[str, int], int]:
+    """One cold run: ({module: cumulative_us}, total_us of top-level imports)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (str(REPO), os.environ.get("PYTHONPATH", "")) if p))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE, *kk_argv],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    modules: Dict[str, int] = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cum_us, name = line.split(":", 1)[1].split("|")
+        modules[name.strip()] = int(cum_us)
+        # Nesting is shown as indentation; top-level imports have one space
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cum_us)
+    return modules, total
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("kk_argv", nargs="*", default=["get", "svc/user"], help="kk command line to probe")
+    p.add_argument("--runs", type=int, default=3, help="Cold runs; the median is reported")
+    p.add_argument("--top", type=int, default=15, help="Modules to show")
+    p.add_argument("--json", action="store_true", help="Emit JSON instead of a table")
+    p.add_argument("--max-ms", type=float, default=None, help="Exit 1 if the median total exceeds this")
+    args = p.parse_args(argv)
+
+    runs = [measure(args.kk_argv) for _ in range(max(1, args.runs))]
+    total_ms = statistics.median(t for _, t in runs) / 1000.0
+    names = set().union(*(m for m, _ in runs))
+    per_module = {n: statistics.median(m.get(n, 0) for m, _ in runs) / 1000.0 for n in names}
+    top = sorted(per_module.items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+    kk_modules = sorted(n for n in names if n == "kkcli" or n.startswith("kkcli."))
+
+    if args.json:
+        print(json.dumps({
+            "argv": args.kk_argv,
+            "runs": len(runs),
+            "total_ms": round(total_ms, 3),
+            "module_count": len(names),
+            "kk_modules": kk_modules,
+            "top": [{"module": n, "cumulative_ms": round(ms, 3)} for n, ms in top],
+        }, indent=2))
+    else:
+        print(f"kk {' '.join(args.kk_argv)}: {total_ms:.1f} ms import time, {len(names)} modules (median of {len(runs)})")
+        print(f"kk modules: {', '.join(kk_modules)}")
+        print(f"{'cumulative ms':>13}  module")
+        for n, ms in top:
+            print(f"{ms:>13.2f}  {n}")
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"FAIL: {total_ms:.1f} ms > budget {args.max_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""End-to-end kk benchmarks against the fake Secret Service.
+
+For each size, starts a private bus (``fakebus.private_bus``) seeded with
+that many items in namespace ``bench``, then runs real ``kk`` commands in
+subprocesses with an isolated HOME/state directory and records wall time
+and the number of DBus calls the fake served:
+
+    list (cold index), list (warm), search, export, ingest (new keys),
+    ingest (re-run, unchanged), migrate (to a second namespace), clean
+
+Results print as a table, or as JSON with ``--json``. ``--baseline`` compares
+against a previous ``--json`` output and exits 1 if any scenario's time grew
+by more than ``--max-regress`` (ratio) or its call count grew at all.
+
+    python bench/secret_service.py --sizes 100 1000
+    python bench/secret_service.py --sizes 1000 10000 50000 --latency 0.001 --json > now.json
+    python bench/secret_service.py --sizes 1000 --baseline before.json --max-regress 1.3
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from fakebus import private_bus
+
+REPO = Path(__file__).resolve().parent.parent
+NAMESPACE = "bench"
+INGEST_KEYS_PER_FILE = 100
+
+# (name, kk argv); "{tmp}" is replaced with the run's scratch directory
+SCENARIOS: List[Tuple[str, List[str]]] = [
+    ("list-cold", ["list", "--all-envs"]),
+    ("list-warm", ["list", "--all-envs"]),
+    ("search", ["search", "service:svc003 user:KEY_00*", "--all-envs"]),
+    ("export", ["export", "--all-envs", "--format", "ndjson", "-o", "{tmp}/export.ndjson"]),
+    ("ingest", ["ingest", "{tmp}/ingest"]),
+    ("ingest-rerun", ["ingest", "{tmp}/ingest", "--full"]),
+    ("migrate", ["migrate", "--to-ns", NAMESPACE + "2"]),
+    ("clean", ["clean", "--all-envs", "yes"]),
+]
+
+
+def write_ingest_tree(root: Path, keys: int) -> None:
+    """``keys`` new secrets spread over dot-env files of 100 keys each."""
+    root.mkdir(parents=True, exist_ok=True)
+    for f in range(0, keys, INGEST_KEYS_PER_FILE):
+        lines = [f"INGEST_{i:06d}=value-{i:06d}\n" for i in range(f, min(keys, f + INGEST_KEYS_PER_FILE))]
+        (root / f".ingest{f // INGEST_KEYS_PER_FILE:04d}.env").write_text("".join(lines))
+
+
+def run_size(size: int, latency: float, ingest_keys: int) -> Dict[str, dict]:
+    tmp = Path(tempfile.mkdtemp(prefix="kk-bench-"))
+    env = dict(
+        os.environ,
+        HOME=str(tmp / "home"),
+        XDG_STATE_HOME=str(tmp / "state"),
+        XDG_RUNTIME_DIR=str(tmp / "run"),
+        KK_CONFIG=str(tmp / "none.toml"),
+        KK_NAMESPACE=NAMESPACE,
+        KK_AGENT="0",
+        PYTHONPATH=os.pathsep.join(p for p in (str(REPO), os.environ.get("PYTHONPATH", "")) if p),
+    )
+    for key in ("KK_TRACE", "KK_TRACE_FILE", "KK_STORE_MODE", "KK_DEFAULT_ENV"):
+        env.pop(key, None)
+    write_ingest_tree(tmp / "ingest", ingest_keys)
+    results: Dict[str, dict] = {}
+    try:
+        with private_bus(seed=size, seed_ns=NAMESPACE, latency=latency, env=env) as bus:
+            for name, argv in SCENARIOS:
+                argv = [a.replace("{tmp}", str(tmp)) for a in argv]
+                bus.reset_stats()
+                t0 = time.perf_counter()
+                proc = subprocess.run(
+                    [sys.executable, "-m", "kkcli", *argv],
+                    env=bus.env,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                )
+                seconds = time.perf_counter() - t0
+                if proc.returncode != 0:
+                    raise RuntimeError(f"kk {' '.join(argv)} failed ({proc.returncode}):\n{proc.stderr}")
+                calls = bus.stats()
+                results[name] = {"seconds": round(seconds, 4), "calls": sum(calls.values()), "by_method": calls}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def compare(current: dict, baseline: dict, max_regress: float) -> List[str]:
+    problems = []
+    for size, scenarios in current["sizes"].items():
+        for name, r in scenarios.items():
+            old = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not old:
+                continue
+            if old["seconds"] > 0 and r["seconds"] / old["seconds"] > max_regress:
+                problems.append(f"{name}@{size}: {old['seconds']}s -> {r['seconds']}s")
+            if r["calls"] > old["calls"]:
+                problems.append(f"{name}@{size}: {old['calls']} -> {r['calls']} DBus calls")
+    return problems
+
+
+def main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark kk commands against a fake Secret Service")
+    ap.add_argument("--sizes", nargs="+", type=int, default=[100, 1000], help="Seeded item counts (e.g. 100 ... 50000)")
+    ap.add_argument("--latency", type=float, default=0.0, help="Fake per-call latency in seconds")
+    ap.add_argument("--ingest-keys", type=int, default=None, help="Keys to ingest (default: 10%% of size, at least 100)")
+    ap.add_argument("--json", action="store_true", help="Print results as JSON")
+    ap.add_argument("--baseline", type=Path, default=None, help="Previous --json output to compare against")
+    ap.add_argument("--max-regress", type=float, default=1.25, help="Allowed time ratio against the baseline")
+    args = ap.parse_args(argv)
+
+    out = {"latency": args.latency, "sizes": {}}
+    for size in args.sizes:
+        keys = args.ingest_keys if args.ingest_keys is not None else max(100, size // 10)
+        out["sizes"][str(size)] = run_size(size, args.latency, keys)
+        if not args.json:
+            print(f"-- {size} items (latency {args.latency * 1000:g} ms, ingest {keys} keys)", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(out, indent=2))
+    else:
+        sizes = list(out["sizes"])
+        header = f"{'scenario':<14}" + "".join(f"{s + ' items':>22}" for s in sizes)
+        print(header)
+        print("-" * len(header))
+        for name, _argv in SCENARIOS:
+            cells = []
+            for s in sizes:
+                r = out["sizes"][s][name]
+                cells.append(f"{r['seconds']:>10.3f}s {r['calls']:>7} calls")
+            print(f"{name:<14}" + "".join(f"{c:>22}" for c in cells))
+
+    if args.baseline is not None:
+        problems = compare(out, json.loads(args.baseline.read_text()), args.max_regress)
+        for p in problems:
+            print(f"REGRESSION {p}", file=sys.stderr)
+        if problems:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,14 +2,25 @@ from __future__ import annotations
 
 __all__ = ["__version__"]
 
-try:
+
+def _read_version() -> str:
     try:
-        # Python 3.8+
-        from importlib.metadata import version as _pkg_version  # type: ignore
-    except Exception:  # pragma: no cover
-        from importlib_metadata import version as _pkg_version  # type: ignore
-    __version__ = _pkg_version("kktool")
-except Exception:
-    # Fallback if package metadata is unavailable (e.g., running from source)
-    __version__ = "0.1.0"
+        try:
+            # Python 3.8+
+            from importlib.metadata import version as _pkg_version  # type: ignore
+        except Exception:  # pragma: no cover
+            from importlib_metadata import version as _pkg_version  # type: ignore
+        return _pkg_version("kktool")
+    except Exception:
+        # Fallback if package metadata is unavailable (e.g., running from source)
+        return "0.1.0"
+
 
+def __getattr__(name: str):
+    # importlib.metadata dominates cold-start time, so only resolve the
+    # version when something actually asks for it (e.g. `kk --version`)
+    if name == "__version__":
+        value = _read_version()
+        globals()["__version__"] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
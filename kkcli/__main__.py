@@ -1,52 +1,121 @@
 import argparse
+import os
 import sys
 
 from .config import load_config
-from . import __version__
 
+# Static command table: name -> (module under kkcli.commands, help).
+# Only the selected command's module is imported; the rest get argparse
+# stubs so `kk --help` still lists them.
+COMMANDS = {
+    "list": ("list_cmd", "List namespace items (masked)"),
+    "search": ("search_cmd", "Search items in namespace (masked)"),
+    "get": ("get_cmd", "Get full secret"),
+    "set": ("set_cmd", "Set or update a secret"),
+    "remove": ("remove_cmd", "Remove a secret (confirm)"),
+    "ingest": ("ingest_cmd", "Ingest dot-env files: directory scan (.*.env) or single .env file"),
+    "export": ("export_cmd", "Export namespace items"),
+    "snapshot": ("snapshot_cmd", "Take an incremental encrypted snapshot of the namespace"),
+    "restore": ("restore_cmd", "Restore the namespace from a snapshot"),
+    "migrate": ("migrate_cmd", "Migrate items between modes/namespaces"),
+    "doctor": ("doctor_cmd", "Diagnose keyring/DBus and show context"),
+    "clean": ("clean_cmd", "Delete items in current namespace and env (requires 'yes')"),
+    "compact": ("compact_cmd", "Delete duplicate items, keeping the newest of each name"),
+    "env": ("env_cmd", "Print selected secrets as shell export lines"),
+    "exec": ("exec_cmd", "Run a command with selected secrets in its environment"),
+    "render": ("render_cmd", "Fill {{kk:service/username}} placeholders in a template"),
+    "watch": ("watch_cmd", "Follow keyring changes and sync them to env files, logs or hooks"),
+    "agent": ("agent_cmd", "Run or control the background agent (keeps the keyring session open)"),
+}
 
-def build_parser() -> argparse.ArgumentParser:
+# Commands that accept several namespaces (--ns a,b,c); the rest need one
+# (agent and doctor do not act on a namespace)
+_FANOUT_COMMANDS = {"list", "search", "export", "agent", "doctor"}
+
+# Global long options (must match build_parser) and whether they take a value
+_GLOBAL_LONG_OPTS = {"--ns": True, "--store-mode": True, "--profile": False, "--version": False, "--help": False}
+
+
+class _VersionAction(argparse.Action):
+    """Like action="version" but resolves the version only when used."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings=option_strings, dest=dest, default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from . import __version__
+        parser.exit(message=f"kk {__version__}\n")
+
+
+def _takes_value(arg):
+    """Whether global option ``arg`` consumes the next argv token. Resolves
+    unique prefixes (``--store`` for ``--store-mode``) and ``--opt=value``
+    the way argparse does, since it accepts abbreviations by default."""
+    if not arg.startswith("--") or "=" in arg:
+        return False
+    if arg in _GLOBAL_LONG_OPTS:
+        return _GLOBAL_LONG_OPTS[arg]
+    matches = [opt for opt in _GLOBAL_LONG_OPTS if opt.startswith(arg)]
+    # An ambiguous prefix is argparse's error to report
+    return len(matches) == 1 and _GLOBAL_LONG_OPTS[matches[0]]
+
+
+def _selected_command(argv):
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg.startswith("-"):
+            skip = _takes_value(arg)
+            continue
+        return arg if arg in COMMANDS else None
+    return None
+
+
+def build_parser(argv=None) -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="kk", description="Namespace-aware keyring CLI")
     sp = p.add_subparsers(dest="cmd")
 
-    # Register subcommands
-    from .commands import list_cmd, search_cmd, get_cmd, set_cmd, remove_cmd, ingest_cmd, export_cmd, migrate_cmd, doctor_cmd, clean_cmd
-    list_cmd.register(sp)
-    search_cmd.register(sp)
-    get_cmd.register(sp)
-    set_cmd.register(sp)
-    remove_cmd.register(sp)
-    ingest_cmd.register(sp)
-    export_cmd.register(sp)
-    migrate_cmd.register(sp)
-    doctor_cmd.register(sp)
-    clean_cmd.register(sp)
+    # Register subcommands: full parser for the selected one, stubs for the rest
+    selected = _selected_command(sys.argv[1:] if argv is None else argv)
+    for name, (module, help_text) in COMMANDS.items():
+        if name == selected:
+            import importlib
+            importlib.import_module(f".commands.{module}", __package__).register(sp)
+        else:
+            sp.add_parser(name, help=help_text)
 
     # Global options via env/config; kept minimal in CLI
-    p.add_argument("--ns", dest="namespace", default=None, help="Override namespace")
-    p.add_argument("--store-mode", dest="store_mode", choices=["attribute", "collection"], default=None, help="Override store mode")
+    p.add_argument("--ns", dest="namespace", default=None, help="Override namespace (list/search/export: a,b,c)")
+    p.add_argument("--store-mode", dest="store_mode", choices=["attribute", "collection", "vault"], default=None, help="Override store mode")
     p.add_argument(
-        "--version",
-        action="version",
-        version=f"kk {__version__}",
-        help="Show version and exit",
+        "--profile",
+        action="store_true",
+        help="Trace Secret Service calls and print per-call timings to stderr at exit (KK_TRACE=json for JSON)",
     )
+    p.add_argument("--version", action=_VersionAction, help="Show version and exit")
     return p
 
 
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
-    parser = build_parser()
+    parser = build_parser(argv)
     args = parser.parse_args(argv)
     # --version is handled by argparse action
     # Allow overrides of config via flags
     if args.namespace:
-        import os
         os.environ["KK_NAMESPACE"] = args.namespace
+    if "," in os.environ.get("KK_NAMESPACE", "") and args.cmd and args.cmd not in _FANOUT_COMMANDS:
+        parser.error(f"kk {args.cmd} takes a single namespace; several (--ns a,b) work with list, search and export")
     if args.store_mode:
-        import os
         os.environ["KK_STORE_MODE"] = args.store_mode
+    if args.profile or os.environ.get("KK_TRACE"):
+        from . import trace
+        fmt = trace.env_format()
+        if args.profile or fmt:
+            trace.start(fmt or "table")
     if not hasattr(args, "func"):
         parser.print_help()
         return 1
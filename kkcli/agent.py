@@ -0,0 +1,253 @@
+"""Long-lived agent that keeps the DBus connection and unlocked stores open.
+
+The agent listens on a per-user Unix socket and answers newline-delimited
+JSON requests (get/get_many/put/list) using cached ``Store`` objects, so callers skip
+the secretstorage imports, the DBus handshake, session negotiation and the
+collection unlock. Only peers with the agent's own uid are served.
+
+CLI commands call :func:`request` first and fall back to ``open_store`` when
+it returns None (agent not running, disabled, or failed). Requests carry the
+client's resolved store settings (vault path and keyfile, collection alias);
+the agent refuses a request whose settings differ from its own, so a client
+with another ``KK_VAULT_PATH`` or config falls back instead of being served
+from the agent's store.
+"""
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+PROTOCOL_VERSION = 3
+
+
+def socket_path() -> Path:
+    override = os.environ.get("KK_AGENT_SOCKET")
+    if override:
+        return Path(override)
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return Path(runtime) / "kk" / "agent.sock"
+    from .config import state_dir
+    return state_dir() / "agent.sock"
+
+
+def enabled() -> bool:
+    return os.environ.get("KK_AGENT", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def store_settings(namespace: str, mode: str) -> dict:
+    """Settings, besides namespace and mode, that decide which store opens."""
+    from .config import load_config
+    cfg = load_config()
+    if mode == "vault":
+        from .vault import vault_path
+        keyfile = cfg.vault_keyfile
+        return {
+            "vault_path": str(vault_path().resolve()),
+            "vault_keyfile": str(Path(keyfile).expanduser().resolve()) if keyfile else None,
+        }
+    if mode == "collection":
+        return {"collection": cfg.collections.get(namespace)}
+    return {}
+
+
+# -- client -----------------------------------------------------------------
+
+def request(op: str, **payload) -> Optional[dict]:
+    """Send one request to a running agent; None if it is unavailable or fails."""
+    if not enabled():
+        return None
+    path = socket_path()
+    if not path.exists():
+        return None
+    from .trace import span
+    try:
+        with span(f"Agent.{op}"), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(30)
+            sock.connect(str(path))
+            msg = dict(payload, op=op, v=PROTOCOL_VERSION)
+            if "namespace" in payload and "mode" in payload:
+                msg["settings"] = store_settings(str(payload["namespace"]), str(payload["mode"]))
+            sock.sendall(json.dumps(msg).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        resp = json.loads(line)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(resp, dict) or not resp.get("ok"):
+        return None
+    return resp
+
+
+def encode_secret(secret: Optional[bytes]) -> Optional[str]:
+    return None if secret is None else base64.b64encode(secret).decode()
+
+
+def decode_secret(secret: Optional[str]) -> Optional[bytes]:
+    return None if secret is None else base64.b64decode(secret)
+
+
+# -- server -----------------------------------------------------------------
+
+def _peer_uid(conn: socket.socket) -> Optional[int]:
+    opt = getattr(socket, "SO_PEERCRED", None)
+    if opt is None:  # pragma: no cover - non-Linux; rely on socket dir permissions
+        return os.getuid()
+    creds = conn.getsockopt(socket.SOL_SOCKET, opt, struct.calcsize("3i"))
+    _pid, uid, _gid = struct.unpack("3i", creds)
+    return uid
+
+
+class Agent:
+    def __init__(self, idle_timeout: float = 0.0):
+        self.idle_timeout = idle_timeout
+        self.stores: Dict[Tuple[str, str], object] = {}
+        self.settings: Dict[Tuple[str, str], dict] = {}  # agent-side store_settings
+        self.running = True
+
+    def store(self, namespace: str, mode: str):
+        from .storage import open_store
+        key = (namespace, mode)
+        if key not in self.stores:
+            self.stores[key] = open_store(namespace, mode)
+        return self.stores[key]
+
+    def dispatch(self, req: dict) -> dict:
+        op = req.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "stores": [f"{ns}/{m}" for ns, m in self.stores]}
+        if op == "shutdown":
+            self.running = False
+            return {"ok": True}
+        if op not in ("get", "get_many", "put", "list"):
+            return {"ok": False, "error": f"unknown op: {op}"}
+        if req.get("v") != PROTOCOL_VERSION:
+            return {"ok": False, "error": "protocol version mismatch"}
+        key = (str(req.get("namespace")), str(req.get("mode")))
+        if key not in self.settings:
+            try:
+                self.settings[key] = store_settings(*key)
+            except Exception as e:
+                return {"ok": False, "error": str(e)}
+        if req.get("settings") != self.settings[key]:
+            # The client resolves another vault file, keyfile or collection
+            return {"ok": False, "error": "store settings differ from the agent's"}
+        try:
+            return self._run(op, req)
+        except Exception:
+            # Stale connection or re-locked collection: reopen once and retry
+            self.stores.pop(key, None)
+            try:
+                return self._run(op, req)
+            except Exception as e:
+                return {"ok": False, "error": str(e)}
+
+    def _run(self, op: str, req: dict) -> dict:
+        from . import storage
+        from .query import parse_query
+        store = self.store(str(req["namespace"]), str(req["mode"]))
+        if store.locked:
+            store.locked = None  # a dismissed unlock prompt only holds for one request
+        if store.index is not None:
+            # Other processes (ingest, clean, set without the agent) may have
+            # written since the last request: re-read the index file if it
+            # changed and re-check item paths once for this request
+            store.index.refresh()
+            store.index.reconciled = False
+        if op == "get":
+            return {"ok": True, "value": storage.get(store, req["service"], req["username"])}
+        if op == "get_many":
+            found = storage.get_many(store, [(str(s), str(u)) for s, u in req.get("names") or []])
+            if store.index is not None:
+                store.index.flush()
+            return {"ok": True, "values": [[s, u, v] for (s, u), v in found.items()]}
+        if op == "put":
+            storage.put(store, req["service"], req["username"], req["secret"], req.get("attrs") or None)
+            if store.index is not None:
+                store.index.flush()
+            return {"ok": True}
+        rows = storage.list_items(
+            store,
+            contains=req.get("contains"),
+            env=req.get("env"),
+            secrets=bool(req.get("secrets", True)),
+            service=req.get("service"),
+            query=parse_query(req.get("query")) if req.get("query") else None,
+        )
+        if store.index is not None:
+            store.index.flush()
+        for r in rows:
+            r["secret"] = encode_secret(r["secret"])
+        return {"ok": True, "rows": rows}
+
+    def handle(self, conn: socket.socket) -> None:
+        if _peer_uid(conn) != os.getuid():
+            return
+        with conn.makefile("rb") as f:
+            line = f.readline()
+        try:
+            req = json.loads(line)
+            resp = self.dispatch(req) if isinstance(req, dict) else {"ok": False, "error": "bad request"}
+        except ValueError:
+            resp = {"ok": False, "error": "bad request"}
+        conn.sendall(json.dumps(resp).encode() + b"\n")
+
+    def serve(self, path: Path) -> None:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            srv.bind(str(path))
+        finally:
+            os.umask(old_umask)
+        srv.listen(16)
+        if self.idle_timeout:
+            srv.settimeout(self.idle_timeout)
+        try:
+            while self.running:
+                try:
+                    conn, _ = srv.accept()
+                except socket.timeout:
+                    break
+                with conn:
+                    conn.settimeout(30)
+                    try:
+                        self.handle(conn)
+                    except OSError:
+                        continue
+        finally:
+            srv.close()
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def run_foreground(idle_timeout: float = 0.0) -> int:
+    Agent(idle_timeout).serve(socket_path())
+    return 0
+
+
+def spawn(idle_timeout: float = 0.0) -> int:
+    """Start the agent detached from the terminal; returns its pid."""
+    import subprocess
+    cmd = [sys.executable, "-m", "kkcli", "agent", "run", "--idle-timeout", str(idle_timeout)]
+    pkg_root = str(Path(__file__).resolve().parent.parent)
+    pythonpath = os.pathsep.join(p for p in (pkg_root, os.environ.get("PYTHONPATH", "")) if p)
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        env=dict(os.environ, KK_AGENT="0", PYTHONPATH=pythonpath),
+    )
+    return proc.pid
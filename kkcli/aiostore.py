@@ -0,0 +1,206 @@
+"""Asyncio Secret Service engine for bulk operations.
+
+Runs on jeepney's asyncio router so many method calls are in flight on one
+connection at once (bounded by a semaphore) instead of each waiting for its
+own reply. It complements the synchronous ``Store``: bulk paths in
+``storage`` (metadata reads, ingest/migrate writes, bulk deletes) hand their
+work to :func:`run`, which opens a connection for the duration of the batch.
+Simple single-item commands keep using the blocking API.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from jeepney import DBusAddress, DBusErrorResponse, MatchRule, MessageType, Properties, new_method_call
+from jeepney.bus_messages import message_bus
+from jeepney.io.asyncio import Proxy, open_dbus_router
+
+from . import trace
+from .storage import Change, ItemMeta, Store, _ITEM_IFACE, _COLLECTION_IFACE, _index_drop, _index_put, _now_iso
+
+BUS_NAME = "org.freedesktop.secrets"
+SS_PATH = "/org/freedesktop/secrets"
+SERVICE_IFACE = "org.freedesktop.Secret.Service"
+PROMPT_IFACE = "org.freedesktop.Secret.Prompt"
+DEFAULT_CONCURRENCY = 32
+
+T = TypeVar("T")
+
+
+def concurrency() -> int:
+    try:
+        return max(1, int(os.environ.get("KK_CONCURRENCY", DEFAULT_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_CONCURRENCY
+
+
+class AsyncStore:
+    """Pipelined operations against the collection of a sync ``Store``."""
+
+    def __init__(self, store: Store, router, limit: int = DEFAULT_CONCURRENCY):
+        self.store = store
+        self.router = router
+        self.session = None
+        self._sem = asyncio.Semaphore(limit)
+        self._session_lock = asyncio.Lock()
+
+    async def call(self, path: str, iface: str, method: str, signature: Optional[str] = None, *body):
+        msg = new_method_call(DBusAddress(path, BUS_NAME, iface), method, signature, body)
+        async with self._sem:
+            reply = await self.router.send_and_get_reply(msg)
+        if reply.header.message_type == MessageType.error:
+            raise DBusErrorResponse(reply)
+        return reply.body
+
+    async def _session(self):
+        async with self._session_lock:
+            if self.session is None:
+                from secretstorage.defines import ALGORITHM_DH, ALGORITHM_PLAIN, DBUS_NOT_SUPPORTED
+                from secretstorage.dhcrypto import Session
+                session = Session()
+                try:
+                    output, path = await self.call(
+                        SS_PATH, SERVICE_IFACE, "OpenSession", "sv",
+                        ALGORITHM_DH, ("ay", session.my_public_key.to_bytes(128, "big")),
+                    )
+                    session.set_server_public_key(int.from_bytes(output[1], "big"))
+                except DBusErrorResponse as e:
+                    if e.name != DBUS_NOT_SUPPORTED:
+                        raise
+                    _output, path = await self.call(SS_PATH, SERVICE_IFACE, "OpenSession", "sv", ALGORITHM_PLAIN, ("s", ""))
+                    session.encrypted = False
+                session.object_path = path
+                self.session = session
+        return self.session
+
+    async def _prompt(self, prompt_path: str):
+        """Run a Secret Service prompt; returns (dismissed, (signature, result))."""
+        rule = MatchRule(type="signal", interface=PROMPT_IFACE, member="Completed", path=prompt_path)
+        await Proxy(message_bus, self.router).AddMatch(rule)
+        with self.router.filter(rule) as queue, trace.span("kk.prompt"):
+            await self.call(prompt_path, PROMPT_IFACE, "Prompt", "s", "")
+            msg = await queue.get()
+        return msg.body
+
+    async def _check_prompt(self, prompt_path: str):
+        if prompt_path == "/":
+            return None
+        from secretstorage.exceptions import PromptDismissedException
+        dismissed, result = await self._prompt(prompt_path)
+        if dismissed:
+            raise PromptDismissedException("Prompt dismissed.")
+        return result
+
+    # -- reads -------------------------------------------------------------
+    async def item_meta(self, path: str) -> ItemMeta:
+        msg = Properties(DBusAddress(path, BUS_NAME, _ITEM_IFACE)).get_all()
+        async with self._sem:
+            reply = await self.router.send_and_get_reply(msg)
+        if reply.header.message_type == MessageType.error:
+            raise DBusErrorResponse(reply)
+        (props,) = reply.body
+        return ItemMeta(
+            path=path,
+            label=props.get("Label", ("s", ""))[1],
+            attrs=dict(props.get("Attributes", ("a{ss}", {}))[1]),
+            locked=bool(props.get("Locked", ("b", False))[1]),
+        )
+
+    async def metadata(self, paths: Iterable[str]) -> List[ItemMeta]:
+        """GetAll for every path concurrently; items that vanished are skipped."""
+        results = await asyncio.gather(*(self.item_meta(p) for p in paths), return_exceptions=True)
+        return [r for r in results if isinstance(r, ItemMeta)]
+
+    # -- writes ------------------------------------------------------------
+    async def _format(self, secret: bytes):
+        from secretstorage.util import format_secret
+        return format_secret(await self._session(), secret, "text/plain")
+
+    async def create(self, label: str, attrs: Dict[str, str], secret: bytes) -> str:
+        props = {
+            _ITEM_IFACE + ".Label": ("s", label),
+            _ITEM_IFACE + ".Attributes": ("a{ss}", attrs),
+        }
+        path, prompt = await self.call(
+            self.store.collection.collection_path, _COLLECTION_IFACE, "CreateItem", "a{sv}(oayays)b",
+            props, await self._format(secret), False,
+        )
+        if len(path) > 1:
+            return path
+        _sig, path = await self._check_prompt(prompt)
+        return path
+
+    async def _set(self, path: str, name: str, signature: str, value) -> None:
+        msg = Properties(DBusAddress(path, BUS_NAME, _ITEM_IFACE)).set(name, signature, value)
+        async with self._sem:
+            reply = await self.router.send_and_get_reply(msg)
+        if reply.header.message_type == MessageType.error:
+            raise DBusErrorResponse(reply)
+
+    async def update(self, meta: ItemMeta, label: str, attrs: Dict[str, str], secret: bytes) -> None:
+        # The three writes are independent, so issue them together
+        writes = [self._set(meta.path, "Attributes", "a{ss}", attrs)]
+        if meta.label != label:
+            writes.append(self._set(meta.path, "Label", "s", label))
+        writes.append(self.call(meta.path, _ITEM_IFACE, "SetSecret", "(oayays)", await self._format(secret)))
+        await asyncio.gather(*writes)
+
+    async def delete(self, path: str) -> None:
+        (prompt,) = await self.call(path, _ITEM_IFACE, "Delete", "")
+        await self._check_prompt(prompt)
+
+    async def apply_change(self, change: Change) -> None:
+        """Perform one planned change; keeps the metadata index in step."""
+        label = f"{change.service}/{change.username}"
+        if change.action == "create":
+            a = dict(change.attrs)
+            a.setdefault("created_at", _now_iso())
+            a["updated_at"] = _now_iso()
+            change.path = await self.create(label, a, change.secret.encode())
+            _index_put(self.store, change.path, label, a)
+        elif change.action == "update":
+            meta = change.existing
+            a = dict(change.attrs)
+            if "created_at" in meta.attrs:
+                a["created_at"] = meta.attrs["created_at"]
+            a["updated_at"] = _now_iso()
+            await self.update(meta, label, a, change.secret.encode())
+            _index_put(self.store, meta.path, label, a)
+        elif change.action == "delete":
+            await self.delete(change.existing.path)
+            _index_drop(self.store, change.existing.path)
+
+    async def apply_changes(self, changes: List[Change]) -> List[Optional[Exception]]:
+        """Apply all changes concurrently; one entry per change (None on success)."""
+        async def one(change: Change) -> Optional[Exception]:
+            try:
+                await self.apply_change(change)
+                return None
+            except Exception as e:
+                return e
+        return list(await asyncio.gather(*(one(c) for c in changes)))
+
+    async def delete_paths(self, paths: List[str], progress=None) -> List[Optional[Exception]]:
+        finished = 0
+
+        async def one(path: str) -> Optional[Exception]:
+            nonlocal finished
+            try:
+                await self.delete(path)
+                _index_drop(self.store, path)
+                return None
+            except Exception as e:
+                return e
+            finally:
+                finished += 1
+                if progress is not None:
+                    progress(finished, len(paths))
+        return list(await asyncio.gather(*(one(p) for p in paths)))
+
+
+def run(store: Store, fn: Callable[[AsyncStore], Awaitable[T]], limit: Optional[int] = None) -> T:
+    """Open an asyncio connection for ``store`` and return ``await fn(astore)``."""
+    async def main() -> T:
+        async with open_dbus_router(bus="SESSION") as router:
+            return await fn(AsyncStore(store, trace.wrap_router(router), limit or concurrency()))
+    return asyncio.run(main())
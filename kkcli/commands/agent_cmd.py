@@ -0,0 +1,46 @@
+import sys
+import time
+
+from .. import agent
+
+
+def register(subparsers):
+    p = subparsers.add_parser("agent", help="Run or control the background agent (keeps the keyring session open)")
+    p.add_argument("action", nargs="?", choices=["run", "start", "stop", "status"], default="status")
+    p.add_argument(
+        "--idle-timeout",
+        dest="idle_timeout",
+        type=float,
+        default=0.0,
+        help="Exit after this many seconds without requests (0 = never)",
+    )
+    p.set_defaults(func=run)
+
+
+def run(args):
+    if args.action == "run":
+        return agent.run_foreground(args.idle_timeout)
+    if args.action == "start":
+        if agent.request("ping"):
+            print(f"Agent already running at {agent.socket_path()}")
+            return
+        pid = agent.spawn(args.idle_timeout)
+        for _ in range(50):
+            if agent.request("ping"):
+                print(f"Agent started (pid {pid}) at {agent.socket_path()}")
+                return
+            time.sleep(0.1)
+        print("Agent did not come up; run 'kk agent run' to see errors", file=sys.stderr)
+        sys.exit(1)
+    if args.action == "stop":
+        if agent.request("shutdown") is None:
+            print("Agent not running")
+            return
+        print("Agent stopped")
+        return
+    resp = agent.request("ping")
+    if resp is None:
+        print("Agent not running")
+        sys.exit(1)
+    stores = ", ".join(resp.get("stores") or []) or "none"
+    print(f"Agent running (pid {resp.get('pid')}) at {agent.socket_path()}; open stores: {stores}")
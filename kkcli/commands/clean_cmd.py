@@ -1,6 +1,6 @@
 import sys
 from ..config import load_config
-from ..storage import open_store, list_items, delete
+from ..storage import open_store, delete_matching
 
 
 def register(subparsers):
@@ -14,6 +14,14 @@ def register(subparsers):
     p.set_defaults(func=run)
 
 
+def _progress(done, total):
+    # Redraw in place on a terminal; otherwise report every 10%
+    if sys.stderr.isatty():
+        print(f"\rDeleting: {done}/{total}", end="" if done < total else "\n", file=sys.stderr, flush=True)
+    elif done == total or done % max(1, total // 10) == 0:
+        print(f"Deleting: {done}/{total}", file=sys.stderr)
+
+
 def run(args):
     cfg = load_config()
     print(f"[{cfg.context_header}]")
@@ -24,20 +32,15 @@ def run(args):
         sys.exit(1)
     store = open_store(cfg.namespace, cfg.store_mode)
     env_filter = None if args.all_envs else (args.env or cfg.default_env)
-    rows = list_items(store, env=env_filter)
-    count = 0
-    for r in rows:
-        name = r.get("name", "")
-        try:
-            if "/" in name:
-                svc, usr = name.split("/", 1)
-            else:
-                svc = r["attrs"].get("service", "")
-                usr = r["attrs"].get("username", "")
-            if svc and usr:
-                if delete(store, svc, usr):
-                    count += 1
-        except Exception:
-            continue
+    results = delete_matching(store, {"env": env_filter} if env_filter else None, progress=_progress)
+    failed = [(path, err) for path, err in results if err is not None]
+    count = len(results) - len(failed)
     env_label = "ALL" if env_filter is None else env_filter
     print(f"Deleted {count} item(s) from namespace '{cfg.namespace}' and env '{env_label}'.")
+    if failed:
+        print(f"Failed to delete {len(failed)} item(s):", file=sys.stderr)
+        for path, err in failed[:10]:
+            print(f"  {path}: {err}", file=sys.stderr)
+        if len(failed) > 10:
+            print(f"  ... and {len(failed) - 10} more", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,41 @@
+import sys
+from ..config import load_config
+from ..storage import delete_paths, duplicates, open_store, write_lock
+from .clean_cmd import _progress
+
+
+def register(subparsers):
+    p = subparsers.add_parser("compact", help="Delete duplicate items, keeping the newest of each name")
+    p.add_argument("--dry-run", action="store_true", help="Show duplicates without deleting")
+    p.add_argument("-v", "--verbose", action="store_true", help="List every duplicate group")
+    p.set_defaults(func=run)
+
+
+def run(args):
+    cfg = load_config()
+    print(f"[{cfg.context_header}]")
+    store = open_store(cfg.namespace, cfg.store_mode)
+    # Under the write lock so no set/ingest creates or updates an item mid-way
+    with write_lock(store):
+        groups = duplicates(store)
+        if not groups:
+            print(f"No duplicates in namespace '{cfg.namespace}'.")
+            return
+        drop = [meta for _keep, extra in groups for meta in extra]
+        if args.verbose or args.dry_run:
+            for keep, extra in groups:
+                a = keep.attrs
+                print(f"{a.get('service')}/{a.get('username')}: keep {keep.path} ({a.get('updated_at', '?')}), drop {len(extra)}")
+        if args.dry_run:
+            print(f"Would delete {len(drop)} duplicate item(s) across {len(groups)} name(s) (dry run).")
+            return
+        errors = delete_paths(store, [m.path for m in drop], progress=_progress)
+    failed = [(meta, err) for meta, err in zip(drop, errors) if err is not None]
+    print(f"Deleted {len(drop) - len(failed)} duplicate item(s) across {len(groups)} name(s) in namespace '{cfg.namespace}'.")
+    if failed:
+        print(f"Failed to delete {len(failed)} item(s):", file=sys.stderr)
+        for meta, err in failed[:10]:
+            print(f"  {meta.path}: {err}", file=sys.stderr)
+        if len(failed) > 10:
+            print(f"  ... and {len(failed) - 10} more", file=sys.stderr)
+        sys.exit(1)
@@ -1,3 +1,6 @@
+from ..config import load_config
+
+
 def register(subparsers):
     p = subparsers.add_parser("doctor", help="Diagnose keyring/DBus and show context")
     p.set_defaults(func=run)
@@ -6,6 +9,9 @@ def register(subparsers):
 def run(args):
     # Try imports and open default store in both modes to report status
     report = []
+    cfg = load_config()
+    if cfg.store_mode == "vault":
+        report.append(_vault_status())
     try:
         import secretstorage  # noqa
         report.append("secretstorage: OK")
@@ -24,3 +30,20 @@ def run(args):
         report.append(f"DBus/Collection: ERROR: {e}")
     print("\n".join(report))
 
+
+
+def _vault_status() -> str:
+    # Metadata only: no key is needed to count rows
+    import sqlite3
+    from ..vault import vault_path
+    path = vault_path()
+    if not path.exists():
+        return f"Vault: {path} (not created yet)"
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        (count,) = conn.execute("SELECT COUNT(*) FROM items").fetchone()
+        (journal,) = conn.execute("PRAGMA journal_mode").fetchone()
+        conn.close()
+    except Exception as e:
+        return f"Vault: {path} ERROR: {e}"
+    return f"Vault: {path}, items={count}, journal={journal}, mode={oct(path.stat().st_mode & 0o777)}"
@@ -0,0 +1,56 @@
+import re
+import shlex
+import sys
+from .. import agent
+from ..config import load_config
+from ..storage import open_store, list_items
+
+
+ENV_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def add_selection_args(p):
+    p.add_argument("--service", dest="service", default=None, help="Only items of this service")
+    p.add_argument("--contains", dest="contains", default=None)
+    p.add_argument("--env", dest="env", default=None, help="Filter by env (overrides config)")
+    p.add_argument("--all-envs", action="store_true", help="Do not filter by env")
+
+
+def register(subparsers):
+    p = subparsers.add_parser("env", help="Print selected secrets as shell export lines")
+    add_selection_args(p)
+    p.set_defaults(func=run)
+
+
+def secret_env(args) -> dict:
+    """Fetch the selected items in one batched pass and map username -> value."""
+    cfg = load_config()
+    env_filter = None if args.all_envs else (args.env or cfg.default_env)
+    resp = agent.request(
+        "list",
+        namespace=cfg.namespace,
+        mode=cfg.store_mode,
+        contains=args.contains,
+        env=env_filter,
+        service=args.service,
+    )
+    if resp is not None:
+        rows = [dict(r, secret=agent.decode_secret(r["secret"])) for r in resp["rows"]]
+    else:
+        store = open_store(cfg.namespace, cfg.store_mode)
+        rows = list_items(store, contains=args.contains, env=env_filter, service=args.service)
+    out = {}
+    for r in rows:
+        name = r["attrs"].get("username", "")
+        if not ENV_NAME_RE.match(name):
+            print(f"Skipping {r['name']}: not a valid variable name", file=sys.stderr)
+            continue
+        if name in out:
+            print(f"Warning: {name} is set by more than one item; using {r['name']}", file=sys.stderr)
+        out[name] = r["secret"].decode(errors="ignore")
+    return out
+
+
+def run(args):
+    for name, value in secret_env(args).items():
+        print(f"export {name}={shlex.quote(value)}")
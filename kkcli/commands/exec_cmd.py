@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+from .. import trace
+from .env_cmd import add_selection_args, secret_env
+
+
+def register(subparsers):
+    p = subparsers.add_parser(
+        "exec",
+        help="Run a command with selected secrets in its environment",
+        usage="kk exec [--service S] [--env E | --all-envs] [--contains TEXT] -- command [args...]",
+    )
+    add_selection_args(p)
+    p.add_argument("command", nargs=argparse.REMAINDER, help="Command to run (after --)")
+    p.set_defaults(func=run)
+
+
+def run(args):
+    cmd = list(args.command)
+    if cmd and cmd[0] == "--":
+        cmd = cmd[1:]
+    if not cmd:
+        print("Error: no command given (usage: kk exec [filters] -- command args...)", file=sys.stderr)
+        sys.exit(2)
+    env = dict(os.environ)
+    env.update(secret_env(args))
+    # Replace this process: secrets go straight into the child's environment
+    trace.report()  # atexit handlers do not run across exec
+    try:
+        os.execvpe(cmd[0], cmd, env)
+    except OSError as e:
+        print(f"Error: cannot run {cmd[0]}: {e}", file=sys.stderr)
+        sys.exit(127)
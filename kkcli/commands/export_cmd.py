@@ -1,17 +1,40 @@
+import os
+import sys
 from ..config import load_config
-from ..storage import open_store, export_items
+from ..fsutil import atomic_write
+from ..storage import open_stores, write_export
+from .list_cmd import env_selection
 
 
 def register(subparsers):
     p = subparsers.add_parser("export", help="Export namespace items")
-    p.add_argument("--format", dest="fmt", choices=["json", "env"], default="json")
-    p.add_argument("--env", dest="env", default=None, help="Filter by env (overrides config)")
+    p.add_argument("--format", dest="fmt", choices=["json", "ndjson", "env"], default="json")
+    p.add_argument("--env", dest="env", default=None, help="Filter by env, or several: dev,prod (overrides config)")
     p.add_argument("--all-envs", action="store_true", help="Do not filter by env")
+    p.add_argument("--no-sort", dest="no_sort", action="store_true", help="Keep keyring order (skip sorting)")
+    p.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        default=None,
+        help="Write to this file atomically (mode 0600) instead of stdout",
+    )
     p.set_defaults(func=run)
 
 
 def run(args):
     cfg = load_config()
-    store = open_store(cfg.namespace, cfg.store_mode)
-    env_filter = None if args.all_envs else (args.env or cfg.default_env)
-    print(export_items(store, fmt=args.fmt, env=env_filter))
+    # Several namespaces (--ns a,b) share one connection; records carry kk_ns
+    store = open_stores(cfg.namespaces, cfg.store_mode)
+    env_filter = env_selection(args, cfg.default_env)
+    if args.output:
+        with atomic_write(args.output) as f:
+            count = write_export(store, f, fmt=args.fmt, env=env_filter, sort=not args.no_sort)
+        print(f"Exported {count} item(s) to {args.output}", file=sys.stderr)
+    else:
+        try:
+            write_export(store, sys.stdout, fmt=args.fmt, env=env_filter, sort=not args.no_sort)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # Reader went away (e.g. `| head`); stop quietly
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
@@ -1,22 +1,85 @@
+import json
+import shlex
 import sys
+from .. import agent
 from ..config import load_config
 from ..naming import parse_name
-from ..storage import open_store, get as get_item
+from ..storage import open_store, get as get_item, get_many
 
 
 def register(subparsers):
     p = subparsers.add_parser("get", help="Get full secret")
-    p.add_argument("name", help="service/username")
+    p.add_argument("names", nargs="*", metavar="name", help="service/username (one or more)")
+    p.add_argument("--stdin", action="store_true", help="Also read names from stdin, one per line")
+    p.add_argument(
+        "--format",
+        dest="fmt",
+        choices=["value", "json", "ndjson", "env"],
+        default=None,
+        help="Output format (default: the bare value for one name, KEY=value lines for several)",
+    )
     p.set_defaults(func=run)
 
 
+def _read_names(args):
+    names = list(args.names)
+    if args.stdin:
+        names += [line.strip() for line in sys.stdin if line.strip() and not line.lstrip().startswith("#")]
+    pairs = []
+    for name in names:
+        try:
+            pair = parse_name(name)
+        except ValueError as e:
+            print(f"Invalid name '{name}': {e}", file=sys.stderr)
+            sys.exit(1)
+        if pair not in pairs:
+            pairs.append(pair)
+    return pairs
+
+
+def _fetch(cfg, pairs):
+    if len(pairs) == 1:
+        svc, usr = pairs[0]
+        resp = agent.request("get", namespace=cfg.namespace, mode=cfg.store_mode, service=svc, username=usr)
+        if resp is not None:
+            val = resp.get("value")
+        else:
+            val = get_item(open_store(cfg.namespace, cfg.store_mode), svc, usr)
+        return {} if val is None else {(svc, usr): val}
+    resp = agent.request("get_many", namespace=cfg.namespace, mode=cfg.store_mode, names=[list(p) for p in pairs])
+    if resp is not None:
+        return {(s, u): v for s, u, v in resp["values"]}
+    return get_many(open_store(cfg.namespace, cfg.store_mode), pairs)
+
+
 def run(args):
     cfg = load_config()
-    print(f"[{cfg.context_header}]")
-    svc, usr = parse_name(args.name)
-    store = open_store(cfg.namespace, cfg.store_mode)
-    val = get_item(store, svc, usr)
-    if val is None:
-        print("Not found", file=sys.stderr)
+    pairs = _read_names(args)
+    fmt = args.fmt or ("value" if len(pairs) == 1 else "env")
+    # Only a single bare value keeps the header on stdout; JSON, NDJSON and
+    # KEY=value lines (eval "$(kk get a/b c/d)") must stay parseable
+    print(f"[{cfg.context_header}]", file=sys.stdout if fmt == "value" and len(pairs) == 1 else sys.stderr)
+    if not pairs:
+        print("No names given (pass service/username arguments or --stdin)", file=sys.stderr)
+        sys.exit(1)
+    found = _fetch(cfg, pairs)
+
+    hits = [(svc, usr, found[(svc, usr)]) for svc, usr in pairs if (svc, usr) in found]
+    if fmt == "json":
+        print(json.dumps({f"{svc}/{usr}": val for svc, usr, val in hits}, indent=2))
+    else:
+        for svc, usr, val in hits:
+            if fmt == "ndjson":
+                print(json.dumps({"service": svc, "username": usr, "secret": val}, separators=(",", ":")))
+            elif fmt == "env":
+                print(f"{usr}={shlex.quote(val)}")
+            else:
+                print(val)
+
+    missing = [f"{svc}/{usr}" for svc, usr in pairs if (svc, usr) not in found]
+    if missing:
+        if len(pairs) == 1:
+            print("Not found", file=sys.stderr)
+        else:
+            print(f"Not found ({len(missing)}): {', '.join(missing)}", file=sys.stderr)
         sys.exit(1)
-    print(val)
@@ -1,7 +1,10 @@
+import sys
 from pathlib import Path
 from ..config import load_config
-from ..envparse import parse_env_file, extract_service_name
-from ..storage import open_store, put, has_item
+from ..envparse import EnvParseError, iter_env_file, extract_service_name
+from ..manifest import IngestManifest
+from ..scan import iter_env_files
+from ..storage import open_store, plan_changes, apply_changes, snapshot, write_lock
 
 
 def register(subparsers):
@@ -10,7 +13,25 @@ def register(subparsers):
         help="Ingest dot-env files: directory scan (.*.env) or single .env file",
     )
     p.add_argument("path", nargs="?", default=".")
-    p.add_argument("--dry-run", action="store_true")
+    p.add_argument("--dry-run", action="store_true", help="Print the plan without writing")
+    p.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete items of ingested services (in the current env) that are no longer in the files",
+    )
+    p.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Skip files/directories matching GLOB (repeatable; same syntax as .kkignore)",
+    )
+    p.add_argument("--full", action="store_true", help="Ignore the ingest manifest and re-read every file")
+    p.add_argument(
+        "--interpolate",
+        action="store_true",
+        help="Expand ${VAR} in unquoted/double-quoted values (earlier keys, then the environment)",
+    )
     p.set_defaults(func=run)
 
 
@@ -30,38 +51,88 @@ def run(args):
             print(f"Error: {args.path} is not a .env file")
             return
     elif base.is_dir():
-        # Recursive scan; only consider dot-notation .env files: .<name>.env
-        env_files = [p for p in base.rglob("*.env") if p.name.startswith(".")]
+        # Recursive scan of dot-notation .env files (.<name>.env), pruning
+        # .git, node_modules, virtualenvs, --exclude and .kkignore matches
+        env_files = list(iter_env_files(base, args.exclude))
     else:
         print(f"Error: {args.path} is not a file or directory")
         return
     if not env_files:
         print("No .env files found")
         return
-    store = open_store(cfg.namespace, cfg.store_mode)
     print(f"Found {len(env_files)} dot-env file(s):")
 
     rows = []  # Collect summary rows
+    env_tag = cfg.default_env
+    manifest = IngestManifest.load(cfg.namespace, cfg.store_mode, env_tag)
+    if args.full:
+        manifest.discard()
+    if base.is_dir():
+        manifest.prune_missing(base, {manifest.entry_key(f) for f in env_files})
+    desired = {}
+    file_keys = {}  # file -> keys it contributed, to record in the manifest
+    keep = set()  # keys of unchanged files; never pruned
+    unchanged_files = 0
+    fresh = {f for f in env_files if manifest.fresh(f)}
+    store = None
+    if fresh:
+        # The manifest records what was written, not what is still there:
+        # re-read files whose keys were deleted since (clean, remove,
+        # restore --exact). One indexed snapshot of the env answers it.
+        store = open_store(cfg.namespace, cfg.store_mode)
+        present = {(m.attrs.get("service", ""), m.attrs.get("username", "")) for m in snapshot(store, {"env": env_tag})}
+        fresh = {f for f in fresh if set(manifest.keys(f)) <= present}
     for file in sorted(env_files):
+        if file in fresh:
+            unchanged_files += 1
+            keep.update(manifest.keys(file))
+            continue
         service = extract_service_name(file.name)
-        env_tag = cfg.default_env
-        secrets = parse_env_file(file)
-        if not secrets:
+        keys = []
+        try:
+            for key, value, _line in iter_env_file(file, args.interpolate):
+                attrs = {"service": service, "username": key, "env": env_tag, "source": "ingest"}
+                desired[(service, key)] = (value, attrs)
+                keys.append(key)
+        except EnvParseError as e:
+            # Nothing has been written yet; a half-read file must not feed --prune
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        file_keys[file] = (service, keys)
+        if not keys:
             rows.append({"name": str(file), "action": "skip", "env": env_tag, "msg": "no secrets"})
-            continue
-        for key, value in secrets.items():
-            label = f"{service}/{key}"
-            attrs = {"service": service, "username": key, "env": env_tag, "source": "ingest"}
-            if args.dry_run:
-                action = "create" if not has_item(store, service, key) else "update"
-                rows.append({"name": label, "action": f"DRY-{action}", "env": env_tag, "msg": ""})
-                continue
-            try:
-                existed = has_item(store, service, key)
-                put(store, service, key, value, attrs)
-                rows.append({"name": label, "action": "updated" if existed else "created", "env": env_tag, "msg": ""})
-            except Exception as e:
-                rows.append({"name": label, "action": "error", "env": env_tag, "msg": str(e)})
+    if unchanged_files:
+        print(f"{unchanged_files} file(s) unchanged since the last ingest (use --full to re-read them)")
+
+    # One metadata snapshot per service, diffed locally; only real changes are written.
+    # The namespace write lock spans plan and apply so a concurrent set/ingest
+    # cannot create an item between our snapshot and our create.
+    plan = []
+    errors = []
+    if desired:
+        store = store or open_store(cfg.namespace, cfg.store_mode)
+        with write_lock(store):
+            plan = plan_changes(store, desired, prune={"env": env_tag} if args.prune else None, keep=keep)
+            errors = [None] * len(plan) if args.dry_run or not plan else apply_changes(store, plan)
+    done = {"create": "created", "update": "updated", "unchanged": "unchanged", "delete": "deleted"}
+    failed = set()
+    for change, err in zip(plan, errors):
+        label = f"{change.service}/{change.username}"
+        if args.dry_run:
+            rows.append({"name": label, "action": f"DRY-{change.action}", "env": env_tag, "msg": ""})
+        elif err is not None:
+            failed.add((change.service, change.username))
+            rows.append({"name": label, "action": "error", "env": env_tag, "msg": str(err)})
+        else:
+            rows.append({"name": label, "action": done[change.action], "env": env_tag, "msg": ""})
+    if not args.dry_run:
+        # Only files whose every key landed are skipped next time
+        for file, (service, keys) in file_keys.items():
+            if any((service, k) in failed for k in keys):
+                manifest.forget(file)
+            else:
+                manifest.record(file, service, keys)
+        manifest.save()
 
     # Print summary table
     if not rows:
@@ -72,7 +143,7 @@ def run(args):
     env_w = max(3, max(len(r["env"]) for r in rows))
     print(f"{'Name':<{name_w}}  {'Action':<{act_w}}  {'Env':<{env_w}}  Message")
     print("-" * (name_w + act_w + env_w + 4 + 8))
-    totals = {"created": 0, "updated": 0, "skip": 0, "error": 0}
+    totals = {"created": 0, "updated": 0, "unchanged": 0, "deleted": 0, "skip": 0, "error": 0}
     for r in rows:
         print(f"{r['name']:<{name_w}}  {r['action']:<{act_w}}  {r['env']:<{env_w}}  {r['msg']}")
         if r["action"].startswith("DRY-"):
@@ -81,5 +152,6 @@ def run(args):
             totals[r["action"]] += 1
     print("-")
     print(
-        f"Totals: created={totals['created']}, updated={totals['updated']}, skipped={totals['skip']}, errors={totals['error']}"
+        f"Totals: created={totals['created']}, updated={totals['updated']}, unchanged={totals['unchanged']}, "
+        f"deleted={totals['deleted']}, skipped={totals['skip']}, errors={totals['error']}"
     )
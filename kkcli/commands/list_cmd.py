@@ -1,26 +1,75 @@
-from argparse import ArgumentParser
-from ..config import load_config
-from ..masking import mask_secret
-from ..storage import open_store, list_items
+import sys
+
+from .. import agent
+from ..config import load_config, split_list
+from ..query import QueryError, parse_query
+from ..render import add_output_args, show
+from ..storage import open_stores, iter_items, reindex
 
 
 def register(subparsers):
     p = subparsers.add_parser("list", help="List namespace items (masked)")
     p.add_argument("--contains", dest="contains", default=None)
-    p.add_argument("--env", dest="env", default=None, help="Filter by env (overrides config)")
+    p.add_argument("-q", "--query", dest="query", default=None, help="Query, e.g. 'service:binance user:API*' (see kk search)")
+    p.add_argument("--env", dest="env", default=None, help="Filter by env, or several: dev,prod (overrides config)")
     p.add_argument("--all-envs", action="store_true", help="Do not filter by env")
+    p.add_argument("--refresh", action="store_true", help="Rebuild the local metadata index first")
+    add_output_args(p)
     p.set_defaults(func=run)
 
 
+def env_selection(args, default_env):
+    """None (all envs), one env, or a list of envs from ``--env a,b``."""
+    if args.all_envs:
+        return None
+    envs = split_list(args.env) or [default_env]
+    return envs[0] if len(envs) == 1 else envs
+
+
+def labels_for(namespaces, env_filter):
+    """Leading columns that tell merged rows apart."""
+    labels = ["kk_ns"] if len(namespaces) > 1 else []
+    if isinstance(env_filter, list):
+        labels.append("env")
+    return labels
+
+
+def fetch_rows(cfg, args, query, contains=None):
+    """Row source over every selected namespace: the agent's rows when it
+    answers for all of them, otherwise one shared connection with one
+    snapshot per namespace; rows stream namespace by namespace."""
+    namespaces = cfg.namespaces
+    env_filter = env_selection(args, None if query is not None and "env" in query.fields else cfg.default_env)
+    resps = []
+    if not args.refresh:
+        for ns in namespaces:
+            resp = agent.request(
+                "list", namespace=ns, mode=cfg.store_mode, contains=contains, query=args.query, env=env_filter
+            )
+            if resp is None:
+                break
+            resps.append(resp)
+
+    def rows():
+        if len(resps) == len(namespaces):
+            for resp in resps:
+                for r in resp["rows"]:
+                    yield dict(r, secret=agent.decode_secret(r["secret"]))
+            return
+        for store in open_stores(namespaces, cfg.store_mode):
+            if args.refresh:
+                reindex(store)
+            yield from iter_items(store, contains=contains, env=env_filter, query=query, sort=not args.no_sort)
+
+    return rows, labels_for(namespaces, env_filter)
+
+
 def run(args):
     cfg = load_config()
-    print(f"[{cfg.context_header}]")
-    store = open_store(cfg.namespace, cfg.store_mode)
-    env_filter = None if args.all_envs else (args.env or cfg.default_env)
-    rows = list_items(store, contains=args.contains, env=env_filter)
-    print(f"{'Name':<40} {'Secret (masked)'}")
-    print("-" * 80)
-    for r in rows:
-        name = r["name"]
-        masked = mask_secret(r["secret"], cfg.mask_visible_ratio)
-        print(f"{name:<40} {masked}")
+    try:
+        query = parse_query(args.query) if args.query else None
+    except QueryError as e:
+        print(f"Invalid query: {e}", file=sys.stderr)
+        sys.exit(1)
+    rows, labels = fetch_rows(cfg, args, query, contains=args.contains)
+    show(f"[{cfg.context_header}]", rows, args.fmt, args.long, cfg.mask_visible_ratio, pager=not args.no_pager, labels=labels)
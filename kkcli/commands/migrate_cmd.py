@@ -1,24 +1,77 @@
-from ..config import load_config
-from ..storage import open_store, migrate
+import json
+import sys
+from ..config import load_config, state_dir
+from ..fsutil import atomic_write
+from ..storage import open_store, migrate, same_items
 
 
 def register(subparsers):
     p = subparsers.add_parser("migrate", help="Migrate items between modes/namespaces")
-    p.add_argument("--from-mode", dest="from_mode", choices=["attribute", "collection"], default=None)
-    p.add_argument("--to-mode", dest="to_mode", choices=["attribute", "collection"], default=None)
+    p.add_argument("--from-mode", dest="from_mode", choices=["attribute", "collection", "vault"], default=None)
+    p.add_argument("--to-mode", dest="to_mode", choices=["attribute", "collection", "vault"], default=None)
     p.add_argument("--from-ns", dest="from_ns", default=None)
     p.add_argument("--to-ns", dest="to_ns", default=None)
+    p.add_argument("--batch-size", dest="batch_size", type=int, default=256, help="Items per batch (default 256)")
+    p.add_argument("--resume", action="store_true", help="Skip items finished by an interrupted run")
+    p.add_argument(
+        "--delete-source",
+        dest="delete_source",
+        action="store_true",
+        help="Delete each source item after its destination copy is verified",
+    )
     p.set_defaults(func=run)
 
 
+def _checkpoint_path(from_ns, from_mode, to_ns, to_mode):
+    return state_dir() / "migrate" / f"{from_mode}-{from_ns}__{to_mode}-{to_ns}.json"
+
+
 def run(args):
     cfg = load_config()
     from_ns = args.from_ns or cfg.namespace
     to_ns = args.to_ns or cfg.namespace
     from_mode = args.from_mode or cfg.store_mode
     to_mode = args.to_mode or cfg.store_mode
+    if (from_ns, from_mode) == (to_ns, to_mode):
+        print("Error: source and destination are the same store", file=sys.stderr)
+        sys.exit(2)
+
+    ckpt = _checkpoint_path(from_ns, from_mode, to_ns, to_mode)
+    done = set()
+    if args.resume and ckpt.exists():
+        try:
+            done = set(json.loads(ckpt.read_text()).get("done") or [])
+        except Exception:
+            print(f"Warning: ignoring unreadable checkpoint {ckpt}", file=sys.stderr)
+    elif ckpt.exists():
+        ckpt.unlink()
+
+    def on_batch(keys):
+        done.update(keys)
+        ckpt.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with atomic_write(ckpt) as f:
+            json.dump({"from": f"{from_mode}/{from_ns}", "to": f"{to_mode}/{to_ns}", "done": sorted(done)}, f)
+        print(f"... {len(done)} item(s) done", file=sys.stderr)
+
     src = open_store(from_ns, from_mode)
     dst = open_store(to_ns, to_mode)
-    moved = migrate(src, dst)
-    print(f"Migrated {moved} items from ns={from_ns},mode={from_mode} to ns={to_ns},mode={to_mode}")
-
+    if same_items(src, dst):
+        # e.g. a collection-mode namespace aliased to the default collection
+        print("Error: source and destination resolve to the same collection and namespace", file=sys.stderr)
+        sys.exit(2)
+    stats = migrate(
+        src, dst, batch=max(1, args.batch_size), done=done, on_batch=on_batch, delete_source=args.delete_source
+    )
+    for err in stats.errors:
+        print(f"Error: {err}", file=sys.stderr)
+    moved = stats.copied + stats.unchanged
+    print(
+        f"Migrated {moved} items from ns={from_ns},mode={from_mode} to ns={to_ns},mode={to_mode} "
+        f"(copied={stats.copied}, unchanged={stats.unchanged}, resumed={stats.resumed}, "
+        f"deleted_source={stats.deleted}, failed={stats.failed})"
+    )
+    if stats.failed:
+        print(f"Checkpoint kept at {ckpt}; re-run with --resume to retry the rest", file=sys.stderr)
+        sys.exit(1)
+    if ckpt.exists():
+        ckpt.unlink()
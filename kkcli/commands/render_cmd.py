@@ -0,0 +1,63 @@
+import shutil
+import sys
+import tempfile
+from ..config import load_config
+from ..fsutil import atomic_write
+from ..template import TemplateError, missing_report, references, render
+from .get_cmd import _fetch
+
+
+def register(subparsers):
+    p = subparsers.add_parser("render", help="Fill {{kk:service/username}} placeholders in a template")
+    p.add_argument("template", help="Template file ('-' for stdin)")
+    p.add_argument("-o", "--output", dest="output", default=None,
+                   help="Write here atomically instead of stdout (created with --mode)")
+    p.add_argument("--mode", dest="mode", default="600", help="Octal permissions of the output file (default: 600)")
+    p.set_defaults(func=run)
+
+
+def _open_template(path):
+    """The template as a seekable text file; stdin is spooled (to disk past 4 MiB)."""
+    if path != "-":
+        return open(path, newline="")
+    spool = tempfile.SpooledTemporaryFile(max_size=1 << 22, mode="w+", newline="")
+    shutil.copyfileobj(sys.stdin, spool)
+    spool.seek(0)
+    return spool
+
+
+def run(args):
+    cfg = load_config()
+    # The rendered text may go to stdout, so the context header goes to stderr
+    print(f"[{cfg.context_header}]", file=sys.stderr)
+    try:
+        mode = int(args.mode, 8)
+    except ValueError:
+        print(f"Invalid --mode '{args.mode}' (expected octal, e.g. 600)", file=sys.stderr)
+        sys.exit(1)
+    try:
+        src = _open_template(args.template)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    with src:
+        # Pass 1: collect references; nothing is fetched or written on a bad placeholder
+        try:
+            refs = references(src)
+        except TemplateError as e:
+            print(f"Error: {args.template}: {e}", file=sys.stderr)
+            sys.exit(1)
+        values = _fetch(cfg, list(refs)) if refs else {}
+        missing = missing_report(refs, values)
+        if missing:
+            print(f"Not found ({len(missing)}): {', '.join(missing)}", file=sys.stderr)
+            sys.exit(1)
+        # Pass 2: substitute while streaming to the output
+        src.seek(0)
+        if args.output is None or args.output == "-":
+            render(src, sys.stdout, values)
+            sys.stdout.flush()
+            return
+        with atomic_write(args.output, mode=mode) as out:
+            count = render(src, out, values)
+    print(f"Rendered {count} placeholder(s) ({len(refs)} secret(s)) to {args.output}", file=sys.stderr)
@@ -0,0 +1,67 @@
+import base64
+import sys
+from pathlib import Path
+from ..config import load_config
+from ..storage import Change, apply_changes, open_store, plan_changes, snapshot, write_lock
+from ..snapshot import Repo, SnapshotError, default_dir, iter_records
+
+# Refreshed on write; restoring them would only make items look changed
+_SKIP_ATTRS = {"updated_at"}
+
+
+def register(subparsers):
+    p = subparsers.add_parser("restore", help="Restore the namespace from a snapshot")
+    p.add_argument("snapshot", nargs="?", default="latest", help="Snapshot id or unique prefix (default: latest)")
+    p.add_argument("--dir", dest="dir", default=None, help="Snapshot repository (default: $XDG_DATA_HOME/kk/snapshots/<ns>)")
+    p.add_argument("--exact", action="store_true", help="Also delete namespace items that are not in the snapshot")
+    p.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+    p.set_defaults(func=run)
+
+
+def run(args):
+    cfg = load_config()
+    print(f"[{cfg.context_header}]")
+    root = Path(args.dir).expanduser() if args.dir else default_dir(cfg.namespace)
+    desired = {}
+    try:
+        repo = Repo.open(root)
+        manifest = repo.load_manifest(args.snapshot)
+        for r in iter_records(repo, manifest):
+            attrs = {k: v for k, v in r["attrs"].items() if k not in _SKIP_ATTRS}
+            desired[(r["service"], r["username"])] = (base64.b64decode(r["secret"]).decode(errors="ignore"), attrs)
+    except SnapshotError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if manifest.namespace != cfg.namespace:
+        print(f"Restoring snapshot of namespace '{manifest.namespace}' into '{cfg.namespace}'")
+
+    store = open_store(cfg.namespace, cfg.store_mode)
+    with write_lock(store):
+        _restore(args, store, manifest, desired)
+
+
+def _restore(args, store, manifest, desired):
+    # Same bulk path as ingest: one snapshot per service, batched writes
+    plan = plan_changes(store, desired) if desired else []
+    if args.exact:
+        for meta in snapshot(store):
+            key = (meta.attrs.get("service", ""), meta.attrs.get("username", ""))
+            if key not in desired:
+                plan.append(Change("delete", key[0], key[1], existing=meta))
+    totals = {"create": 0, "update": 0, "unchanged": 0, "delete": 0}
+    for change in plan:
+        totals[change.action] += 1
+    summary = ", ".join(f"{k}={v}" for k, v in totals.items())
+    if args.dry_run:
+        for change in plan:
+            if change.action != "unchanged":
+                print(f"DRY-{change.action:<7} {change.service}/{change.username}")
+        print(f"Snapshot {manifest.id}: {summary} (dry run)")
+        return
+    errors = apply_changes(store, plan)
+    failed = [(c, e) for c, e in zip(plan, errors) if e is not None]
+    for change, err in failed:
+        print(f"Error: {change.service}/{change.username}: {err}", file=sys.stderr)
+    print(f"Restored snapshot {manifest.id}: {summary}, errors={len(failed)}")
+    if failed:
+        sys.exit(1)
@@ -1,25 +1,27 @@
+import sys
+
 from ..config import load_config
-from ..masking import mask_secret
-from ..storage import open_store, list_items
+from ..query import QueryError, parse_query
+from ..render import add_output_args, show
+from .list_cmd import fetch_rows
 
 
 def register(subparsers):
     p = subparsers.add_parser("search", help="Search items in namespace (masked)")
-    p.add_argument("query")
-    p.add_argument("--env", dest="env", default=None, help="Filter by env (overrides config)")
+    p.add_argument("query", help="Free text, /regex/, or field terms like service:binance env:prod user:API*")
+    p.add_argument("--env", dest="env", default=None, help="Filter by env, or several: dev,prod (overrides config)")
     p.add_argument("--all-envs", action="store_true", help="Do not filter by env")
+    p.add_argument("--refresh", action="store_true", help="Rebuild the local metadata index first")
+    add_output_args(p)
     p.set_defaults(func=run)
 
 
 def run(args):
     cfg = load_config()
-    print(f"[{cfg.context_header}]")
-    store = open_store(cfg.namespace, cfg.store_mode)
-    env_filter = None if args.all_envs else (args.env or cfg.default_env)
-    rows = list_items(store, contains=args.query, env=env_filter)
-    print(f"{'Name':<40} {'Secret (masked)'}")
-    print("-" * 80)
-    for r in rows:
-        name = r["name"]
-        masked = mask_secret(r["secret"], cfg.mask_visible_ratio)
-        print(f"{name:<40} {masked}")
+    try:
+        query = parse_query(args.query)
+    except QueryError as e:
+        print(f"Invalid query: {e}", file=sys.stderr)
+        sys.exit(1)
+    rows, labels = fetch_rows(cfg, args, query)
+    show(f"[{cfg.context_header}]", rows, args.fmt, args.long, cfg.mask_visible_ratio, pager=not args.no_pager, labels=labels)
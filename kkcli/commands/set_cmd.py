@@ -1,4 +1,5 @@
 import getpass
+from .. import agent
 from ..config import load_config
 from ..naming import parse_name
 from ..storage import open_store, put
@@ -19,10 +20,14 @@ def run(args):
     val = args.value
     if val is None:
         val = getpass.getpass("Enter secret: ")
-    store = open_store(cfg.namespace, cfg.store_mode)
     extra = {"source": "cli"}
     if args.env:
         extra["env"] = args.env
-    put(store, svc, usr, val, extra)
+    resp = agent.request(
+        "put", namespace=cfg.namespace, mode=cfg.store_mode, service=svc, username=usr, secret=val, attrs=extra
+    )
+    if resp is None:
+        store = open_store(cfg.namespace, cfg.store_mode)
+        put(store, svc, usr, val, extra)
     print(f"OK: {svc}/{usr}")
 
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+from ..config import load_config
+from ..storage import open_store
+from ..snapshot import Repo, SnapshotError, default_dir, take_snapshot
+
+
+def register(subparsers):
+    p = subparsers.add_parser("snapshot", help="Take an incremental encrypted snapshot of the namespace")
+    p.add_argument("--dir", dest="dir", default=None, help="Snapshot repository (default: $XDG_DATA_HOME/kk/snapshots/<ns>)")
+    p.add_argument("--full", action="store_true", help="Re-read every secret instead of trusting updated_at")
+    p.add_argument("--list", dest="list", action="store_true", help="List snapshots in the repository and exit")
+    p.set_defaults(func=run)
+
+
+def run(args):
+    cfg = load_config()
+    print(f"[{cfg.context_header}]")
+    root = Path(args.dir).expanduser() if args.dir else default_dir(cfg.namespace)
+    try:
+        if args.list:
+            repo = Repo.open(root)
+            for mid in repo.manifest_ids():
+                m = repo.load_manifest(mid)
+                print(f"{m.id}  ns={m.namespace}  items={len(m.items)}")
+            return
+        repo = Repo.open(root, create=True)
+        store = open_store(cfg.namespace, cfg.store_mode)
+        stats = take_snapshot(store, repo, full=args.full)
+    except SnapshotError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if stats.id is None:
+        print(f"No changes since snapshot {stats.previous} ({stats.items} item(s), {stats.reread} re-read)")
+        return
+    print(
+        f"Snapshot {stats.id}: {stats.items} item(s), {stats.reread} re-read, {stats.changed} changed, "
+        f"{stats.segments} segment(s), {stats.bytes_written} byte(s) written to {root}"
+    )
@@ -0,0 +1,50 @@
+import signal
+import sys
+from ..config import load_config
+from ..storage import open_store
+from ..watch import EnvFileSink, HookSink, LogSink, Watcher
+
+
+def register(subparsers):
+    p = subparsers.add_parser("watch", help="Follow keyring changes and sync them to env files, logs or hooks")
+    p.add_argument("--env-file", dest="env_files", action="append", default=[], metavar="PATH",
+                   help="Keep PATH (0600, atomic rewrites) equal to 'kk export --format env' (repeatable)")
+    p.add_argument("--log", dest="logs", action="append", default=[], metavar="PATH",
+                   help="Append one NDJSON record per change, without secret values (repeatable)")
+    p.add_argument("--exec", dest="hooks", action="append", default=[], metavar="CMD",
+                   help="Run shell CMD per change with KK_EVENT/KK_NS/KK_SERVICE/KK_USERNAME/KK_ENV set (repeatable)")
+    p.add_argument("--env", dest="env", default=None, help="Filter by env (overrides config)")
+    p.add_argument("--all-envs", action="store_true", help="Do not filter by env")
+    p.add_argument("--debounce", type=float, default=0.2, help="Seconds to gather a burst of changes (default 0.2)")
+    p.add_argument("-v", "--verbose", action="store_true", help="Print each change to stderr")
+    p.set_defaults(func=run)
+
+
+def run(args):
+    cfg = load_config()
+    print(f"[{cfg.context_header}]")
+    sinks = [EnvFileSink(p) for p in args.env_files] + [LogSink(p) for p in args.logs] + [HookSink(c) for c in args.hooks]
+    if not sinks:
+        print("Nothing to do: give at least one --env-file, --log or --exec", file=sys.stderr)
+        sys.exit(1)
+    env_filter = None if args.all_envs else (args.env or cfg.default_env)
+    store = open_store(cfg.namespace, cfg.store_mode)
+    watcher = Watcher(store, sinks, env=env_filter, debounce=args.debounce)
+
+    def report(events):
+        if args.verbose:
+            for ev in events:
+                a = ev.meta.attrs
+                print(f"{ev.kind:<8} {a.get('service')}/{a.get('username')}", file=sys.stderr)
+
+    # Stopping from a service manager (SIGTERM) exits like Ctrl-C, so atexit
+    # handlers (e.g. the --profile report) still run
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        # Subscribe before the initial read so no change falls in between
+        with watcher.subscribed():
+            count = watcher.start()
+            print(f"Watching {count} item(s) in namespace '{cfg.namespace}' (env {env_filter or 'ALL'}); Ctrl-C to stop", file=sys.stderr)
+            watcher.run(report)
+    except KeyboardInterrupt:
+        return 0
@@ -1,32 +1,57 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
-try:
-    import tomllib  # Python 3.11+
-except Exception:  # pragma: no cover
+
+def _tomllib():
+    # Imported lazily: most invocations have no config file to parse
     try:
-        import tomli as tomllib  # type: ignore
-    except Exception:
-        tomllib = None  # type: ignore
+        import tomllib  # Python 3.11+
+    except Exception:  # pragma: no cover
+        try:
+            import tomli as tomllib  # type: ignore
+        except Exception:
+            return None
+    return tomllib
 
 
 @dataclass
 class Config:
     namespace: str = "ss"
-    store_mode: str = "attribute"  # or "collection"
+    store_mode: str = "attribute"  # or "collection" / "vault"
     default_env: str = "dev"
     mask_visible_ratio: float = 0.35
+    vault_path: Optional[str] = None  # store_mode = "vault"; default under XDG_DATA_HOME
+    vault_keyfile: Optional[str] = None
+    # store_mode = "collection": namespace -> collection object path (or
+    # Secret Service alias name) to use instead of looking up "kk:<ns>"
+    collections: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def namespaces(self) -> List[str]:
+        """``namespace`` may list several (``--ns a,b,c``) for list/search/export."""
+        return split_list(self.namespace) or [self.namespace]
 
     @property
     def context_header(self) -> str:
         return f"ns={self.namespace}, mode={self.store_mode}, env={self.default_env}"
 
 
+def split_list(value: Optional[str]) -> List[str]:
+    """Comma-separated values, stripped, empty and repeated ones dropped."""
+    out: List[str] = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if part and part not in out:
+            out.append(part)
+    return out
+
+
 def _from_toml(path: Path) -> dict:
     if not path.exists() or not path.is_file():
         return {}
+    tomllib = _tomllib()
     if tomllib is None:
         return {}
     try:
@@ -37,6 +62,14 @@ def _from_toml(path: Path) -> dict:
         return {}
 
 
+def state_dir() -> Path:
+    """Per-user state directory for kk caches (created 0700 on first use)."""
+    base = os.environ.get("XDG_STATE_HOME") or str(Path.home() / ".local" / "state")
+    path = Path(base) / "kk"
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
+
+
 def load_config() -> Config:
     # Defaults
     cfg = Config()
@@ -51,6 +84,12 @@ def load_config() -> Config:
             cfg.namespace = str(kk.get("namespace", cfg.namespace))
             cfg.store_mode = str(kk.get("store_mode", cfg.store_mode))
             cfg.default_env = str(kk.get("default_env", cfg.default_env))
+            if kk.get("vault_path"):
+                cfg.vault_path = str(kk["vault_path"])
+            if kk.get("vault_keyfile"):
+                cfg.vault_keyfile = str(kk["vault_keyfile"])
+            if isinstance(kk.get("collections"), dict):
+                cfg.collections = {str(k): str(v) for k, v in kk["collections"].items()}
             try:
                 cfg.mask_visible_ratio = float(kk.get("mask_visible_ratio", cfg.mask_visible_ratio))
             except Exception:
@@ -60,6 +99,8 @@ def load_config() -> Config:
     cfg.namespace = os.environ.get("KK_NAMESPACE", cfg.namespace)
     cfg.store_mode = os.environ.get("KK_STORE_MODE", cfg.store_mode)
     cfg.default_env = os.environ.get("KK_DEFAULT_ENV", cfg.default_env)
+    cfg.vault_path = os.environ.get("KK_VAULT_PATH") or cfg.vault_path
+    cfg.vault_keyfile = os.environ.get("KK_VAULT_KEYFILE") or cfg.vault_keyfile
     try:
         ratio_env = os.environ.get("KK_MASK_VISIBLE_RATIO")
         if ratio_env:
@@ -68,6 +109,6 @@ def load_config() -> Config:
         pass
 
     # Normalize store_mode
-    if cfg.store_mode not in ("attribute", "collection"):
+    if cfg.store_mode not in ("attribute", "collection", "vault"):
         cfg.store_mode = "attribute"
     return cfg
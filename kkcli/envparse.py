@@ -1,23 +1,143 @@
+"""Streaming dotenv tokenizer.
+
+:func:`iter_env` reads a dotenv stream once, line by line, and yields
+``(key, value, line)`` tuples where ``line`` is the 1-based line the entry
+starts on. Supported grammar:
+
+    # comment                 blank lines and full-line comments are skipped
+    export KEY=value          optional ``export`` prefix
+    KEY=value  # comment      unquoted: trimmed, `` #`` starts a comment
+    KEY='literal $value'      single quotes: no escapes, no interpolation
+    KEY="a\\nb ${OTHER}"       double quotes: \\n \\t \\r \\" \\\\ \\$ escapes
+    KEY="spans                 quoted values may span lines
+    several lines"
+
+With ``interpolate=True``, ``${VAR}`` and ``${VAR:-default}`` in unquoted
+and double-quoted values expand to keys defined earlier in the same file,
+then to ``environ``; unknown names expand to the default (or ""). Only
+then are earlier values retained; otherwise memory is bounded by one entry.
+Malformed input raises :class:`EnvParseError` carrying the line number.
+"""
+import os
+import re
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+_ASSIGN_RE = re.compile(r"[ \t]*(?:export[ \t]+)?([^\s=#'\"]+)[ \t]*=[ \t]*")
+_COMMENT_RE = re.compile(r"[ \t]+#")
+_TRAILER_RE = re.compile(r"[ \t]*(?:#.*)?$")
+_DQ_CHUNK_RE = re.compile(r'[^"\\$]*')
+_SQ_CHUNK_RE = re.compile(r"[^']*")
+_VAR_RE = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)(?::-([^}]*))?\}")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\", "$": "$"}
+
+
+class EnvParseError(ValueError):
+    def __init__(self, line: int, msg: str, path: Optional[Path] = None):
+        self.line = line
+        self.msg = msg
+        self.path = path
+        where = f"{path}:{line}" if path is not None else f"line {line}"
+        super().__init__(f"{where}: {msg}")
+
 
+def iter_env(
+    lines: Iterable[str],
+    interpolate: bool = False,
+    environ: Optional[Mapping[str, str]] = None,
+) -> Iterator[Tuple[str, str, int]]:
+    """Tokenize dotenv ``lines`` (any iterable of text lines, e.g. an open file)."""
+    env = os.environ if environ is None else environ
+    seen: Dict[str, str] = {}
 
-def parse_env_file(path: Path) -> Dict[str, str]:
-    secrets: Dict[str, str] = {}
-    with path.open('r') as f:
-        for raw in f:
-            line = raw.strip()
-            if not line or line.startswith('#') or '=' not in line:
+    def expand(m: "re.Match") -> str:
+        name, default = m.group(1), m.group(2)
+        val = seen.get(name)
+        if val is None:
+            val = env.get(name)
+        return val if val else (default or "")
+
+    it = iter(lines)
+    lineno = 0
+    for raw in it:
+        lineno += 1
+        line = raw.rstrip("\r\n")
+        if lineno == 1 and line.startswith("\ufeff"):
+            line = line[1:]
+        m = _ASSIGN_RE.match(line)
+        if m is None:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
                 continue
-            k, v = line.split('=', 1)
-            k, v = k.strip(), v.strip()
-            if v.startswith('"') and v.endswith('"') and len(v) >= 2:
-                v = v[1:-1]
-            elif v.startswith("'") and v.endswith("'") and len(v) >= 2:
-                v = v[1:-1]
-            if k:
-                secrets[k] = v
-    return secrets
+            raise EnvParseError(lineno, "expected KEY=VALUE")
+        key, start, pos = m.group(1), lineno, m.end()
+        quote = line[pos:pos + 1]
+        if quote == '"' or quote == "'":
+            parts: List[str] = []
+            chunk_re = _DQ_CHUNK_RE if quote == '"' else _SQ_CHUNK_RE
+            pos += 1
+            while True:
+                c = chunk_re.match(line, pos)
+                parts.append(c.group())
+                pos = c.end()
+                if pos == len(line):
+                    # Value continues on the next line
+                    nxt = next(it, None)
+                    if nxt is None:
+                        raise EnvParseError(start, f"unterminated {quote} quote for {key}")
+                    lineno += 1
+                    parts.append("\n")
+                    line, pos = nxt.rstrip("\r\n"), 0
+                    continue
+                ch = line[pos]
+                if ch == quote:
+                    pos += 1
+                    break
+                if ch == "\\":
+                    esc = line[pos + 1:pos + 2]
+                    if esc in _ESCAPES:
+                        parts.append(_ESCAPES[esc])
+                        pos += 2
+                    else:
+                        parts.append("\\")
+                        pos += 1
+                    continue
+                # ch == "$"
+                v = _VAR_RE.match(line, pos) if interpolate else None
+                if v is None:
+                    parts.append("$")
+                    pos += 1
+                else:
+                    parts.append(expand(v))
+                    pos = v.end()
+            value = "".join(parts)
+            if _TRAILER_RE.match(line, pos) is None:
+                raise EnvParseError(lineno, f"unexpected text after closing quote for {key}")
+        else:
+            rest = line[pos:]
+            c = _COMMENT_RE.search(rest)
+            value = (rest[:c.start()] if c else rest).rstrip()
+            if interpolate and "${" in value:
+                value = _VAR_RE.sub(expand, value)
+        if interpolate:
+            seen[key] = value
+        yield key, value, start
+
+
+def iter_env_file(
+    path: Path, interpolate: bool = False, environ: Optional[Mapping[str, str]] = None
+) -> Iterator[Tuple[str, str, int]]:
+    """:func:`iter_env` over a file; errors carry the file path."""
+    with path.open("r", encoding="utf-8", newline="") as f:
+        try:
+            yield from iter_env(f, interpolate, environ)
+        except EnvParseError as e:
+            raise EnvParseError(e.line, e.msg, path) from None
+
+
+def parse_env_file(path: Path, interpolate: bool = False) -> Dict[str, str]:
+    """All entries of an env file as a dict; later duplicates win."""
+    return {k: v for k, v, _ in iter_env_file(path, interpolate)}
 
 
 def extract_service_name(filename: str) -> str:
@@ -27,4 +147,3 @@ def extract_service_name(filename: str) -> str:
     if name.endswith('.env'):
         name = name[:-4]
     return name
-
@@ -0,0 +1,183 @@
+"""Local metadata index so list/search don't read every item's attributes.
+
+The index maps item object paths to their label and attributes for one
+(namespace, store mode, collection). It never holds secret values. Reads
+reconcile it against a single SearchItems call: vanished paths are dropped
+and only new paths have their metadata fetched. Writes made through the
+storage layer update it in place.
+
+Reconciling compares paths only: reading every item's ``updated_at`` would
+cost the GetAll per item the index exists to avoid. Attribute changes made
+by other kk processes are picked up through the file itself: its stamp
+(mtime, size, inode) is recorded on load and re-checked before each read
+(``refresh``), and a save merges this process's changes into whatever
+another process wrote in the meantime. Edits made with other tools stay
+invisible until ``--refresh`` rebuilds the index.
+"""
+import atexit
+import json
+import os
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import state_dir
+
+INDEX_VERSION = 1
+
+# What identifies one version of the index file on disk
+_Stamp = Optional[Tuple[int, int, int]]
+
+
+def enabled() -> bool:
+    return os.environ.get("KK_INDEX", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class MetaIndex:
+    def __init__(self, path: Path, collection: str):
+        self.path = path
+        self.collection = collection
+        self.entries: Dict[str, dict] = {}  # item path -> {"label": str, "attrs": {...}}
+        self._pending = False
+        self.reconciled = False
+        self._stamp: _Stamp = None  # file version ``entries`` were read from
+        self._changes: Dict[str, Optional[dict]] = {}  # unsaved puts (None: dropped)
+        self._exit_hook = False  # flush() registered with atexit (once per instance)
+
+    @classmethod
+    def load(cls, namespace: str, mode: str, collection: str) -> "MetaIndex":
+        idx = cls(state_dir() / "index" / f"{mode}-{namespace}.json", collection)
+        idx._stamp, idx.entries = idx._read()
+        return idx
+
+    def _file_stamp(self) -> _Stamp:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _read(self) -> Tuple[_Stamp, Dict[str, dict]]:
+        stamp = self._file_stamp()
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") == INDEX_VERSION and data.get("collection") == self.collection:
+                return stamp, dict(data.get("items") or {})
+        except Exception:
+            pass
+        return stamp, {}
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive flock so read-merge-write and read-unlink are atomic
+        with respect to other kk processes."""
+        import fcntl
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(str(self.path) + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _merge_disk(self) -> None:
+        # Another process saved since we read: take its entries, replay ours
+        self._stamp, self.entries = self._read()
+        for p, entry in self._changes.items():
+            if entry is None:
+                self.entries.pop(p, None)
+            else:
+                self.entries[p] = entry
+
+    def refresh(self) -> bool:
+        """Re-read the file if another process changed it since we read or
+        wrote it (this process's unsaved changes are kept); True if it did.
+        A file that vanished (another writer mid-batch, or a crash) empties
+        the index, so the next reconcile rebuilds it from the keyring."""
+        if self._file_stamp() == self._stamp:
+            return False
+        self._merge_disk()
+        self.reconciled = False
+        return True
+
+    def reconcile(self, paths: Iterable[str], fetch: Callable[[List[str]], Dict[str, Tuple[str, Dict[str, str]]]]) -> None:
+        """Sync with the current item paths; ``fetch`` maps new paths to (label, attrs)."""
+        paths = list(paths)
+        current = set(paths)
+        changed = False
+        for p in [p for p in self.entries if p not in current]:
+            del self.entries[p]
+            self._changes[p] = None
+            changed = True
+        new = [p for p in paths if p not in self.entries]
+        if new:
+            for p, (label, attrs) in fetch(new).items():
+                self.entries[p] = self._changes[p] = {"label": label, "attrs": dict(attrs)}
+                changed = True
+        self.reconciled = True
+        if changed and not self._pending:
+            self.save()
+
+    def put(self, path: str, label: str, attrs: Dict[str, str]) -> None:
+        self._mutating()
+        self.entries[path] = self._changes[path] = {"label": label, "attrs": dict(attrs)}
+
+    def drop(self, path: str) -> None:
+        self._mutating()
+        self.entries.pop(path, None)
+        self._changes[path] = None
+
+    def _mutating(self) -> None:
+        # Remove the on-disk copy before the first write so a crash mid-batch
+        # forces a rebuild instead of leaving stale attributes behind; the
+        # updated index is written once at exit. A newer file from another
+        # process is merged first so its changes are not lost with it.
+        if self._pending:
+            return
+        self._pending = True
+        with self._locked():
+            if self._file_stamp() != self._stamp:
+                self._merge_disk()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        self._stamp = None
+        if not self._exit_hook:
+            # Once per instance: long-lived processes (agent, watch) start a
+            # new pending period with every write they flush
+            atexit.register(self.flush)
+            self._exit_hook = True
+
+    def save(self) -> None:
+        with self._locked():
+            if self._file_stamp() not in (None, self._stamp):
+                self._merge_disk()
+            data = {"version": INDEX_VERSION, "collection": self.collection, "items": self.entries}
+            fd, tmp = tempfile.mkstemp(dir=str(self.path.parent), prefix=".index-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+                self._stamp = self._file_stamp()
+            except Exception:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+        self._changes.clear()
+        self._pending = False
+
+    def flush(self) -> None:
+        """Write pending changes now (long-lived processes; others save at exit)."""
+        if self._pending:
+            self.save()
+
+    def discard(self) -> None:
+        self.entries = {}
+        self._changes.clear()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
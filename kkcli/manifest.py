@@ -0,0 +1,121 @@
+"""Ingest manifest: which env files were already ingested, and as what.
+
+One file per (store mode, namespace, env) under ``state_dir()/ingest``, named
+from the three parts percent-encoded (dashes too) and joined by dashes. Each
+entry records a source file's mtime, size and SHA-256 plus the service and
+key names it produced (never values). A file whose mtime and size match is
+skipped without being read, as long as its keys still exist in the store
+(the ingest command checks); if only the mtime moved, the content hash
+decides. Entries are only recorded after all of a file's changes applied.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+from urllib.parse import quote
+
+from .config import state_dir
+from .fsutil import atomic_write
+
+MANIFEST_VERSION = 1
+
+
+def _name_part(s: str) -> str:
+    # "-" separates the parts, so it must not occur inside one
+    return quote(s, safe="").replace("-", "%2D")
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class IngestManifest:
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, dict] = {}  # absolute file path -> entry
+        self._stats: Dict[str, Tuple[int, int]] = {}  # stat taken before reading
+        self._digests: Dict[str, str] = {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, namespace: str, mode: str, env: str) -> "IngestManifest":
+        name = "-".join(_name_part(p) for p in (mode, namespace, env))
+        m = cls(state_dir() / "ingest" / f"{name}.json")
+        try:
+            data = json.loads(m.path.read_text())
+            if data.get("version") == MANIFEST_VERSION:
+                m.entries = dict(data.get("files") or {})
+        except Exception:
+            pass
+        return m
+
+    @staticmethod
+    def entry_key(path: Path) -> str:
+        return str(path.resolve())
+
+    def fresh(self, path: Path) -> bool:
+        """True if ``path`` is unchanged since it was last recorded. Otherwise
+        the content is hashed now, before the caller parses it."""
+        key = self.entry_key(path)
+        st = path.stat()
+        self._stats[key] = (st.st_mtime_ns, st.st_size)
+        entry = self.entries.get(key)
+        if entry is not None and (entry["mtime_ns"], entry["size"]) == (st.st_mtime_ns, st.st_size):
+            return True
+        digest = self._digests[key] = file_digest(path)
+        if entry is None or entry["size"] != st.st_size or entry["sha256"] != digest:
+            return False
+        entry["mtime_ns"] = st.st_mtime_ns  # touched but identical
+        self._dirty = True
+        return True
+
+    def keys(self, path: Path) -> List[Tuple[str, str]]:
+        entry = self.entries.get(self.entry_key(path)) or {}
+        return [(entry.get("service", ""), k) for k in entry.get("keys") or []]
+
+    def record(self, path: Path, service: str, keys: Iterable[str]) -> None:
+        key = self.entry_key(path)
+        if key not in self._stats:
+            self.fresh(path)
+        if key not in self._digests:
+            # fresh() skips hashing when mtime and size match
+            self._digests[key] = file_digest(path)
+        mtime_ns, size = self._stats[key]
+        digest = self._digests[key]
+        self.entries[key] = {
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "sha256": digest,
+            "service": service,
+            "keys": sorted(keys),
+        }
+        self._dirty = True
+
+    def forget(self, path: Path) -> None:
+        if self.entries.pop(self.entry_key(path), None) is not None:
+            self._dirty = True
+
+    def prune_missing(self, base: Path, seen: Set[str]) -> None:
+        """Drop entries under ``base`` for files the scan no longer found."""
+        prefix = str(base.resolve()).rstrip(os.sep) + os.sep
+        for key in [k for k in self.entries if k.startswith(prefix) and k not in seen]:
+            del self.entries[key]
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with atomic_write(self.path) as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f)
+        self._dirty = False
+
+    def discard(self) -> None:
+        self.entries = {}
+        self._dirty = True
+
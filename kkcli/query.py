@@ -0,0 +1,117 @@
+"""Small query language for list/search.
+
+    service:binance env:prod user:API*   field terms (exact, glob or /regex/)
+    binance                              free text, substring of service/user/label/env
+    /^api_.*key$/                        regex matching any one of those fields
+
+Quotes group words ("my label"); backslashes are kept as typed, so regexes
+like user:/^KEY_\\d+$/ need no extra escaping.
+
+Terms are ANDed. Exact field terms become Secret Service attributes and are
+pushed into the item search; globs, regexes and free text are evaluated on
+item metadata afterwards, before any secret is fetched.
+"""
+import re
+import shlex
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, List, Optional
+
+# Friendly names for attributes; any other "key:value" uses key as-is
+FIELD_ALIASES = {
+    "svc": "service",
+    "service": "service",
+    "user": "username",
+    "username": "username",
+    "key": "username",
+    "env": "env",
+    "source": "source",
+    "ns": "kk_ns",
+}
+
+_GLOB_CHARS = set("*?[")
+_FIELD_RE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*):(.*)$")
+
+
+class QueryError(ValueError):
+    pass
+
+
+@dataclass
+class Query:
+    attrs: Dict[str, str] = field(default_factory=dict)  # exact matches, pushed down
+    predicates: List[Callable[[Dict[str, str], str], bool]] = field(default_factory=list)
+    fields: set = field(default_factory=set)  # every attribute the query constrains
+    impossible: bool = False  # contradictory exact terms, e.g. env:dev env:prod
+
+    def matches(self, attrs: Dict[str, str], label: str) -> bool:
+        return not self.impossible and all(pred(attrs, label) for pred in self.predicates)
+
+
+def _text_fields(attrs: Dict[str, str], label: str) -> List[str]:
+    return [attrs.get("service", ""), attrs.get("username", ""), label, attrs.get("env", "")]
+
+
+def _haystack(attrs: Dict[str, str], label: str) -> str:
+    return " ".join(_text_fields(attrs, label))
+
+
+def _regex(pattern: str) -> "re.Pattern":
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise QueryError(f"Bad regex /{pattern}/: {e}") from e
+
+
+def _text_predicate(term: str) -> Callable[[Dict[str, str], str], bool]:
+    if len(term) >= 2 and term.startswith("/") and term.endswith("/"):
+        rx = _regex(term[1:-1])
+        # Per field, so ^ and $ anchor to a field rather than the joined text
+        return lambda attrs, label: any(rx.search(v) is not None for v in _text_fields(attrs, label))
+    needle = term.lower()
+    return lambda attrs, label: needle in _haystack(attrs, label).lower()
+
+
+def _field_predicate(name: str, value: str) -> Optional[Callable[[Dict[str, str], str], bool]]:
+    if len(value) >= 2 and value.startswith("/") and value.endswith("/"):
+        rx = _regex(value[1:-1])
+        return lambda attrs, label: rx.search(attrs.get(name, "")) is not None
+    if _GLOB_CHARS & set(value):
+        return lambda attrs, label: fnmatchcase(attrs.get(name, ""), value)
+    return None  # exact: pushed down
+
+
+def _split(text: str) -> List[str]:
+    """Split on whitespace honouring quotes, like shlex.split but without
+    POSIX backslash escapes, which would eat regex escapes such as \\d."""
+    lexer = shlex.shlex(text, posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ""
+    lexer.commenters = ""
+    return list(lexer)
+
+
+def parse_query(text: Optional[str]) -> Query:
+    q = Query()
+    if not text:
+        return q
+    try:
+        terms = _split(text)
+    except ValueError as e:
+        raise QueryError(str(e)) from e
+    for term in terms:
+        m = _FIELD_RE.match(term)
+        if not m:
+            q.predicates.append(_text_predicate(term))
+            continue
+        name = FIELD_ALIASES.get(m.group(1).lower(), m.group(1))
+        value = m.group(2)
+        q.fields.add(name)
+        pred = _field_predicate(name, value)
+        if pred is not None:
+            q.predicates.append(pred)
+        elif name in q.attrs and q.attrs[name] != value:
+            q.impossible = True
+        else:
+            q.attrs[name] = value
+    return q
@@ -0,0 +1,182 @@
+"""Row output shared by ``list`` and ``search``: table, JSON or NDJSON.
+
+Rows are written as they arrive from ``storage.iter_items`` (one batch of
+secrets at a time), so the first rows show up after a single GetSecrets
+call instead of after the whole namespace has been read. Table columns are
+sized from the first batch; later rows that are wider simply push the
+secret column over. Cells (masking included) are computed per row and only
+for the columns being printed. Tables go through a pager when stdout is a
+terminal.
+"""
+import json
+import os
+import shlex
+import subprocess
+import sys
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+from .masking import mask_secret
+
+FORMATS = ("table", "json", "ndjson")
+# Rows buffered to size table columns; matches iter_items' secret batch
+SIZE_SAMPLE = 256
+_MAX_WIDTH = 60
+_METADATA_COLUMNS = ["env", "source", "updated_at"]
+
+
+def add_output_args(p) -> None:
+    p.add_argument("--format", dest="fmt", choices=FORMATS, default="table", help="Output format (default: table)")
+    p.add_argument("-l", "--long", action="store_true", help="Also show env, source and updated_at")
+    p.add_argument("--no-sort", dest="no_sort", action="store_true", help="Keep keyring order (skip sorting)")
+    p.add_argument("--no-pager", dest="no_pager", action="store_true", help="Never pipe the table through a pager")
+
+
+def _cell(column: str, row: dict, ratio: float) -> str:
+    if column == "name":
+        return row["name"]
+    if column == "secret":
+        return mask_secret(row["secret"], ratio) if row.get("secret") is not None else ""
+    return row["attrs"].get(column, "")
+
+
+def _columns(long: bool, labels: Sequence[str] = ()) -> List[str]:
+    # Labels (namespace/env of merged rows) lead; the masked secret goes
+    # last so a wide value never misaligns other columns
+    extra = [c for c in _METADATA_COLUMNS if c not in labels] if long else []
+    return list(labels) + ["name"] + extra + ["secret"]
+
+
+_HEADINGS = {"kk_ns": "Namespace", "name": "Name", "secret": "Secret (masked)", "env": "Env", "source": "Source", "updated_at": "Updated"}
+
+
+def _table(rows: Iterator[dict], out: TextIO, columns: List[str], ratio: float) -> int:
+    sample: List[List[str]] = []
+    for row in rows:
+        sample.append([_cell(c, row, ratio) for c in columns])
+        if len(sample) >= SIZE_SAMPLE:
+            break
+    widths = [
+        min(_MAX_WIDTH, max([len(_HEADINGS[c])] + [len(cells[i]) for cells in sample]))
+        for i, c in enumerate(columns[:-1])
+    ]
+
+    def line(cells: List[str]) -> str:
+        return " ".join(f"{cell:<{w}}" for cell, w in zip(cells, widths)) + " " + cells[-1]
+
+    out.write(line([_HEADINGS[c] for c in columns]).rstrip() + "\n")
+    out.write("-" * max(40, sum(widths) + len(widths) + len(_HEADINGS["secret"])) + "\n")
+    count = 0
+    for cells in sample:
+        out.write(line(cells) + "\n")
+        count += 1
+    out.flush()
+    for row in rows:
+        out.write(line([_cell(c, row, ratio) for c in columns]) + "\n")
+        count += 1
+        if count % SIZE_SAMPLE == 0:
+            out.flush()
+    return count
+
+
+def _record(row: dict, ratio: float) -> dict:
+    attrs = row["attrs"]
+    record = {
+        "kk_ns": attrs.get("kk_ns"),
+        "name": row["name"],
+        "service": attrs.get("service"),
+        "username": attrs.get("username"),
+    }
+    for c in _METADATA_COLUMNS:
+        record[c] = attrs.get(c)
+    record["secret_masked"] = _cell("secret", row, ratio)
+    return record
+
+
+def render(
+    rows: Iterable[dict],
+    out: TextIO,
+    fmt: str = "table",
+    long: bool = False,
+    ratio: float = 0.35,
+    labels: Sequence[str] = (),
+) -> int:
+    """Write ``rows`` ({name, secret, attrs}) to ``out``; returns the row count.
+    Secrets are only ever written masked. ``labels`` are attribute columns
+    shown first in a table (e.g. kk_ns, env when rows are merged)."""
+    rows = iter(rows)
+    if fmt == "table":
+        return _table(rows, out, _columns(long, labels), ratio)
+    count = 0
+    if fmt == "json":
+        out.write("[")
+    for row in rows:
+        record = _record(row, ratio)
+        if fmt == "ndjson":
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        else:
+            out.write(("\n  " if count == 0 else ",\n  ") + json.dumps(record))
+        count += 1
+        if count % SIZE_SAMPLE == 0:
+            out.flush()
+    if fmt == "json":
+        out.write("\n]\n" if count else "]\n")
+    return count
+
+
+def _pager_argv() -> Optional[List[str]]:
+    cmd = os.environ.get("KK_PAGER", os.environ.get("PAGER", "less -FRX"))
+    if cmd.strip() in ("", "cat"):
+        return None
+    return shlex.split(cmd)
+
+
+@contextmanager
+def output(pager: bool) -> Iterator[TextIO]:
+    """stdout, or the stdin of ``$KK_PAGER``/``$PAGER`` (default ``less -FRX``)
+    when ``pager`` is set and stdout is a terminal. A reader that goes away
+    early (``| head``, quitting the pager) ends the output quietly."""
+    proc = None
+    argv = _pager_argv() if pager and sys.stdout.isatty() else None
+    if argv:
+        env = dict(os.environ)
+        env.setdefault("LESS", "FRX")
+        try:
+            proc = subprocess.Popen(argv, stdin=subprocess.PIPE, text=True, env=env)
+        except OSError:
+            proc = None
+    out = proc.stdin if proc is not None else sys.stdout
+    try:
+        yield out
+        out.flush()
+    except BrokenPipeError:
+        if proc is None:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        if proc is not None:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            proc.wait()
+
+
+def show(
+    header: str,
+    rows: Callable[[], Iterable[dict]],
+    fmt: str,
+    long: bool,
+    ratio: float,
+    pager: bool,
+    labels: Sequence[str] = (),
+) -> int:
+    """Print the context header (stderr for machine formats, so stdout stays
+    parseable) and render ``rows()``; the row source is only started once
+    the output is open."""
+    if fmt != "table":
+        print(header, file=sys.stderr)
+    with output(pager and fmt == "table") as out:
+        if fmt == "table":
+            out.write(header + "\n")
+        return render(rows(), out, fmt, long, ratio, labels)
+    return 0
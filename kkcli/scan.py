@@ -0,0 +1,97 @@
+"""Directory scanner for ingest that prunes whole subtrees.
+
+Walks top-down and never descends into VCS metadata, dependency trees,
+virtualenvs, directories named by ``--exclude`` globs or listed in a
+``.kkignore`` file. ``.kkignore`` uses a gitignore-like subset: one glob per
+line, ``#`` comments, a trailing ``/`` matches directories only, a pattern
+containing ``/`` is relative to the ignore file's directory, otherwise it
+matches a name at any depth, and ``!pattern`` re-includes. ``.gitignore`` is
+deliberately not read: dot-env files are usually git-ignored.
+"""
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple
+
+IGNORE_FILE = ".kkignore"
+
+PRUNED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv",
+    ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".ruff_cache", "site-packages",
+}
+
+# (directory the rule is relative to, pattern, anchored, directories only, negated)
+Rule = Tuple[str, str, bool, bool, bool]
+
+
+def _parse_rules(rel_dir: str, lines: Sequence[str]) -> List[Rule]:
+    rules: List[Rule] = []
+    for raw in lines:
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        anchored = "/" in line.rstrip("/")
+        line = line.strip("/")
+        if line:
+            rules.append((rel_dir, line, anchored, dir_only, negated))
+    return rules
+
+
+def _load_ignore(dirpath: str, rel_dir: str) -> List[Rule]:
+    try:
+        with open(os.path.join(dirpath, IGNORE_FILE), "r") as f:
+            return _parse_rules(rel_dir, f.read().splitlines())
+    except OSError:
+        return []
+
+
+def _ignored(rules: List[Rule], rel_path: str, is_dir: bool) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    ignored = False
+    for base, pattern, anchored, dir_only, negated in rules:
+        if dir_only and not is_dir:
+            continue
+        if anchored:
+            if base and not rel_path.startswith(base + "/"):
+                continue
+            target = rel_path[len(base) + 1:] if base else rel_path
+            hit = fnmatchcase(target, pattern)
+        else:
+            hit = fnmatchcase(name, pattern)
+        if hit:
+            ignored = not negated
+    return ignored
+
+
+def is_env_file(name: str) -> bool:
+    """Dot-notation env files only: ``.<name>.env``."""
+    return name.startswith(".") and name.endswith(".env")
+
+
+def iter_env_files(base: Path, excludes: Sequence[str] = ()) -> Iterator[Path]:
+    """Yield the dot-env files under ``base``, walking directories in sorted order."""
+    inherited = {"": _parse_rules("", excludes)}
+    for dirpath, dirnames, filenames in os.walk(base):
+        rel_dir = os.path.relpath(dirpath, base).replace(os.sep, "/")
+        rel_dir = "" if rel_dir == "." else rel_dir
+        rules = inherited.pop(rel_dir, []) + _load_ignore(dirpath, rel_dir)
+
+        def rel(name: str) -> str:
+            return f"{rel_dir}/{name}" if rel_dir else name
+
+        kept = []
+        for d in sorted(dirnames):
+            if d in PRUNED_DIRS or _ignored(rules, rel(d), True):
+                continue
+            if os.path.exists(os.path.join(dirpath, d, "pyvenv.cfg")):
+                continue  # virtualenv under any name
+            kept.append(d)
+            inherited[rel(d)] = rules
+        dirnames[:] = kept
+        for name in sorted(filenames):
+            if is_env_file(name) and not _ignored(rules, rel(name), False):
+                yield Path(dirpath) / name
@@ -0,0 +1,278 @@
+"""Incremental, encrypted snapshots of a namespace (``kk snapshot``/``kk restore``).
+
+A repository directory holds:
+
+    repo.json             key parameters (salt, KDF, sealed check value)
+    segments/ab/<id>      zlib-compressed NDJSON records, AES-256-GCM sealed
+    manifests/<id>.json.gz  one point in time: every item's hash, updated_at
+                            and the segment holding its record
+
+Each item is identified by an HMAC of its content (service, username,
+secret and non-volatile attributes), so hashes reveal nothing without the
+key. A snapshot re-reads only items whose ``updated_at`` differs from the
+previous manifest, and only items whose hash changed are written, into
+new segments. Segments are named by the keyed hash of their content, so
+an identical segment is never stored twice. A manifest is written only if
+something changed. Restoring any manifest loads just the segments it
+references.
+
+The key comes from the same settings as the vault store mode
+(``KK_VAULT_KEYFILE``/``vault_keyfile`` or ``KK_VAULT_PASSPHRASE``).
+"""
+import base64
+import datetime as _dt
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .fsutil import atomic_write
+from .storage import Store, _VOLATILE_ATTRS, fetch_secrets, snapshot as store_snapshot
+
+REPO_VERSION = 1
+# Records per segment: big enough to compress well, small enough that a
+# restore of a few items does not decrypt the world
+SEGMENT_RECORDS = 1000
+# Attributes that identify the item rather than describe it
+_KEY_ATTRS = {"kk_ns", "service", "username"}
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def default_dir(namespace: str) -> Path:
+    base = os.environ.get("XDG_DATA_HOME") or str(Path.home() / ".local" / "share")
+    return Path(base) / "kk" / "snapshots" / namespace
+
+
+@dataclass
+class SnapshotStats:
+    id: Optional[str] = None  # None when nothing changed since the previous snapshot
+    items: int = 0
+    reread: int = 0  # secrets fetched because updated_at moved (or --full)
+    changed: int = 0  # records written
+    segments: int = 0
+    bytes_written: int = 0
+    previous: Optional[str] = None
+
+
+@dataclass
+class Manifest:
+    id: str
+    namespace: str
+    created_at: str
+    parent: Optional[str] = None
+    items: Dict[str, dict] = field(default_factory=dict)  # "svc/usr" -> {hash, updated_at, segment}
+
+    def to_json(self) -> dict:
+        # Compact on disk: segment ids once, items as [hash, updated_at, segment index]
+        segments = sorted({e["segment"] for e in self.items.values()})
+        index = {seg: i for i, seg in enumerate(segments)}
+        return {
+            "version": REPO_VERSION,
+            "id": self.id,
+            "namespace": self.namespace,
+            "created_at": self.created_at,
+            "parent": self.parent,
+            "segments": segments,
+            "items": {name: [e["hash"], e["updated_at"], index[e["segment"]]] for name, e in self.items.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Manifest":
+        segments = data["segments"]
+        items = {
+            name: {"hash": h, "updated_at": updated, "segment": segments[i]}
+            for name, (h, updated, i) in data["items"].items()
+        }
+        return cls(data["id"], data["namespace"], data["created_at"], data.get("parent"), items)
+
+
+class Repo:
+    def __init__(self, root: Path, key: bytes):
+        self.root = root
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._aead = AESGCM(key)
+        self._mac_key = hmac.new(key, b"kk-snapshot-hash", hashlib.sha256).digest()
+
+    @classmethod
+    def open(cls, root: Path, create: bool = False) -> "Repo":
+        from .vault import derive_key
+        path = root / "repo.json"
+        meta: Dict[str, bytes] = {}
+        if path.exists():
+            data = json.loads(path.read_text())
+            if data.get("version") != REPO_VERSION:
+                raise SnapshotError(f"Unsupported snapshot repository version in {root}")
+            meta = {k: base64.b64decode(v) for k, v in data["key"].items()}
+        elif not create:
+            raise SnapshotError(f"No snapshot repository at {root} (run 'kk snapshot' first)")
+        key, meta = derive_key(meta, f"snapshot repository {root}")
+        if not path.exists():
+            root.mkdir(mode=0o700, parents=True, exist_ok=True)
+            for sub in ("segments", "manifests"):
+                (root / sub).mkdir(mode=0o700, parents=True, exist_ok=True)
+            with atomic_write(path) as f:
+                json.dump({"version": REPO_VERSION, "key": {k: base64.b64encode(v).decode() for k, v in meta.items()}}, f)
+        return cls(root, key)
+
+    # -- content -------------------------------------------------------------
+    def item_hash(self, service: str, username: str, secret: bytes, attrs: Dict[str, str]) -> str:
+        stable = {k: v for k, v in attrs.items() if k not in _VOLATILE_ATTRS and k not in _KEY_ATTRS}
+        body = json.dumps([service, username, base64.b64encode(secret).decode(), stable], sort_keys=True)
+        return hmac.new(self._mac_key, body.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _segment_path(self, seg_id: str) -> Path:
+        return self.root / "segments" / seg_id[:2] / seg_id
+
+    def write_segment(self, records: List[dict]) -> Tuple[str, int]:
+        """Store records; returns (segment id, bytes written; 0 if it already existed)."""
+        plain = zlib.compress("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode(), 6)
+        seg_id = hmac.new(self._mac_key, plain, hashlib.sha256).hexdigest()
+        path = self._segment_path(seg_id)
+        if path.exists():
+            return seg_id, 0
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        nonce = os.urandom(12)
+        data = nonce + self._aead.encrypt(nonce, plain, seg_id.encode())
+        with atomic_write(path, binary=True) as f:
+            f.write(data)
+        return seg_id, len(data)
+
+    def read_segment(self, seg_id: str) -> Dict[str, dict]:
+        """Records of a segment by item hash."""
+        data = self._segment_path(seg_id).read_bytes()
+        try:
+            plain = self._aead.decrypt(data[:12], data[12:], seg_id.encode())
+        except Exception:
+            raise SnapshotError(f"Segment {seg_id} is corrupt or was written with another key") from None
+        records = [json.loads(line) for line in zlib.decompress(plain).decode().splitlines() if line]
+        return {r["hash"]: r for r in records}
+
+    # -- manifests -----------------------------------------------------------
+    def manifest_ids(self) -> List[str]:
+        return sorted(p.name[: -len(".json.gz")] for p in (self.root / "manifests").glob("*.json.gz"))
+
+    def load_manifest(self, ref: str = "latest") -> Manifest:
+        ids = self.manifest_ids()
+        if ref == "latest":
+            matches = ids[-1:]
+        else:
+            matches = [i for i in ids if i.startswith(ref)]
+        if not matches:
+            raise SnapshotError(f"No snapshot matching '{ref}' in {self.root}")
+        if len(matches) > 1 and ref not in matches:
+            raise SnapshotError(f"Snapshot id '{ref}' is ambiguous: {', '.join(matches)}")
+        found = ref if ref in matches else matches[0]
+        data = json.loads(gzip.decompress((self.root / "manifests" / f"{found}.json.gz").read_bytes()))
+        if data.get("version") != REPO_VERSION:
+            raise SnapshotError(f"Unsupported manifest version in snapshot {found}")
+        return Manifest.from_json(data)
+
+    def save_manifest(self, manifest: Manifest) -> None:
+        body = json.dumps(manifest.to_json(), separators=(",", ":"), sort_keys=True).encode()
+        with atomic_write(self.root / "manifests" / f"{manifest.id}.json.gz", binary=True) as f:
+            f.write(gzip.compress(body, 6, mtime=0))
+
+
+def _new_id(repo: Repo) -> str:
+    now = _dt.datetime.now(_dt.timezone.utc)
+    base = now.strftime("%Y%m%dT%H%M%SZ")
+    taken = set(repo.manifest_ids())
+    n, candidate = 1, base
+    while candidate in taken:
+        n += 1
+        candidate = f"{base}-{n}"
+    return candidate
+
+
+def take_snapshot(store: Store, repo: Repo, full: bool = False, batch: int = 256) -> SnapshotStats:
+    """Snapshot every item of ``store``'s namespace (all envs) into ``repo``."""
+    stats = SnapshotStats()
+    prev: Optional[Manifest] = None
+    if repo.manifest_ids():
+        prev = repo.load_manifest("latest")
+        stats.previous = prev.id
+    old = prev.items if prev is not None and prev.namespace == store.namespace else {}
+
+    items: Dict[str, dict] = {}
+    todo = []
+    for meta in store_snapshot(store):
+        svc, usr = meta.attrs.get("service", ""), meta.attrs.get("username", "")
+        name = f"{svc}/{usr}"
+        if name in items:
+            continue
+        entry = old.get(name)
+        updated = meta.attrs.get("updated_at", "")
+        if not full and entry is not None and updated and entry["updated_at"] == updated:
+            items[name] = entry
+        else:
+            items[name] = {}
+            todo.append((name, meta))
+    stats.items = len(items)
+    stats.reread = len(todo)
+
+    pending: List[dict] = []
+
+    def flush():
+        if not pending:
+            return
+        seg_id, written = repo.write_segment(pending)
+        for r in pending:
+            items[r["name"]]["segment"] = seg_id
+        stats.segments += 1
+        stats.bytes_written += written
+        pending.clear()
+
+    for start in range(0, len(todo), batch):
+        chunk = todo[start:start + batch]
+        secrets = fetch_secrets(store, [meta.path for _, meta in chunk])
+        for name, meta in chunk:
+            if meta.path not in secrets:
+                raise SnapshotError(f"Could not read {name}; snapshot aborted")
+            svc, usr = name.split("/", 1)
+            h = repo.item_hash(svc, usr, secrets[meta.path], meta.attrs)
+            entry = old.get(name)
+            items[name] = {"hash": h, "updated_at": meta.attrs.get("updated_at", "")}
+            if entry is not None and entry["hash"] == h:
+                items[name]["segment"] = entry["segment"]
+                continue
+            stats.changed += 1
+            pending.append({
+                "name": name,
+                "hash": h,
+                "service": svc,
+                "username": usr,
+                "secret": base64.b64encode(secrets[meta.path]).decode(),
+                "attrs": {k: v for k, v in meta.attrs.items() if k not in _KEY_ATTRS},
+            })
+            if len(pending) >= SEGMENT_RECORDS:
+                flush()
+        secrets.clear()
+    flush()
+
+    if prev is not None and items == old:
+        return stats  # nothing changed; the previous manifest still describes the namespace
+    manifest = Manifest(_new_id(repo), store.namespace, _dt.datetime.now(_dt.timezone.utc).isoformat(), stats.previous, items)
+    repo.save_manifest(manifest)
+    stats.id = manifest.id
+    return stats
+
+
+def iter_records(repo: Repo, manifest: Manifest) -> Iterable[dict]:
+    """Every item record of ``manifest``, one segment decrypted at a time."""
+    by_segment: Dict[str, List[str]] = {}
+    for name, entry in manifest.items.items():
+        by_segment.setdefault(entry["segment"], []).append(entry["hash"])
+    for seg_id in sorted(by_segment):
+        records = repo.read_segment(seg_id)
+        for h in by_segment[seg_id]:
+            if h not in records:
+                raise SnapshotError(f"Segment {seg_id} is missing an item record")
+            yield records[h]
@@ -1,6 +1,10 @@
 import datetime as _dt
-from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, TextIO, Tuple, Union
+
+from . import trace
+from .query import Query
 
 
 def _ensure_secretstorage():
@@ -15,39 +19,247 @@ def _ensure_secretstorage():
 @dataclass
 class Store:
     namespace: str
-    mode: str  # "attribute" or "collection"
-    bus: object
-    collection: object
+    mode: str  # "attribute", "collection" or "vault"
+    bus: object  # None for the vault
+    collection: object  # secretstorage Collection, CollectionRef, or vault.Vault
+    session: object = None  # lazily opened Secret Service session
+    index: object = None  # MetaIndex, loaded and reconciled on first snapshot
+    # Collection lock state as last observed: None until a call was refused
+    # as locked, False once unlocked, True if the user dismissed the prompt
+    locked: Optional[bool] = None
+
+
+@dataclass
+class CollectionRef:
+    """A collection by object path: all kk reads from a store's collection
+    (secretstorage's Collection has the same attribute, so either works)."""
+    collection_path: str
+
+
+@dataclass
+class ItemMeta:
+    """Item metadata from one GetAll call; never carries the secret."""
+    path: str
+    label: str
+    attrs: Dict[str, str]
+    locked: bool = False
+
+
+@dataclass
+class Change:
+    """One planned write: create, update, unchanged or delete."""
+    action: str
+    service: str
+    username: str
+    secret: Optional[str] = None
+    attrs: Dict[str, str] = field(default_factory=dict)
+    existing: Optional[ItemMeta] = None
+    path: Optional[str] = None  # item path once applied
+
+
+@dataclass
+class MigrateStats:
+    copied: int = 0
+    unchanged: int = 0
+    resumed: int = 0  # skipped because a previous run already finished them
+    deleted: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
 
 
 def open_store(namespace: str, mode: str = "attribute") -> Store:
+    if mode == "vault":
+        from . import vault
+        return vault.open_vault(namespace)
     _ensure_secretstorage()
     import secretstorage
 
-    bus = secretstorage.dbus_init()
+    bus = trace.wrap_connection(secretstorage.dbus_init())
     if mode == "collection":
-        label = f"kk:{namespace}"
-        # Try to find existing collection by label
-        for coll in secretstorage.get_all_collections(bus):
-            try:
-                if coll.get_label() == label:
-                    if coll.is_locked():
-                        coll.unlock()
-                    return Store(namespace, mode, bus, coll)
-            except Exception:
-                continue
-        # Create if missing
-        coll = secretstorage.create_collection(bus, label, '')
-        if coll.is_locked():
-            coll.unlock()
-        return Store(namespace, mode, bus, coll)
+        return Store(namespace, mode, bus, _namespace_collection(bus, namespace))
     else:
+        # Lock state is not checked here: operations unlock lazily, in one
+        # batched call, only when the keyring reports something locked
         coll = secretstorage.get_default_collection(bus)
-        if coll.is_locked():
-            coll.unlock()
         return Store(namespace, "attribute", bus, coll)
 
 
+_ALIAS_PREFIX = "/org/freedesktop/secrets/aliases/"
+
+
+def _collection_cache_path():
+    from .config import state_dir
+    return state_dir() / "collections.json"
+
+
+def _load_collection_cache() -> Dict[str, str]:
+    import json
+    try:
+        data = json.loads(_collection_cache_path().read_text())
+        if data.get("version") == 1:
+            return dict(data.get("collections") or {})
+    except Exception:
+        pass
+    return {}
+
+
+def _save_collection_cache(cache: Dict[str, str]) -> None:
+    import json
+    from .fsutil import atomic_write
+    try:
+        with atomic_write(_collection_cache_path()) as f:
+            json.dump({"version": 1, "collections": cache}, f, indent=2, sort_keys=True)
+    except OSError:
+        pass  # a cache we cannot write only costs the next command a scan
+
+
+def open_stores(namespaces: Sequence[str], mode: str = "attribute") -> List[Store]:
+    """One Store per namespace, all sharing a single connection (and, in
+    attribute mode, the default collection and Secret Service session)."""
+    first = open_store(namespaces[0], mode)
+    stores = [first]
+    if len(namespaces) == 1:
+        return stores
+    # One session (one DH negotiation) for all of them; the vault has none
+    session = _session(first) if first.mode != "vault" else None
+    for ns in namespaces[1:]:
+        if mode == "collection":
+            coll = _namespace_collection(first.bus, ns)
+            stores.append(Store(ns, mode, first.bus, coll, session=session, locked=first.locked))
+        elif first.mode == "vault":
+            stores.append(Store(ns, first.mode, first.bus, first.collection))
+        else:
+            stores.append(Store(ns, first.mode, first.bus, first.collection, session=session, locked=first.locked))
+    return stores
+
+
+def _labelled_collection(bus, path: str) -> Tuple[CollectionRef, str]:
+    """(CollectionRef, label) with a single Properties.Get; secretstorage's
+    Collection constructor would read the label once more and then drop it."""
+    from secretstorage.util import DBusAddressWrapper
+    label = DBusAddressWrapper(path, _COLLECTION_IFACE, bus).get_property("Label")
+    return CollectionRef(path), label
+
+
+def _namespace_collection(bus, namespace: str):
+    """The collection backing ``namespace`` in collection mode.
+
+    A configured alias (``[kk.collections]``: an object path, or a Secret
+    Service alias name such as "default") is opened directly. Otherwise the
+    path cached from an earlier run is verified with one Label read; only on
+    a miss are all collections scanned for "kk:<namespace>" (created if
+    absent), and every kk collection seen is cached."""
+    import secretstorage
+    from .config import load_config
+    target = load_config().collections.get(namespace)
+    if target:
+        path = target if target.startswith("/") else _ALIAS_PREFIX + target
+        try:
+            return _labelled_collection(bus, path)[0]
+        except Exception as e:
+            raise RuntimeError(f"Collection {path} configured for namespace '{namespace}' is unavailable: {e}") from e
+
+    label = f"kk:{namespace}"
+    cache = _load_collection_cache()
+    cached = cache.get(namespace)
+    if cached:
+        try:
+            coll, coll_label = _labelled_collection(bus, cached)
+            if coll_label == label:
+                return coll
+        except Exception:
+            pass
+        del cache[namespace]
+
+    from secretstorage.defines import SS_PATH
+    from secretstorage.util import DBusAddressWrapper, SERVICE_IFACE
+    found = None
+    for path in DBusAddressWrapper(SS_PATH, SERVICE_IFACE, bus).get_property("Collections"):
+        try:
+            coll, coll_label = _labelled_collection(bus, path)
+        except Exception:
+            continue
+        if coll_label.startswith("kk:"):
+            cache.setdefault(coll_label[3:], coll.collection_path)
+        if coll_label == label and found is None:
+            found = coll
+    if found is None:
+        found = secretstorage.create_collection(bus, label, '')
+    cache[namespace] = found.collection_path
+    _save_collection_cache(cache)
+    return found
+
+
+def collection_path(store: Store) -> Optional[str]:
+    """The real object path of ``store``'s collection, with a Secret Service
+    alias (``/aliases/default``) resolved; None for the vault."""
+    if store.mode == "vault":
+        return None
+    path = store.collection.collection_path
+    if path.startswith(_ALIAS_PREFIX):
+        from secretstorage.defines import SS_PATH
+        from secretstorage.util import SERVICE_IFACE
+        (real,) = _dbus(store, SS_PATH, SERVICE_IFACE).call("ReadAlias", "s", path[len(_ALIAS_PREFIX):])
+        if real != "/":
+            return real
+    return path
+
+
+def same_items(a: Store, b: Store) -> bool:
+    """Whether two stores see the very same items: one namespace in one
+    collection, even when reached through different modes or an alias
+    (e.g. collection mode with ``[kk.collections] ns = "default"``)."""
+    if a.namespace != b.namespace:
+        return False
+    if a.mode == "vault" or b.mode == "vault":
+        return a.mode == b.mode
+    return collection_path(a) == collection_path(b)
+
+
+# Lock files held by this process -> (fd, depth), so nested writes re-enter
+_WRITE_LOCKS: Dict[str, Tuple[int, int]] = {}
+
+
+@contextmanager
+def write_lock(store: Store) -> Iterator[None]:
+    """Serialize find-then-create writes to ``store``'s namespace across
+    processes with an advisory ``flock`` on ``$XDG_STATE_HOME/kk/locks/<ns>.lock``.
+
+    Without it two concurrent ``set``/``ingest`` runs can both miss an item
+    and both create it. Re-entrant within a process; a no-op for the vault,
+    whose unique index already makes upserts atomic."""
+    if store.mode == "vault":
+        yield
+        return
+    import fcntl
+    import os
+    from urllib.parse import quote
+    from .config import state_dir
+    lock_dir = state_dir() / "locks"
+    path = str(lock_dir / f"{quote(store.namespace, safe='')}.lock")
+    held = _WRITE_LOCKS.get(path)
+    if held is not None:
+        _WRITE_LOCKS[path] = (held[0], held[1] + 1)
+    else:
+        lock_dir.mkdir(mode=0o700, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        _WRITE_LOCKS[path] = (fd, 1)
+    try:
+        yield
+    finally:
+        fd, depth = _WRITE_LOCKS[path]
+        if depth > 1:
+            _WRITE_LOCKS[path] = (fd, depth - 1)
+        else:
+            del _WRITE_LOCKS[path]
+            os.close(fd)  # releases the flock
+
+
 def _now_iso() -> str:
     return _dt.datetime.utcnow().replace(tzinfo=_dt.timezone.utc).isoformat()
 
@@ -64,153 +276,765 @@ def _attrs_for(namespace: str, service: str, username: str, extra: Optional[Dict
     return attrs
 
 
-def _find_item(store: Store, service: str, username: str):
-    # Always include namespace filter
-    target = {"kk_ns": store.namespace, "service": service, "username": username}
-    for it in store.collection.search_items(target):
-        return it
-    return None
+_ITEM_IFACE = "org.freedesktop.Secret.Item"
+_COLLECTION_IFACE = "org.freedesktop.Secret.Collection"
+# Attributes that change on every write and must not make an item look "changed"
+_VOLATILE_ATTRS = {"created_at", "updated_at"}
+
+
+def _dbus(store: Store, path: str, iface: str):
+    from secretstorage.util import DBusAddressWrapper
+    return DBusAddressWrapper(path, iface, store.bus)
+
+
+def _session(store: Store):
+    if store.session is None:
+        from secretstorage.util import open_session
+        store.session = open_session(store.bus)
+    return store.session
+
+
+def _decrypt(session, secret) -> bytes:
+    # Mirrors secretstorage.Item.get_secret for a (session, params, value, content_type) struct
+    if not session.encrypted:
+        plain = bytes(secret[2])
+    else:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        decryptor = Cipher(algorithms.AES(session.aes_key), modes.CBC(bytes(secret[1]))).decryptor()
+        padded = decryptor.update(bytes(secret[2])) + decryptor.finalize()
+        plain = padded[:-padded[-1]]
+    trace.decrypted(len(plain))
+    return plain
+
+
+def _search_paths(store: Store, attrs: Dict[str, str]) -> List[str]:
+    if store.mode == "vault":
+        from . import vault
+        return vault.search_paths(store, attrs)
+    coll = _dbus(store, store.collection.collection_path, _COLLECTION_IFACE)
+    (paths,) = coll.call("SearchItems", "a{ss}", attrs)
+    return list(paths)
+
+
+_IS_LOCKED = "org.freedesktop.Secret.Error.IsLocked"
+
+
+def unlock(store: Store, paths: Iterable[str] = ()) -> bool:
+    """Unlock the store's collection plus ``paths`` with one Service.Unlock
+    call (at most one prompt). Returns True if they are now unlocked.
+
+    A dismissed prompt is remembered on the store so later batches do not
+    prompt again."""
+    if store.locked:
+        return False
+    from secretstorage.util import unlock_objects
+    targets = [store.collection.collection_path]
+    targets += [p for p in dict.fromkeys(paths) if p != targets[0]]
+    try:
+        with trace.span("kk.unlock"):  # includes waiting for the prompt
+            dismissed = unlock_objects(store.bus, targets)
+    except Exception:
+        return False  # e.g. a path that no longer exists
+    store.locked = bool(dismissed)
+    return not dismissed
+
+
+def _ensure_unlocked(store: Store) -> None:
+    """Before a bulk write: one collection-level Locked read (only while the
+    state is unknown) so a locked collection is unlocked once up front
+    instead of every pipelined call failing first."""
+    if store.locked is not None:
+        return
+    if _dbus(store, store.collection.collection_path, _COLLECTION_IFACE).get_property("Locked"):
+        unlock(store)
+    else:
+        store.locked = False
+
+
+def _is_locked_error(exc: Exception) -> bool:
+    from secretstorage.exceptions import LockedException
+    return isinstance(exc, LockedException) or getattr(exc, "name", None) == _IS_LOCKED
+
+
+def _unlocked(store: Store, fn):
+    """Return ``fn()``; if the keyring refuses it as locked, unlock once and retry."""
+    try:
+        return fn()
+    except Exception as e:
+        if not _is_locked_error(e) or not unlock(store):
+            raise
+    return fn()
+
+
+def _item_meta(store: Store, path: str) -> ItemMeta:
+    from jeepney import Properties
+    item = _dbus(store, path, _ITEM_IFACE)
+    (props,) = item.send_and_get_reply(Properties(item).get_all())
+    return ItemMeta(
+        path=path,
+        label=props.get("Label", ("s", ""))[1],
+        attrs=dict(props.get("Attributes", ("a{ss}", {}))[1]),
+        locked=bool(props.get("Locked", ("b", False))[1]),
+    )
+
+
+def _loaded_index(store: Store):
+    if store.index is None:
+        from .index import MetaIndex
+        store.index = MetaIndex.load(store.namespace, store.mode, store.collection.collection_path)
+    return store.index
+
+
+def _meta_index(store: Store):
+    """The store's metadata index, reconciled against one SearchItems call."""
+    idx = _loaded_index(store)
+    # Another kk process may have saved the index since we read it
+    idx.refresh()
+    if not idx.reconciled:
+
+        def fetch(paths):
+            return {m.path: (m.label, m.attrs) for m in fetch_metadata(store, paths)}
+
+        idx.reconcile(_search_paths(store, {"kk_ns": store.namespace}), fetch)
+    return idx
+
+
+def _index_put(store: Store, path: str, label: str, attrs: Dict[str, str]) -> None:
+    from .index import enabled
+    if enabled():
+        _loaded_index(store).put(path, label, attrs)
+
+
+def _index_drop(store: Store, path: str) -> None:
+    from .index import enabled
+    if enabled():
+        _loaded_index(store).drop(path)
+
+
+def reindex(store: Store) -> None:
+    """Throw away the local metadata index; the next snapshot rebuilds it."""
+    if store.mode == "vault":
+        return  # the vault is its own index
+    from .index import MetaIndex
+    MetaIndex.load(store.namespace, store.mode, store.collection.collection_path).discard()
+    store.index = None
+
+
+def snapshot(store: Store, attrs: Optional[Dict[str, str]] = None) -> List[ItemMeta]:
+    """Metadata of every namespace item matching ``attrs``. No secrets are
+    fetched or decrypted.
+
+    Answered from the local metadata index when enabled (one SearchItems to
+    reconcile it, GetAll only for paths it has not seen); otherwise one
+    search plus one GetAll per match.
+    """
+    if store.mode == "vault":
+        from . import vault
+        return vault.snapshot(store, attrs)
+    query = {"kk_ns": store.namespace}
+    if attrs:
+        query.update(attrs)
+    from .index import enabled
+    if enabled():
+        idx = _meta_index(store)
+        return [
+            ItemMeta(path, e["label"], dict(e["attrs"]))
+            for path, e in idx.entries.items()
+            if all(e["attrs"].get(k) == v for k, v in query.items())
+        ]
+    return fetch_metadata(store, _search_paths(store, query))
+
+
+# Below this many items the asyncio connection setup costs more than it saves
+_PIPELINE_MIN = 8
+
+
+def fetch_metadata(store: Store, paths: List[str]) -> List[ItemMeta]:
+    """GetAll for each path, pipelined on an asyncio connection for larger
+    batches. Items that vanish or fail are skipped."""
+    if store.mode == "vault":
+        from . import vault
+        return vault.metadata(store, paths)
+    if len(paths) >= _PIPELINE_MIN:
+        from . import aiostore
+        return aiostore.run(store, lambda a: a.metadata(paths))
+    metas: List[ItemMeta] = []
+    for path in paths:
+        try:
+            metas.append(_item_meta(store, path))
+        except Exception:
+            continue
+    return metas
+
+
+def _get_secrets(store: Store, paths: List[str]) -> Dict[str, bytes]:
+    from secretstorage.util import SERVICE_IFACE
+    from secretstorage.defines import SS_PATH
+    session = _session(store)
+    service = _dbus(store, SS_PATH, SERVICE_IFACE)
+    (secrets,) = service.call("GetSecrets", "aoo", paths, session.object_path)
+    return {path: _decrypt(session, sec) for path, sec in secrets.items()}
+
+
+def fetch_secrets(store: Store, paths: Iterable[str]) -> Dict[str, bytes]:
+    """Fetch many secrets with a single Service.GetSecrets call.
+
+    GetSecrets silently omits locked items, so no lock state is checked up
+    front: if anything is missing, the collection and the missing items are
+    unlocked with one Unlock call and only those are fetched again."""
+    paths = list(paths)
+    if not paths:
+        return {}
+    if store.mode == "vault":
+        from . import vault
+        return vault.fetch_secrets(store, paths)
+    secrets = _get_secrets(store, paths)
+    missing = [p for p in paths if p not in secrets]
+    if missing and unlock(store, missing):
+        secrets.update(_get_secrets(store, missing))
+    return secrets
+
+
+def _create_item(store: Store, label: str, attrs: Dict[str, str], secret: bytes) -> str:
+    from secretstorage.util import exec_prompt, format_secret
+    from secretstorage.exceptions import PromptDismissedException
+    props = {
+        _ITEM_IFACE + ".Label": ("s", label),
+        _ITEM_IFACE + ".Attributes": ("a{ss}", attrs),
+    }
+    coll = _dbus(store, store.collection.collection_path, _COLLECTION_IFACE)
+    path, prompt = coll.call(
+        "CreateItem", "a{sv}(oayays)b", props, format_secret(_session(store), secret, "text/plain"), False
+    )
+    if len(path) > 1:
+        return path
+    dismissed, (_sig, path) = exec_prompt(store.bus, prompt)
+    if dismissed:
+        raise PromptDismissedException("Prompt dismissed.")
+    return path
+
+
+def _delete_path(store: Store, path: str) -> None:
+    from secretstorage.util import exec_prompt
+    from secretstorage.exceptions import PromptDismissedException
+    (prompt,) = _dbus(store, path, _ITEM_IFACE).call("Delete", "")
+    if prompt != "/":
+        dismissed, _result = exec_prompt(store.bus, prompt)
+        if dismissed:
+            raise PromptDismissedException("Prompt dismissed.")
 
 
 def has_item(store: Store, service: str, username: str) -> bool:
-    return _find_item(store, service, username) is not None
+    # Always include namespace filter
+    return bool(_search_paths(store, {"kk_ns": store.namespace, "service": service, "username": username}))
+
+
+def _update_item(store: Store, meta: ItemMeta, label: str, attrs: Dict[str, str], secret: bytes) -> None:
+    from secretstorage.util import format_secret
+    item = _dbus(store, meta.path, _ITEM_IFACE)
+    if meta.label != label:
+        item.set_property("Label", "s", label)
+    item.set_property("Attributes", "a{ss}", attrs)
+    item.call("SetSecret", "(oayays)", format_secret(_session(store), secret, "text/plain"))
 
 
 def put(store: Store, service: str, username: str, secret: str, attrs: Optional[Dict[str, str]] = None) -> None:
     label = f"{service}/{username}"
     a = _attrs_for(store.namespace, service, username, attrs)
-    existing = _find_item(store, service, username)
-    if existing:
+    if store.mode == "vault":
+        from . import vault
+        vault.put(store, service, username, secret, a)
+        return
+    with write_lock(store):
+        _put(store, service, username, label, secret, a)
+
+
+def _put(store: Store, service: str, username: str, label: str, secret: str, a: Dict[str, str]) -> None:
+    paths = _search_paths(store, {"kk_ns": store.namespace, "service": service, "username": username})
+    if paths:
         try:
             # Replace secret and refresh attributes/label
-            if existing.is_locked():
-                existing.unlock()
-            existing.set_label(label)
+            meta = _item_meta(store, paths[0])
             # Preserve created_at if present; always refresh updated_at
-            try:
-                old_attrs = existing.get_attributes() or {}
-            except Exception:
-                old_attrs = {}
-            if "created_at" in old_attrs:
-                a["created_at"] = old_attrs["created_at"]
+            if "created_at" in meta.attrs:
+                a["created_at"] = meta.attrs["created_at"]
             a["updated_at"] = _now_iso()
-            existing.set_attributes(a)
-            existing.set_secret(secret.encode())
+            _unlocked(store, lambda: _update_item(store, meta, label, a, secret.encode()))
+            _index_put(store, meta.path, label, a)
             return
         except Exception:
             try:
-                existing.delete()
+                _unlocked(store, lambda: _delete_path(store, paths[0]))
+                _index_drop(store, paths[0])
             except Exception:
                 pass
     # Create new item
     a.setdefault("created_at", _now_iso())
     a["updated_at"] = _now_iso()
-    # secretstorage>=3.3.0 signature: (label, attributes, secret, replace=False, content_type='text/plain')
-    store.collection.create_item(label, a, secret.encode(), False)
+    path = _unlocked(store, lambda: _create_item(store, label, a, secret.encode()))
+    _index_put(store, path, label, a)
 
 
 def get(store: Store, service: str, username: str) -> Optional[str]:
-    it = _find_item(store, service, username)
-    if not it:
+    # Search + GetSecrets on the store's session, so a long-lived store (the
+    # agent) pays for session negotiation once rather than per lookup
+    paths = _search_paths(store, {"kk_ns": store.namespace, "service": service, "username": username})
+    if not paths:
+        return None
+    path = paths[0]
+    secrets = fetch_secrets(store, [path])
+    if path not in secrets:
         return None
-    if it.is_locked():
-        it.unlock()
-    sec = it.get_secret()
+    sec = secrets[path]
     try:
         return sec.decode()
     except Exception:
         return sec.decode(errors="ignore")
 
 
+def get_many(store: Store, names: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """Secrets for many (service, username) pairs; missing names are absent
+    from the result.
+
+    With the local index (or the vault), names are resolved from one
+    snapshot per distinct service, all answered by a single reconcile;
+    without it, one exact SearchItems per name, which needs no attribute
+    reads. Every secret then comes back in one batched GetSecrets call."""
+    from .index import enabled
+    wanted = set(names)
+    paths: Dict[Tuple[str, str], str] = {}
+    if store.mode == "vault" or enabled():
+        for svc in sorted({s for s, _ in wanted}):
+            for meta in snapshot(store, {"service": svc}):
+                key = (svc, meta.attrs.get("username", ""))
+                if key in wanted:
+                    paths.setdefault(key, meta.path)
+    else:
+        for svc, usr in sorted(wanted):
+            found = _search_paths(store, {"kk_ns": store.namespace, "service": svc, "username": usr})
+            if found:
+                paths[(svc, usr)] = found[0]
+    secrets = fetch_secrets(store, list(paths.values()))
+    return {key: secrets[path].decode(errors="ignore") for key, path in paths.items() if path in secrets}
+
+
 def delete(store: Store, service: str, username: str) -> bool:
-    it = _find_item(store, service, username)
-    if not it:
+    if store.mode == "vault":
+        from . import vault
+        return vault.delete(store, service, username)
+    paths = _search_paths(store, {"kk_ns": store.namespace, "service": service, "username": username})
+    if not paths:
         return False
-    it.delete()
+    _unlocked(store, lambda: _delete_path(store, paths[0]))
+    _index_drop(store, paths[0])
     return True
 
 
-def list_items(store: Store, contains: Optional[str] = None, env: Optional[str] = None) -> List[dict]:
-    # Filter by namespace first
-    items = store.collection.search_items({"kk_ns": store.namespace})
-    rows: List[dict] = []
+def _select(
+    store: Store,
+    contains: Optional[str],
+    env: Union[None, str, Sequence[str]],
+    service: Optional[str],
+    query: Optional[Query] = None,
+) -> List[Tuple[ItemMeta, str]]:
+    """Metadata-only selection shared by list_items and iter_items: exact
+    filters (including a query's exact terms) go into the snapshot query;
+    ``contains`` and the query's other predicates are matched locally.
+    Several envs (a list) are matched locally too, so the namespace is still
+    searched once."""
+    envs = None
+    if env is not None and not isinstance(env, str):
+        envs = set(env)
+        env = next(iter(envs)) if len(envs) == 1 else None
+    attrs = dict(query.attrs) if query is not None else {}
+    if query is not None and (query.impossible or attrs.get("kk_ns", store.namespace) != store.namespace):
+        return []
+    for name, value in (("env", env), ("service", service)):
+        if value:
+            if attrs.setdefault(name, value) != value:
+                return []
+    metas = snapshot(store, attrs)
+    selected: List[Tuple[ItemMeta, str]] = []
     needle = (contains or "").lower()
-    for it in items:
-        try:
-            attrs = it.get_attributes() or {}
-            if env and attrs.get("env") != env:
-                continue
-            svc = attrs.get("service", "")
-            usr = attrs.get("username", "")
-            label = f"{svc}/{usr}" if svc and usr else (it.get_label() or "")
-            hay = " ".join([svc, usr, label, attrs.get("env", "")]).lower()
-            if needle and needle not in hay:
-                continue
-            if it.is_locked():
-                it.unlock()
-            secret = it.get_secret()
-            rows.append({"name": label, "secret": secret, "attrs": attrs})
-        except Exception:
+    for meta in metas:
+        attrs = meta.attrs
+        svc = attrs.get("service", "")
+        usr = attrs.get("username", "")
+        label = f"{svc}/{usr}" if svc and usr else (meta.label or "")
+        hay = " ".join([svc, usr, label, attrs.get("env", "")]).lower()
+        if needle and needle not in hay:
+            continue
+        if envs is not None and attrs.get("env") not in envs:
             continue
+        if query is not None and not query.matches(attrs, label):
+            continue
+        selected.append((meta, label))
+    return selected
+
+
+def list_items(
+    store: Store,
+    contains: Optional[str] = None,
+    env: Union[None, str, Sequence[str]] = None,
+    secrets: bool = True,
+    service: Optional[str] = None,
+    query: Optional[Query] = None,
+) -> List[dict]:
+    """Rows of {name, secret, attrs, path}, sorted by service then username.
+
+    Runs a metadata pass first (search plus one GetAll per item) and filters
+    on it, then fetches the secrets of the surviving items with a single
+    GetSecrets call. With ``secrets=False`` nothing is decrypted and every
+    row's ``secret`` is None.
+    """
+    selected = _select(store, contains, env, service, query)
+    fetched: Dict[str, bytes] = {}
+    if secrets and selected:
+        fetched = fetch_secrets(store, [meta.path for meta, _ in selected])
+    rows: List[dict] = []
+    for meta, label in selected:
+        if secrets and meta.path not in fetched:
+            continue  # could not be unlocked or read
+        rows.append({"name": label, "secret": fetched.get(meta.path), "attrs": meta.attrs, "path": meta.path})
     rows.sort(key=lambda r: (r["attrs"].get("service", "").lower(), r["attrs"].get("username", "").lower()))
     return rows
 
 
+def plan_changes(
+    store: Store,
+    desired: Dict[Tuple[str, str], Tuple[str, Dict[str, str]]],
+    prune: Optional[Dict[str, str]] = None,
+    keep: Optional[Set[Tuple[str, str]]] = None,
+) -> List[Change]:
+    """Diff ``desired`` ({(service, username): (secret, attrs)}) against the store.
+
+    Takes one metadata snapshot per touched service and one batched secret
+    fetch for the items that already exist; no writes happen here. With
+    ``prune`` (extra attribute filters, e.g. {"env": "dev"}), items of the
+    touched services that are neither in ``desired`` nor in ``keep`` are
+    planned for deletion.
+    """
+    existing: Dict[Tuple[str, str], ItemMeta] = {}
+    stale: List[ItemMeta] = []
+    for svc in sorted({svc for svc, _ in desired}):
+        for meta in snapshot(store, {"service": svc}):
+            key = (meta.attrs.get("service", ""), meta.attrs.get("username", ""))
+            if key in desired and key not in existing:
+                existing[key] = meta
+            elif key not in desired and prune is not None and key not in (keep or ()):
+                if all(meta.attrs.get(k) == v for k, v in prune.items()):
+                    stale.append(meta)
+    plan = _diff(store, desired, existing)
+    for meta in stale:
+        plan.append(Change("delete", meta.attrs.get("service", ""), meta.attrs.get("username", ""), existing=meta))
+    return plan
+
+
+def _diff(
+    store: Store,
+    desired: Dict[Tuple[str, str], Tuple[str, Dict[str, str]]],
+    existing: Dict[Tuple[str, str], ItemMeta],
+) -> List[Change]:
+    """Create/update/unchanged for ``desired`` given the matching existing
+    items; their current secrets are read with one GetSecrets call."""
+    current = fetch_secrets(store, [existing[k].path for k in desired if k in existing])
+    plan: List[Change] = []
+    for (svc, usr), (secret, attrs) in desired.items():
+        a = _attrs_for(store.namespace, svc, usr, attrs)
+        meta = existing.get((svc, usr))
+        if meta is None:
+            plan.append(Change("create", svc, usr, secret, a))
+            continue
+        same_attrs = all(meta.attrs.get(k) == v for k, v in a.items() if k not in _VOLATILE_ATTRS)
+        old = current.get(meta.path)
+        same_secret = old is not None and old == secret.encode()
+        action = "unchanged" if same_attrs and same_secret and meta.label == f"{svc}/{usr}" else "update"
+        plan.append(Change(action, svc, usr, secret, a, meta, path=meta.path))
+    return plan
+
+
+def apply_changes(store: Store, changes: List[Change]) -> List[Optional[Exception]]:
+    """Apply a plan with the asyncio engine; one result per change (None on success)."""
+    if not changes:
+        return []
+    if all(c.action == "unchanged" for c in changes):
+        return [None] * len(changes)
+    if store.mode == "vault":
+        from . import vault
+        return vault.apply_changes(store, changes)
+    from . import aiostore
+    _ensure_unlocked(store)
+    errors = aiostore.run(store, lambda a: a.apply_changes(changes))
+    return _retry_locked(store, errors, changes, lambda a, todo: a.apply_changes(todo))
+
+
+def _retry_locked(store: Store, errors: List[Optional[Exception]], items: list, fn) -> List[Optional[Exception]]:
+    """Re-run the work items that failed only because the collection was
+    locked, after one batched unlock; merges their results into ``errors``."""
+    retry = [i for i, e in enumerate(errors) if e is not None and _is_locked_error(e)]
+    if not retry or not unlock(store):
+        return errors
+    from . import aiostore
+    again = aiostore.run(store, lambda a: fn(a, [items[i] for i in retry]))
+    for i, err in zip(retry, again):
+        errors[i] = err
+    return errors
+
+
+def delete_paths(store: Store, paths: List[str], progress=None) -> List[Optional[Exception]]:
+    """Delete items by object path, pipelined; one result per path (None on success).
+
+    ``progress(done, total)`` is called as each delete completes."""
+    if not paths:
+        return []
+    if store.mode == "vault":
+        from . import vault
+        return vault.delete_paths(store, paths, progress)
+    from . import aiostore
+    _ensure_unlocked(store)
+    errors = aiostore.run(store, lambda a: a.delete_paths(paths, progress))
+    return _retry_locked(store, errors, paths, lambda a, todo: a.delete_paths(todo))
+
+
+def delete_matching(
+    store: Store, attrs: Optional[Dict[str, str]] = None, progress=None
+) -> List[Tuple[str, Optional[Exception]]]:
+    """Delete every namespace item matching ``attrs`` (exact attribute match).
+
+    One SearchItems call yields the object paths, which are deleted directly:
+    no attributes are read and no secrets are decrypted. Returns (path,
+    error-or-None) per item."""
+    query = {"kk_ns": store.namespace}
+    if attrs:
+        query.update(attrs)
+    paths = _search_paths(store, query)
+    return list(zip(paths, delete_paths(store, paths, progress)))
+
+
+def _age_key(meta: ItemMeta) -> Tuple[str, str, str]:
+    return (meta.attrs.get("updated_at", ""), meta.attrs.get("created_at", ""), meta.path)
+
+
+def duplicates(store: Store) -> List[Tuple[ItemMeta, List[ItemMeta]]]:
+    """Groups of namespace items sharing (service, username), from one
+    metadata snapshot: (newest by updated_at, the others) per group."""
+    groups: Dict[Tuple[str, str], List[ItemMeta]] = {}
+    for meta in snapshot(store):
+        groups.setdefault((meta.attrs.get("service", ""), meta.attrs.get("username", "")), []).append(meta)
+    found = []
+    for key in sorted(k for k, metas in groups.items() if len(metas) > 1):
+        metas = sorted(groups[key], key=_age_key, reverse=True)
+        found.append((metas[0], metas[1:]))
+    return found
+
+
 def search(store: Store, query: str) -> List[dict]:
-    return list_items(store, contains=query)
+    """list_items for a query string (see ``kkcli.query``)."""
+    from .query import parse_query
+    return list_items(store, query=parse_query(query))
 
 
-def export_items(store: Store, fmt: str = "json", env: Optional[str] = None) -> str:
+def _sort_key(attrs: Dict[str, str]) -> Tuple[str, str]:
+    return (attrs.get("service", "").lower(), attrs.get("username", "").lower())
+
+
+def iter_items(
+    store: Store,
+    contains: Optional[str] = None,
+    env: Union[None, str, Sequence[str]] = None,
+    service: Optional[str] = None,
+    sort: bool = True,
+    batch: int = 256,
+    query: Optional[Query] = None,
+) -> Iterator[dict]:
+    """Like list_items, but yields rows as their secrets arrive: one
+    GetSecrets call per ``batch`` items, so at most one batch of secrets is
+    held in memory. Sorting only reorders the (secret-free) metadata."""
+    selected = _select(store, contains, env, service, query)
+    if sort:
+        selected.sort(key=lambda s: _sort_key(s[0].attrs))
+    for start in range(0, len(selected), batch):
+        chunk = selected[start:start + batch]
+        fetched = fetch_secrets(store, [meta.path for meta, _ in chunk])
+        for meta, label in chunk:
+            if meta.path in fetched:
+                yield {"name": label, "secret": fetched.pop(meta.path), "attrs": meta.attrs, "path": meta.path}
+
+
+def _env_quote(val: str) -> str:
+    # Quote and escape to be .env-safe
+    safe = (
+        val.replace("\\", "\\\\")
+           .replace("\n", "\\n")
+           .replace('"', '\\"')
+    )
+    return f"\"{safe}\""
+
+
+def write_export(
+    store: Union[Store, Sequence[Store]],
+    out: TextIO,
+    fmt: str = "json",
+    env: Union[None, str, Sequence[str]] = None,
+    sort: bool = True,
+) -> int:
+    """Stream the namespace to ``out`` as json, ndjson or env; returns the
+    number of records written. Records are written as they are fetched.
+
+    ``store`` may be several stores (namespaces) and ``env`` several envs;
+    their records are merged into one output, each carrying its kk_ns and
+    env. The env format then gets a "## namespace: ..., env: ..." heading
+    per group, so it is written one env at a time."""
     import json
-    rows = list_items(store, env=env)
-    if fmt == "env":
-        # Dump as .env-style with names as comments and username=value under service groups
-        out_lines: List[str] = []
+    stores = [store] if isinstance(store, Store) else list(store)
+    envs = [env] if env is None or isinstance(env, str) else list(env)
+    fanout = len(stores) > 1 or len(envs) > 1
+    if fmt == "env" and fanout:
+        groups = [(st, e) for st in stores for e in envs]
+    else:
+        groups = [(st, env) for st in stores]
+    count = 0
+    if fmt == "json":
+        out.write("[")
+    for st, group_env in groups:
         current_service = None
-        for r in rows:
+        heading = fmt == "env" and fanout  # written with the group's first row; empty groups get none
+        for r in iter_items(st, env=group_env, sort=sort):
+            if heading:
+                if count:
+                    out.write("\n")
+                out.write(f"## namespace: {st.namespace}, env: {group_env or 'ALL'}\n")
+                heading = False
             svc = r["attrs"].get("service", "")
             usr = r["attrs"].get("username", "")
-            if svc != current_service:
-                out_lines.append("")
-                out_lines.append(f"## service: {svc}")
-                current_service = svc
-            try:
-                val = r["secret"].decode()
-            except Exception:
-                val = r["secret"].decode(errors="ignore")
-            # Quote and escape to be .env-safe
-            safe = (
-                val.replace("\\", "\\\\")
-                   .replace("\n", "\\n")
-                   .replace('"', '\\"')
-            )
-            out_lines.append(f"{usr}=\"{safe}\"")
-        return "\n".join(out_lines).lstrip()
-    else:
-        payload = [
-            {
-                "kk_ns": store.namespace,
-                "service": r["attrs"].get("service"),
-                "username": r["attrs"].get("username"),
-                "secret": (r["secret"].decode(errors="ignore") if isinstance(r["secret"], (bytes, bytearray)) else str(r["secret"])) ,
-                "attrs": r["attrs"],
-            }
-            for r in rows
-        ]
-        return json.dumps(payload, indent=2)
-
-
-def migrate(from_store: Store, to_store: Store) -> int:
-    count = 0
-    rows = list_items(from_store)
-    for r in rows:
-        svc = r["attrs"].get("service", "")
-        usr = r["attrs"].get("username", "")
-        try:
-            val = r["secret"].decode()
-        except Exception:
             val = r["secret"].decode(errors="ignore")
-        extra = {k: v for k, v in r["attrs"].items() if k not in {"kk_ns", "service", "username"}}
-        put(to_store, svc, usr, val, extra)
-        count += 1
+            if fmt == "env":
+                # .env-style with service groups as comments and username=value under them
+                if svc != current_service:
+                    if current_service is not None:
+                        out.write("\n")
+                    out.write(f"## service: {svc}\n")
+                    current_service = svc
+                out.write(f"{usr}={_env_quote(val)}\n")
+            else:
+                record = {
+                    "kk_ns": st.namespace,
+                    "service": r["attrs"].get("service"),
+                    "username": r["attrs"].get("username"),
+                    "secret": val,
+                    "attrs": r["attrs"],
+                }
+                if fmt == "ndjson":
+                    out.write(json.dumps(record, separators=(",", ":")) + "\n")
+                else:
+                    body = json.dumps(record, indent=2).replace("\n", "\n  ")
+                    out.write(("\n  " if count == 0 else ",\n  ") + body)
+            count += 1
+    if fmt == "json":
+        out.write("\n]\n" if count else "]\n")
     return count
+
+
+def export_items(store: Store, fmt: str = "json", env: Optional[str] = None) -> str:
+    import io
+    buf = io.StringIO()
+    write_export(store, buf, fmt=fmt, env=env)
+    return buf.getvalue().rstrip("\n")
+
+
+def migrate(
+    from_store: Store,
+    to_store: Store,
+    batch: int = 256,
+    done: Optional[Iterable[str]] = None,
+    on_batch=None,
+    delete_source: bool = False,
+) -> MigrateStats:
+    """Copy every item of ``from_store`` into ``to_store``, batch by batch.
+
+    The destination's metadata is snapshotted once; each batch then costs one
+    GetSecrets on each side plus the pipelined writes for items that are
+    missing or different. ``done`` holds "service/username" keys finished by
+    an earlier run (skipped); ``on_batch(keys)`` is called with the keys
+    completed by each batch so callers can checkpoint. With
+    ``delete_source``, a source item is deleted only after its destination
+    copy has been read back and matches.
+    """
+    with write_lock(to_store):
+        return _migrate(from_store, to_store, batch, done, on_batch, delete_source)
+
+
+def _migrate(
+    from_store: Store,
+    to_store: Store,
+    batch: int,
+    done: Optional[Iterable[str]],
+    on_batch,
+    delete_source: bool,
+) -> MigrateStats:
+    stats = MigrateStats()
+    finished = set(done or ())
+    dest: Dict[Tuple[str, str], ItemMeta] = {}
+    for meta in snapshot(to_store):
+        dest.setdefault((meta.attrs.get("service", ""), meta.attrs.get("username", "")), meta)
+
+    source = sorted(_select(from_store, None, None, None), key=lambda s: _sort_key(s[0].attrs))
+    pending: List[ItemMeta] = []
+    for meta, label in source:
+        if label in finished:
+            stats.resumed += 1
+        else:
+            pending.append(meta)
+
+    for start in range(0, len(pending), batch):
+        chunk = pending[start:start + batch]
+        secrets = fetch_secrets(from_store, [m.path for m in chunk])
+        desired: Dict[Tuple[str, str], Tuple[str, Dict[str, str]]] = {}
+        src_path: Dict[Tuple[str, str], str] = {}
+        for meta in chunk:
+            key = (meta.attrs.get("service", ""), meta.attrs.get("username", ""))
+            if meta.path not in secrets:
+                stats.failed += 1
+                stats.errors.append(f"{key[0]}/{key[1]}: could not read source secret")
+                continue
+            extra = {k: v for k, v in meta.attrs.items() if k not in {"kk_ns", "service", "username"}}
+            desired[key] = (secrets[meta.path].decode(errors="ignore"), extra)
+            src_path[key] = meta.path
+        plan = _diff(to_store, desired, dest)
+        errors = apply_changes(to_store, plan)
+
+        ok: List[Change] = []
+        for change, err in zip(plan, errors):
+            if err is not None:
+                stats.failed += 1
+                stats.errors.append(f"{change.service}/{change.username}: {err}")
+                continue
+            ok.append(change)
+            if change.action == "unchanged":
+                stats.unchanged += 1
+            else:
+                stats.copied += 1
+
+        if delete_source and ok:
+            written = fetch_secrets(to_store, [c.path for c in ok if c.path])
+            verified = [c for c in ok if c.path in written and written[c.path] == c.secret.encode()]
+            for c in ok:
+                if c not in verified:
+                    stats.failed += 1
+                    stats.errors.append(f"{c.service}/{c.username}: destination copy did not verify; source kept")
+            # Never delete the copy we just verified: a source path equal to
+            # the destination path is one item seen through two stores
+            shared = [c for c in verified if src_path[(c.service, c.username)] == c.path]
+            verified = [c for c in verified if src_path[(c.service, c.username)] != c.path]
+            for c in shared:
+                stats.errors.append(f"{c.service}/{c.username}: source and destination are the same item; source kept")
+            del_errors = delete_paths(from_store, [src_path[(c.service, c.username)] for c in verified])
+            for c, err in zip(verified, del_errors):
+                if err is None:
+                    stats.deleted += 1
+                else:
+                    stats.errors.append(f"{c.service}/{c.username}: source delete failed: {err}")
+            ok = verified
+        if on_batch is not None:
+            on_batch([f"{c.service}/{c.username}" for c in ok])
+    return stats
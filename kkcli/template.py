@@ -0,0 +1,90 @@
+"""Template substitution for ``kk render``.
+
+A template is any text with ``{{kk:service/username}}`` placeholders
+(spaces or tabs inside the braces are allowed). Rendering takes two
+streaming passes over the input: the first collects the distinct
+references, which are then fetched in one batch; the second writes the
+text with each placeholder replaced. The input is read in fixed-size
+chunks, carrying over at most one unfinished placeholder between chunks,
+so memory is bounded by the chunk size plus the secrets referenced, not
+by the size of the template.
+"""
+import re
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from .naming import parse_name
+
+CHUNK_SIZE = 1 << 16
+# Longer "{{..." runs cannot be a placeholder and are not carried over
+_MAX_PLACEHOLDER = 512
+_PLACEHOLDER = re.compile(r"\{\{[ \t]*kk:([^{}\s]*)[ \t]*\}\}")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def iter_pieces(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, Optional[str]]]:
+    """Split ``f`` into (text, None) and (placeholder, "service/username") pieces."""
+    buf = ""
+    while True:
+        chunk = f.read(chunk_size)
+        buf += chunk
+        pos = 0
+        for m in _PLACEHOLDER.finditer(buf):
+            if m.start() > pos:
+                yield buf[pos:m.start()], None
+            yield m.group(0), m.group(1)
+            pos = m.end()
+        rest = buf[pos:]
+        if not chunk:
+            if rest:
+                yield rest, None
+            return
+        # Hold back a placeholder that may continue in the next chunk
+        cut = rest.rfind("{{")
+        if cut == -1 or len(rest) - cut > _MAX_PLACEHOLDER:
+            cut = len(rest) - 1 if rest.endswith("{") else len(rest)
+        if cut:
+            yield rest[:cut], None
+        buf = rest[cut:]
+
+
+def references(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Dict[Tuple[str, str], int]:
+    """Distinct references in ``f`` -> line of their first use. Raises
+    TemplateError on a malformed placeholder."""
+    refs: Dict[Tuple[str, str], int] = {}
+    line = 1
+    for text, name in iter_pieces(f, chunk_size):
+        if name is None:
+            line += text.count("\n")
+            continue
+        try:
+            pair = parse_name(name)
+        except ValueError as e:
+            raise TemplateError(f"line {line}: invalid reference '{text}': {e}") from None
+        refs.setdefault(pair, line)
+    return refs
+
+
+def render(f: TextIO, out: TextIO, values: Dict[Tuple[str, str], str], chunk_size: int = CHUNK_SIZE) -> int:
+    """Write ``f`` to ``out`` with every placeholder replaced from ``values``
+    (as collected by ``references``); returns the number replaced."""
+    count = 0
+    by_name: Dict[str, str] = {}  # placeholder text as written -> value
+    for text, name in iter_pieces(f, chunk_size):
+        if name is None:
+            out.write(text)
+            continue
+        value = by_name.get(name)
+        if value is None:
+            value = by_name[name] = values[parse_name(name)]
+        out.write(value)
+        count += 1
+    return count
+
+
+def missing_report(refs: Dict[Tuple[str, str], int], values: Dict[Tuple[str, str], str]) -> List[str]:
+    """Each reference without a value, as "service/username (line N)", in template order."""
+    missing = sorted((line, pair) for pair, line in refs.items() if pair not in values)
+    return [f"{svc}/{usr} (line {line})" for line, (svc, usr) in missing]
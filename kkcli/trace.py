@@ -0,0 +1,191 @@
+"""Secret Service call tracing (``kk --profile`` / ``KK_TRACE``).
+
+When active, the DBus connections opened by ``storage`` and ``aiostore``
+are wrapped so every method call is timed under ``Interface.Member`` (e.g.
+``Service.GetSecrets``, ``Properties.GetAll``). Prompt round trips, agent
+requests and bytes decrypted are recorded too. A report with count, total,
+p50 and p99 per call is written to stderr (or ``KK_TRACE_FILE``) at exit,
+as a table or, with ``KK_TRACE=json``, as one JSON object.
+
+Nothing is wrapped unless tracing was started, so the normal path pays
+only an attribute check per connection.
+"""
+import atexit
+import json
+import math
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+_FORMATS = ("table", "json")
+
+_active: Optional["Tracer"] = None
+
+
+def env_format() -> Optional[str]:
+    """Report format requested by ``KK_TRACE`` (None when unset or off)."""
+    val = os.environ.get("KK_TRACE", "").strip().lower()
+    if val in ("", "0", "false", "no", "off"):
+        return None
+    return val if val in _FORMATS else "table"
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_vals:
+        return 0.0
+    k = max(0, math.ceil(pct / 100.0 * len(sorted_vals)) - 1)
+    return sorted_vals[k]
+
+
+class Tracer:
+    def __init__(self, fmt: str = "table"):
+        self.fmt = fmt
+        self.calls: Dict[str, List[float]] = {}
+        self.bytes_decrypted = 0
+        self.secrets_decrypted = 0
+        self.started = time.perf_counter()
+        self._reported = False
+
+    def record(self, name: str, seconds: float) -> None:
+        self.calls.setdefault(name, []).append(seconds)
+
+    def summary(self) -> dict:
+        rows = []
+        for name, vals in self.calls.items():
+            s = sorted(vals)
+            rows.append({
+                "call": name,
+                "count": len(s),
+                "total_ms": round(sum(s) * 1000, 3),
+                "p50_ms": round(_percentile(s, 50) * 1000, 3),
+                "p99_ms": round(_percentile(s, 99) * 1000, 3),
+            })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return {
+            "command": " ".join(sys.argv[1:2]),
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "calls": rows,
+            "total_calls": sum(r["count"] for r in rows),
+            "secrets_decrypted": self.secrets_decrypted,
+            "bytes_decrypted": self.bytes_decrypted,
+        }
+
+    def render(self) -> str:
+        data = self.summary()
+        if self.fmt == "json":
+            return json.dumps(data) + "\n"
+        width = max([len("Call")] + [len(r["call"]) for r in data["calls"]])
+        lines = [f"{'Call':<{width}}  {'Count':>6}  {'Total ms':>10}  {'p50 ms':>8}  {'p99 ms':>8}"]
+        lines.append("-" * (width + 40))
+        for r in data["calls"]:
+            lines.append(
+                f"{r['call']:<{width}}  {r['count']:>6}  {r['total_ms']:>10.3f}  {r['p50_ms']:>8.3f}  {r['p99_ms']:>8.3f}"
+            )
+        lines.append("-")
+        lines.append(
+            f"calls={data['total_calls']} wall_ms={data['wall_ms']:.3f} "
+            f"secrets_decrypted={data['secrets_decrypted']} bytes_decrypted={data['bytes_decrypted']}"
+        )
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> None:
+        """Write the report once (at exit, or earlier from ``kk exec``)."""
+        if self._reported:
+            return
+        self._reported = True
+        text = self.render()
+        path = os.environ.get("KK_TRACE_FILE")
+        try:
+            if path:
+                with open(path, "a") as f:
+                    f.write(text)
+            else:
+                sys.stderr.write(text)
+                sys.stderr.flush()
+        except (OSError, ValueError):
+            pass
+
+
+def start(fmt: str = "table") -> Tracer:
+    global _active
+    if _active is None:
+        _active = Tracer(fmt if fmt in _FORMATS else "table")
+        atexit.register(_active.report)
+    return _active
+
+
+def active() -> Optional[Tracer]:
+    return _active
+
+
+def report() -> None:
+    if _active is not None:
+        _active.report()
+
+
+def _call_name(msg) -> str:
+    from jeepney.low_level import HeaderFields
+    fields = msg.header.fields
+    iface = fields.get(HeaderFields.interface, "")
+    member = fields.get(HeaderFields.member, "?")
+    return f"{iface.rsplit('.', 1)[-1]}.{member}" if iface else member
+
+
+def decrypted(nbytes: int) -> None:
+    if _active is not None:
+        _active.secrets_decrypted += 1
+        _active.bytes_decrypted += nbytes
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block (prompts, agent round trips) when tracing is active."""
+    if _active is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.record(name, time.perf_counter() - t0)
+
+
+def wrap_connection(conn):
+    """Time every blocking ``send_and_get_reply`` on a jeepney connection."""
+    tracer = _active
+    if tracer is None or getattr(conn, "_kk_traced", False):
+        return conn
+    inner = conn.send_and_get_reply
+
+    def send_and_get_reply(msg, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return inner(msg, *args, **kwargs)
+        finally:
+            tracer.record(_call_name(msg), time.perf_counter() - t0)
+
+    conn.send_and_get_reply = send_and_get_reply
+    conn._kk_traced = True
+    return conn
+
+
+def wrap_router(router):
+    """Async twin of :func:`wrap_connection` for jeepney's asyncio router."""
+    tracer = _active
+    if tracer is None or getattr(router, "_kk_traced", False):
+        return router
+    inner = router.send_and_get_reply
+
+    async def send_and_get_reply(msg, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await inner(msg, *args, **kwargs)
+        finally:
+            tracer.record(_call_name(msg), time.perf_counter() - t0)
+
+    router.send_and_get_reply = send_and_get_reply
+    router._kk_traced = True
+    return router
@@ -0,0 +1,332 @@
+"""Encrypted SQLite vault: ``store_mode = "vault"`` for hosts without DBus.
+
+One SQLite file (WAL mode, 0600) holds every namespace. Item metadata
+(namespace, service, username, env, label, attributes) is stored in the
+clear so it can be indexed and filtered; each secret value is sealed with
+AES-256-GCM under a random nonce, with the item's (namespace, service,
+username) as associated data so ciphertexts cannot be moved between rows.
+
+The 256-bit key comes from a keyfile (HKDF-SHA256) or a passphrase
+(scrypt), salted per vault; a sealed check value in the ``meta`` table
+rejects a wrong key at open time. The key is taken from, in order:
+``vault_keyfile`` / ``KK_VAULT_KEYFILE``, ``KK_VAULT_PASSPHRASE``, or an
+interactive prompt.
+
+Item "paths" are ``vault:<rowid>`` so the storage layer's path-based
+helpers (snapshot, fetch_secrets, delete_paths, apply_changes) work
+unchanged on top of this module. Bulk writes run in one transaction.
+"""
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .storage import Change, ItemMeta, Store, _now_iso
+
+SCHEMA_VERSION = 1
+_PATH_PREFIX = "vault:"
+_COLUMNS = {"kk_ns": "ns", "service": "service", "username": "username", "env": "env"}
+_CHECK_PLAINTEXT = b"kk-vault-key-check"
+_SCRYPT = {"n": 2 ** 15, "r": 8, "p": 1}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    ns TEXT NOT NULL,
+    service TEXT NOT NULL,
+    username TEXT NOT NULL,
+    env TEXT NOT NULL DEFAULT '',
+    label TEXT NOT NULL,
+    attrs TEXT NOT NULL,
+    nonce BLOB NOT NULL,
+    secret BLOB NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS items_ns_service_username ON items (ns, service, username);
+CREATE INDEX IF NOT EXISTS items_ns_env_service ON items (ns, env, service, username);
+"""
+
+
+class VaultError(RuntimeError):
+    pass
+
+
+def vault_path() -> Path:
+    from .config import load_config
+    configured = load_config().vault_path
+    if configured:
+        return Path(configured).expanduser()
+    base = os.environ.get("XDG_DATA_HOME") or str(Path.home() / ".local" / "share")
+    return Path(base) / "kk" / "vault.db"
+
+
+class Vault:
+    def __init__(self, path: Path, conn: sqlite3.Connection, key: bytes):
+        self.path = path
+        self.conn = conn
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._aead = AESGCM(key)
+
+    # -- crypto --------------------------------------------------------------
+    @staticmethod
+    def _aad(ns: str, service: str, username: str) -> bytes:
+        return "\0".join((ns, service, username)).encode()
+
+    def seal(self, ns: str, service: str, username: str, secret: bytes) -> Tuple[bytes, bytes]:
+        nonce = os.urandom(12)
+        return nonce, self._aead.encrypt(nonce, secret, self._aad(ns, service, username))
+
+    def open(self, ns: str, service: str, username: str, nonce: bytes, sealed: bytes) -> bytes:
+        return self._aead.decrypt(nonce, sealed, self._aad(ns, service, username))
+
+
+# -- opening -------------------------------------------------------------------
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not path.exists():
+        os.close(os.open(str(path), os.O_CREAT | os.O_WRONLY, 0o600))
+    # The -wal/-shm sidecars hold recent pages (ciphertext and metadata);
+    # whatever SQLite derives their mode from, they are created owner-only
+    old_umask = os.umask(0o077)
+    try:
+        conn = sqlite3.connect(str(path), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+    finally:
+        os.umask(old_umask)
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.chmod(str(path) + suffix, 0o600)
+        except FileNotFoundError:
+            pass
+    return conn
+
+
+def _meta(conn: sqlite3.Connection) -> Dict[str, bytes]:
+    return {k: v for k, v in conn.execute("SELECT key, value FROM meta")}
+
+
+def _key_material(new: bool) -> Tuple[str, bytes]:
+    """("keyfile"|"passphrase", secret bytes) from config, env or a prompt."""
+    from .config import load_config
+    keyfile = load_config().vault_keyfile
+    if keyfile:
+        try:
+            data = Path(keyfile).expanduser().read_bytes()
+        except OSError as e:
+            raise VaultError(f"Cannot read vault keyfile {keyfile}: {e}") from e
+        if len(data) < 16:
+            raise VaultError(f"Vault keyfile {keyfile} is too short (need at least 16 bytes)")
+        return "keyfile", data
+    passphrase = os.environ.get("KK_VAULT_PASSPHRASE")
+    if passphrase is None and sys.stdin.isatty():
+        import getpass
+        passphrase = getpass.getpass("Vault passphrase: ")
+        if new and getpass.getpass("Repeat passphrase: ") != passphrase:
+            raise VaultError("Passphrases do not match")
+    if not passphrase:
+        raise VaultError("Vault key missing: set KK_VAULT_KEYFILE (or vault_keyfile) or KK_VAULT_PASSPHRASE")
+    return "passphrase", passphrase.encode()
+
+
+def _derive(kind: str, material: bytes, salt: bytes, params: dict) -> bytes:
+    if kind == "keyfile":
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"kk-vault").derive(material)
+    import hashlib
+    return hashlib.scrypt(material, salt=salt, n=params["n"], r=params["r"], p=params["p"],
+                          maxmem=256 * params["n"] * params["r"], dklen=32)
+
+
+def derive_key(meta: Dict[str, bytes], where: str) -> Tuple[bytes, Dict[str, bytes]]:
+    """Key for an encrypted kk file (the vault, snapshot repositories)
+    described by ``meta`` (kdf, kdf_params, salt, check).
+
+    Empty ``meta`` means a new file: a salt and a sealed check value are
+    made. Returns the key and the meta to store; raises VaultError for a
+    wrong key or the wrong kind of key."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    new = "check" not in meta
+    kind, material = _key_material(new)
+    if new:
+        salt = os.urandom(16)
+        params = dict(_SCRYPT)
+        key = _derive(kind, material, salt, params)
+        nonce = os.urandom(12)
+        return key, {
+            "kdf": kind.encode(),
+            "kdf_params": json.dumps(params).encode(),
+            "salt": salt,
+            "check": nonce + AESGCM(key).encrypt(nonce, _CHECK_PLAINTEXT, None),
+        }
+    stored_kind = bytes(meta.get("kdf", b"")).decode()
+    if stored_kind != kind:
+        raise VaultError(f"{where} was created with a {stored_kind}; provide that instead of a {kind}")
+    params = json.loads(bytes(meta["kdf_params"]).decode())
+    key = _derive(kind, material, bytes(meta["salt"]), params)
+    check = bytes(meta["check"])
+    try:
+        AESGCM(key).decrypt(check[:12], check[12:], None)
+    except Exception:
+        raise VaultError(f"Wrong key for {where}") from None
+    return key, meta
+
+
+def open_vault(namespace: str) -> Store:
+    path = vault_path()
+    conn = _connect(path)
+    key, meta = derive_key(_meta(conn), f"vault {path}")
+    if "version" not in meta:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("version", str(SCHEMA_VERSION).encode())] + list(meta.items()),
+            )
+    return Store(namespace, "vault", None, Vault(path, conn, key))
+
+
+# -- reads ---------------------------------------------------------------------
+
+def _path(rowid: int) -> str:
+    return f"{_PATH_PREFIX}{rowid}"
+
+
+def _rowids(paths: Iterable[str]) -> List[int]:
+    return [int(p[len(_PATH_PREFIX):]) for p in paths if p.startswith(_PATH_PREFIX)]
+
+
+def _where(store: Store, attrs: Optional[Dict[str, str]]) -> Tuple[str, list, Dict[str, str]]:
+    """SQL filter for the indexed columns; other attributes are matched in Python."""
+    query = {"kk_ns": store.namespace}
+    query.update(attrs or {})
+    clauses, params, rest = [], [], {}
+    for k, v in query.items():
+        col = _COLUMNS.get(k)
+        if col:
+            clauses.append(f"{col} = ?")
+            params.append(v)
+        else:
+            rest[k] = v
+    return " AND ".join(clauses), params, rest
+
+
+def snapshot(store: Store, attrs: Optional[Dict[str, str]] = None) -> List[ItemMeta]:
+    where, params, rest = _where(store, attrs)
+    metas = []
+    for rowid, label, raw in store.collection.conn.execute(f"SELECT id, label, attrs FROM items WHERE {where}", params):
+        a = json.loads(raw)
+        if all(a.get(k) == v for k, v in rest.items()):
+            metas.append(ItemMeta(_path(rowid), label, a))
+    return metas
+
+
+def search_paths(store: Store, attrs: Dict[str, str]) -> List[str]:
+    return [m.path for m in snapshot(store, {k: v for k, v in attrs.items() if k != "kk_ns"})]
+
+
+def _chunks(ids: List[int], size: int = 500) -> Iterable[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def metadata(store: Store, paths: List[str]) -> List[ItemMeta]:
+    metas = []
+    for chunk in _chunks(_rowids(paths)):
+        marks = ",".join("?" * len(chunk))
+        rows = store.collection.conn.execute(f"SELECT id, label, attrs FROM items WHERE id IN ({marks})", chunk)
+        metas.extend(ItemMeta(_path(rowid), label, json.loads(raw)) for rowid, label, raw in rows)
+    return metas
+
+
+def fetch_secrets(store: Store, paths: Iterable[str]) -> Dict[str, bytes]:
+    from . import trace
+    vault = store.collection
+    out: Dict[str, bytes] = {}
+    for chunk in _chunks(_rowids(paths)):
+        marks = ",".join("?" * len(chunk))
+        rows = vault.conn.execute(
+            f"SELECT id, ns, service, username, nonce, secret FROM items WHERE id IN ({marks})", chunk
+        )
+        for rowid, ns, service, username, nonce, sealed in rows:
+            plain = vault.open(ns, service, username, nonce, sealed)
+            trace.decrypted(len(plain))
+            out[_path(rowid)] = plain
+    return out
+
+
+# -- writes --------------------------------------------------------------------
+
+def _upsert(store: Store, label: str, attrs: Dict[str, str], secret: bytes) -> str:
+    vault = store.collection
+    ns, service, username = store.namespace, attrs["service"], attrs["username"]
+    nonce, sealed = vault.seal(ns, service, username, secret)
+    vault.conn.execute(
+        "INSERT INTO items (ns, service, username, env, label, attrs, nonce, secret) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (ns, service, username) DO UPDATE SET env = excluded.env, label = excluded.label, "
+        "attrs = excluded.attrs, nonce = excluded.nonce, secret = excluded.secret",
+        (ns, service, username, attrs.get("env", ""), label, json.dumps(attrs, sort_keys=True), nonce, sealed),
+    )
+    (rowid,) = vault.conn.execute(
+        "SELECT id FROM items WHERE ns = ? AND service = ? AND username = ?", (ns, service, username)
+    ).fetchone()
+    return _path(rowid)
+
+
+def apply_changes(store: Store, changes: List[Change]) -> List[Optional[Exception]]:
+    """Apply a plan in a single transaction; one result per change."""
+    conn = store.collection.conn
+    results: List[Optional[Exception]] = []
+    with conn:
+        for change in changes:
+            label = f"{change.service}/{change.username}"
+            try:
+                if change.action in ("create", "update"):
+                    a = dict(change.attrs)
+                    if change.existing is not None and "created_at" in change.existing.attrs:
+                        a["created_at"] = change.existing.attrs["created_at"]
+                    a.setdefault("created_at", _now_iso())
+                    a["updated_at"] = _now_iso()
+                    change.path = _upsert(store, label, a, change.secret.encode())
+                elif change.action == "delete":
+                    conn.execute("DELETE FROM items WHERE id = ?", _rowids([change.existing.path]))
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def delete_paths(store: Store, paths: List[str], progress=None) -> List[Optional[Exception]]:
+    conn = store.collection.conn
+    with conn:
+        for chunk in _chunks(_rowids(paths)):
+            conn.execute(f"DELETE FROM items WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+    if progress is not None:
+        progress(len(paths), len(paths))
+    return [None] * len(paths)
+
+
+def put(store: Store, service: str, username: str, secret: str, attrs: Dict[str, str]) -> None:
+    existing = snapshot(store, {"service": service, "username": username})
+    a = dict(attrs)
+    if existing and "created_at" in existing[0].attrs:
+        a["created_at"] = existing[0].attrs["created_at"]
+    a.setdefault("created_at", _now_iso())
+    a["updated_at"] = _now_iso()
+    with store.collection.conn:
+        _upsert(store, f"{service}/{username}", a, secret.encode())
+
+
+def delete(store: Store, service: str, username: str) -> bool:
+    with store.collection.conn:
+        cur = store.collection.conn.execute(
+            "DELETE FROM items WHERE ns = ? AND service = ? AND username = ?", (store.namespace, service, username)
+        )
+    return cur.rowcount > 0
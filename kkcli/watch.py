@@ -0,0 +1,249 @@
+"""Signal-driven sync for ``kk watch``.
+
+Subscribes to ``ItemCreated``/``ItemChanged``/``ItemDeleted`` on the
+store's collection and feeds each change of a namespace item to the sinks:
+an env file rewritten atomically, an NDJSON change log, or a hook command.
+
+The subscription is made first and the namespace read once after it
+(metadata from the snapshot/index, secrets only if an env file needs
+them), so a change landing during that read is queued, not missed. After that, each burst of signals
+costs one GetAll per changed path plus one GetSecrets for the batch, so
+the work follows the change rate rather than the namespace size. Deleted
+items are recognised from the path -> metadata map kept since the start,
+since a deleted item can no longer be read.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import storage
+from .fsutil import atomic_write
+from .storage import ItemMeta, Store
+
+_COLLECTION_IFACE = "org.freedesktop.Secret.Collection"
+_EVENTS = {"ItemCreated": "created", "ItemChanged": "changed", "ItemDeleted": "deleted"}
+
+
+@dataclass
+class Event:
+    kind: str  # "created", "changed" or "deleted"
+    meta: ItemMeta
+    secret: Optional[str] = None  # filled when a sink needs values
+
+
+class EnvFileSink:
+    """Keeps ``path`` equal to ``kk export --format env`` for the selection."""
+    needs_secrets = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values: Dict[Tuple[str, str], str] = {}
+
+    def start(self, items: Iterable[Tuple[ItemMeta, str]]) -> None:
+        for meta, secret in items:
+            self.values[_key(meta)] = secret
+        self._write()
+
+    def apply(self, events: Sequence[Event]) -> None:
+        changed = False
+        for ev in events:
+            key = _key(ev.meta)
+            if ev.kind == "deleted":
+                changed |= self.values.pop(key, None) is not None
+            elif ev.secret is not None and self.values.get(key) != ev.secret:
+                self.values[key] = ev.secret
+                changed = True
+        if changed:
+            self._write()
+
+    def _write(self) -> None:
+        current = None
+        with atomic_write(self.path) as f:
+            for (svc, usr), val in sorted(self.values.items(), key=lambda kv: (kv[0][0].lower(), kv[0][1].lower())):
+                if svc != current:
+                    if current is not None:
+                        f.write("\n")
+                    f.write(f"## service: {svc}\n")
+                    current = svc
+                f.write(f"{usr}={storage._env_quote(val)}\n")
+
+
+class LogSink:
+    """Appends one JSON object per change (no secret values) to ``path``."""
+    needs_secrets = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def start(self, items) -> None:
+        pass
+
+    def apply(self, events: Sequence[Event]) -> None:
+        ts = storage._now_iso()
+        with open(self.path, "a") as f:
+            for ev in events:
+                a = ev.meta.attrs
+                record = {
+                    "ts": ts,
+                    "event": ev.kind,
+                    "kk_ns": a.get("kk_ns"),
+                    "service": a.get("service"),
+                    "username": a.get("username"),
+                    "env": a.get("env"),
+                    "updated_at": a.get("updated_at"),
+                }
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+class HookSink:
+    """Runs a shell command per change with KK_EVENT, KK_NS, KK_SERVICE,
+    KK_USERNAME and KK_ENV set (the secret is not passed; use ``kk get``)."""
+    needs_secrets = False
+
+    def __init__(self, command: str):
+        self.command = command
+
+    def start(self, items) -> None:
+        pass
+
+    def apply(self, events: Sequence[Event]) -> None:
+        for ev in events:
+            a = ev.meta.attrs
+            env = dict(
+                os.environ,
+                KK_EVENT=ev.kind,
+                KK_NS=a.get("kk_ns", ""),
+                KK_SERVICE=a.get("service", ""),
+                KK_USERNAME=a.get("username", ""),
+                KK_ENV=a.get("env", ""),
+            )
+            rc = subprocess.call(self.command, shell=True, env=env)
+            if rc != 0:
+                print(f"Hook exited with {rc} for {ev.kind} {_label(ev.meta)}", file=sys.stderr)
+
+
+def _key(meta: ItemMeta) -> Tuple[str, str]:
+    return meta.attrs.get("service", ""), meta.attrs.get("username", "")
+
+
+def _label(meta: ItemMeta) -> str:
+    return "{}/{}".format(*_key(meta))
+
+
+class Watcher:
+    def __init__(self, store: Store, sinks: List, env: Optional[str] = None, debounce: float = 0.2):
+        if store.mode == "vault":
+            raise RuntimeError("kk watch needs the Secret Service; the vault store mode has no change signals")
+        self.store = store
+        self.sinks = sinks
+        self.env = env
+        self.debounce = debounce
+        self.known: Dict[str, ItemMeta] = {}  # item path -> metadata of selected items
+        self.needs_secrets = any(s.needs_secrets for s in sinks)
+        self._queue: Optional[deque] = None  # signal queue while subscribed()
+
+    def _selected(self, meta: ItemMeta) -> bool:
+        a = meta.attrs
+        return a.get("kk_ns") == self.store.namespace and (self.env is None or a.get("env") == self.env)
+
+    def start(self) -> int:
+        metas = storage.snapshot(self.store, {"env": self.env} if self.env else None)
+        self.known = {m.path: m for m in metas}
+        secrets = storage.fetch_secrets(self.store, list(self.known)) if self.needs_secrets else {}
+        items = [(m, secrets[m.path].decode(errors="ignore")) for m in metas if m.path in secrets]
+        for sink in self.sinks:
+            sink.start(items)
+        return len(metas)
+
+    def handle(self, signals: Sequence[Tuple[str, str]]) -> List[Event]:
+        """Turn a burst of (kind, path) signals into events and feed the sinks."""
+        latest: Dict[str, str] = {}
+        for kind, path in signals:
+            # created+changed collapse into one read; a later delete wins
+            latest[path] = "deleted" if kind == "deleted" else ("created" if latest.get(path) == "created" else kind)
+        events: List[Event] = []
+        gone = [p for p, k in latest.items() if k == "deleted"]
+        for path in gone:
+            meta = self.known.pop(path, None)
+            if meta is not None:
+                events.append(Event("deleted", meta))
+                storage._index_drop(self.store, path)
+        live = [p for p, k in latest.items() if k != "deleted"]
+        metas = storage.fetch_metadata(self.store, live) if live else []
+        updates = []
+        for meta in metas:
+            if self._selected(meta):
+                kind = "changed" if meta.path in self.known else "created"
+                self.known[meta.path] = meta
+                updates.append(Event(kind, meta))
+                storage._index_put(self.store, meta.path, meta.label, meta.attrs)
+            elif meta.path in self.known:
+                # moved out of the selection (env or namespace changed)
+                events.append(Event("deleted", self.known.pop(meta.path)))
+        if updates and self.needs_secrets:
+            secrets = storage.fetch_secrets(self.store, [ev.meta.path for ev in updates])
+            for ev in updates:
+                if ev.meta.path in secrets:
+                    ev.secret = secrets[ev.meta.path].decode(errors="ignore")
+        events.extend(updates)
+        if events:
+            for sink in self.sinks:
+                sink.apply(events)
+        if self.store.index is not None:
+            self.store.index.flush()
+        return events
+
+    @contextmanager
+    def subscribed(self) -> Iterator[None]:
+        """Receive the collection's signals from here on. Enter this before
+        ``start()``: changes made while the namespace is being read then wait
+        in the queue (jeepney files them there while awaiting other replies)
+        and are applied by ``run()`` instead of being lost."""
+        from jeepney.bus_messages import MatchRule, message_bus
+        conn = self.store.bus
+        rule = MatchRule(type="signal", interface=_COLLECTION_IFACE, path=storage.collection_path(self.store))
+        queue: deque = deque()
+        with conn.filter(rule, queue=queue, bufsize=1 << 20):
+            conn.send_and_get_reply(message_bus.AddMatch(rule))
+            self._queue = queue
+            try:
+                yield
+            finally:
+                self._queue = None
+
+    def run(self, on_events=None) -> None:
+        """Block forever, handling signals in debounced bursts; those that
+        queued up during ``start()`` form the first burst."""
+        if self._queue is None:
+            raise RuntimeError("Watcher.run() needs an active subscribed() block")
+        conn, queue = self.store.bus, self._queue
+        while True:
+            signals = [self._signal(conn.recv_until_filtered(queue))]
+            deadline = time.monotonic() + self.debounce
+            while True:
+                while queue:
+                    signals.append(self._signal(queue.popleft()))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    signals.append(self._signal(conn.recv_until_filtered(queue, timeout=remaining)))
+                except TimeoutError:
+                    break
+            events = self.handle([s for s in signals if s is not None])
+            if on_events is not None and events:
+                on_events(events)
+
+    @staticmethod
+    def _signal(msg) -> Optional[Tuple[str, str]]:
+        from jeepney.low_level import HeaderFields
+        kind = _EVENTS.get(msg.header.fields.get(HeaderFields.member, ""))
+        if kind is None or not msg.body:
+            return None
+        return kind, msg.body[0]